@@ -0,0 +1,466 @@
+"""
+Declarative artifact graph of the pipeline and a make-like scheduler.
+
+Every stage declares the data/ artifacts it reads and writes, so the
+stage order follows from the graph. build() runs only the stages a
+target needs, skips stages whose outputs are up to date, and runs stages
+that do not depend on each other concurrently (the XML chain, from TWB
+metadata to calculation rewriting, runs alongside Hyper profiling).
+
+A stage is up to date when its outputs exist unchanged and the hashes of
+its inputs and options match those recorded when it last ran (kept in
+data/.artifact_state.json). Files are only re-hashed when their mtime or
+size changed.
+
+Usage:
+    python artifact_graph.py Superstore.twbx Model.json
+    python artifact_graph.py Superstore.twbx inferred_powerbi_relationships.json --jobs 4
+    python artifact_graph.py Superstore.twbx --list
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+from build_cache import hash_bytes, hash_inputs
+from twbx_archive import WorkbookArchive
+from hyper_pool import borrow_pool
+from parsing_tableau import (
+    parse_twb_metadata, extract_all_hyper_schemas, export_tables, map_logical_to_physical,
+    RAW_DATA_DIR, EXPORT_FORMAT, HYPER_WORKERS, TWBX_PATH,
+)
+from classify_tableau_calculations import classify_calculations
+from rewrite_convertible_calculations import rewrite_calculations
+from calculation_graph import worksheet_references
+from infer_relationships_from_hyper import infer_relationships_from_extract
+from build_semantic_model import build_semantic_model
+from resolve_table_context import resolve_table_context, build_field_to_table, build_field_types
+from build_canonical_powerbi_model import build_canonical_model
+from eliminate_dead_fields import eliminate_dead_fields, DEAD_FIELD_MODES
+from finalize_powerbi_semantic_model import finalize_model
+from export_powerbi_tom import write_tom
+from model_ir import build_model_ir, write_ir, read_ir
+
+DATA_DIR = "data"
+STATE_FILE = ".artifact_state.json"
+
+#Source artifacts: the parts of the workbook, identified by their content hashes
+SOURCE_TWB = "@twb"
+SOURCE_HYPER = "@hyper"
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    run: Callable
+    #Build options the outputs depend on
+    options: Tuple[str, ...] = ()
+
+
+@dataclass
+class BuildContext:
+    archive: WorkbookArchive
+    data_dir: str
+    pool: object = None
+    profile_backend: str = "hyper"
+    unused_fields: str = "drop"
+    max_workers: int = HYPER_WORKERS
+    verbose: bool = True
+    built: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    seconds: Dict[str, float] = field(default_factory=dict)
+
+    def path(self, artifact):
+        return os.path.join(self.data_dir, artifact)
+
+    def load(self, artifact):
+        with open(self.path(artifact), encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, artifact, payload):
+        with open(self.path(artifact), "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=4)
+
+
+# ========== STAGES ==========
+def run_twb_metadata(ctx):
+    with ctx.archive.open_twb() as twb_file:
+        metadata = parse_twb_metadata(twb_file)
+    ctx.save("parsed_tableau_schema.json", metadata["schema"])
+    ctx.save("parsed_tableau_filters.json", metadata["filters"])
+    ctx.save("parsed_tableau_parameters.json", metadata["parameters"])
+    ctx.save("parsed_tableau_field_usage.json", metadata["field_usage"])
+    ctx.save("relationships_from_twb.json", metadata["twb_relationships"])
+
+
+def run_hyper_schema(ctx):
+    archive = ctx.archive
+    with borrow_pool(ctx.pool) as pool:
+        schema = extract_all_hyper_schemas(pool, archive.hyper_paths(), archive.hyper_dir())
+    ctx.save("parsed_hyper_schema.json", schema)
+
+
+def run_raw_data(ctx):
+    with borrow_pool(ctx.pool) as pool:
+        export_tables(
+            pool, ctx.load("parsed_hyper_schema.json"), ctx.path(RAW_DATA_DIR),
+            ctx.archive.hyper_dir(), EXPORT_FORMAT, ctx.max_workers
+        )
+
+
+def run_mapping(ctx):
+    mapping = map_logical_to_physical(ctx.load("parsed_tableau_schema.json"), ctx.load("parsed_hyper_schema.json"))
+    ctx.save("logical_physical_mapping.json", mapping)
+
+
+def run_semantic_model(ctx):
+    semantic_model = build_semantic_model(
+        ctx.load("parsed_hyper_schema.json"), ctx.load("parsed_tableau_schema.json"),
+        ctx.load("relationships_from_twb.json")
+    )
+    ctx.save("semantic_model.json", semantic_model)
+
+
+def _field_to_table(ctx):
+    return build_field_to_table(ctx.load("logical_physical_mapping.json"), ctx.load("semantic_model.json"))
+
+
+def run_classification(ctx):
+    classification = classify_calculations(ctx.load("parsed_tableau_schema.json"), None, _field_to_table(ctx))
+    ctx.save("calculation_classification.json", classification)
+
+
+def _used_fields(ctx):
+    return worksheet_references(
+        ctx.load("parsed_tableau_field_usage.json"), ctx.load("parsed_tableau_filters.json"),
+        ctx.load("parsed_tableau_parameters.json")
+    )
+
+
+def run_conversion(ctx):
+    conversion = rewrite_calculations(
+        ctx.load("calculation_classification.json"), _field_to_table(ctx),
+        used_fields=_used_fields(ctx) if ctx.unused_fields == "drop" else None, max_workers=ctx.max_workers,
+        field_types=build_field_types(ctx.load("parsed_tableau_schema.json"))
+    )
+    ctx.save("converted_dax_measures.json", conversion)
+
+
+def run_relationships(ctx):
+    raw_data_path = ctx.path(RAW_DATA_DIR) if ctx.profile_backend == "pandas" else None
+    hyper_dir = ctx.archive.hyper_dir() if ctx.profile_backend == "hyper" else None
+    relationship_data = infer_relationships_from_extract(
+        ctx.load("parsed_hyper_schema.json"), hyper_dir, raw_data_path, ctx.profile_backend,
+        ctx.max_workers, pool=ctx.pool
+    )
+    ctx.save("inferred_powerbi_relationships.json", relationship_data)
+
+
+def run_table_context(ctx):
+    context_model = resolve_table_context(
+        ctx.load("semantic_model.json"), ctx.load("logical_physical_mapping.json"), verbose=False
+    )
+    ctx.save("semantic_model_with_context.json", context_model)
+
+
+def run_canonical_model(ctx):
+    #Built and pruned of dead fields in one stage: the pass rewrites the file in place
+    context_model = ctx.load("semantic_model_with_context.json")
+    canonical_model = build_canonical_model(
+        ctx.load("parsed_hyper_schema.json"), context_model,
+        ctx.load("inferred_powerbi_relationships.json"), verbose=False
+    )
+    canonical_model = eliminate_dead_fields(
+        canonical_model, ctx.load("calculation_classification.json"), _used_fields(ctx),
+        ctx.load("logical_physical_mapping.json"), context_model["measure_table_map"],
+        mode=ctx.unused_fields, verbose=False
+    )
+    ctx.save("canonical_powerbi_model.json", canonical_model)
+
+
+def run_final_model(ctx):
+    final_model = finalize_model(
+        ctx.load("canonical_powerbi_model.json"), ctx.load("semantic_model_with_context.json"),
+        ctx.load("converted_dax_measures.json"), verbose=False
+    )
+    ctx.save("final_powerbi_semantic_model.json", final_model)
+    write_ir(ctx.path("final_powerbi_semantic_model.ir"), build_model_ir(final_model, ctx.load("parsed_hyper_schema.json")))
+
+
+def run_tom_export(ctx):
+    write_tom(
+        read_ir(ctx.path("final_powerbi_semantic_model.ir")),
+        [ctx.path("powerbi_tom_model.json")], [ctx.path("Model.json")], verbose=False
+    )
+
+
+def pipeline_graph(profile_backend="hyper"):
+    """
+    Stages of the pipeline. The pandas profiling backend adds the raw
+    extract export, which the hyper backend never needs.
+    """
+    relationship_inputs = (SOURCE_HYPER, "parsed_hyper_schema.json")
+    stages = [
+        Stage("twb_metadata", (SOURCE_TWB,), (
+            "parsed_tableau_schema.json", "parsed_tableau_filters.json", "parsed_tableau_parameters.json",
+            "parsed_tableau_field_usage.json", "relationships_from_twb.json",
+        ), run_twb_metadata),
+        Stage("hyper_schema", (SOURCE_HYPER,), ("parsed_hyper_schema.json",), run_hyper_schema),
+        Stage("logical_physical_mapping", ("parsed_tableau_schema.json", "parsed_hyper_schema.json"),
+              ("logical_physical_mapping.json",), run_mapping),
+        Stage("semantic_model", ("parsed_hyper_schema.json", "parsed_tableau_schema.json", "relationships_from_twb.json"),
+              ("semantic_model.json",), run_semantic_model),
+        Stage("classification", ("parsed_tableau_schema.json", "logical_physical_mapping.json", "semantic_model.json"),
+              ("calculation_classification.json",), run_classification),
+        Stage("conversion", (
+            "calculation_classification.json", "parsed_tableau_schema.json", "logical_physical_mapping.json", "semantic_model.json",
+            "parsed_tableau_field_usage.json", "parsed_tableau_filters.json", "parsed_tableau_parameters.json",
+        ), ("converted_dax_measures.json",), run_conversion, options=("unused_fields",)),
+        Stage("table_context", ("semantic_model.json", "logical_physical_mapping.json"),
+              ("semantic_model_with_context.json",), run_table_context),
+        Stage("canonical_model", (
+            "parsed_hyper_schema.json", "semantic_model_with_context.json", "inferred_powerbi_relationships.json",
+            "calculation_classification.json", "logical_physical_mapping.json",
+            "parsed_tableau_field_usage.json", "parsed_tableau_filters.json", "parsed_tableau_parameters.json",
+        ), ("canonical_powerbi_model.json",), run_canonical_model, options=("unused_fields",)),
+        Stage("final_model", (
+            "canonical_powerbi_model.json", "semantic_model_with_context.json", "converted_dax_measures.json",
+            "parsed_hyper_schema.json",
+        ), ("final_powerbi_semantic_model.json", "final_powerbi_semantic_model.ir"), run_final_model),
+        Stage("tom_export", ("final_powerbi_semantic_model.ir",), ("powerbi_tom_model.json", "Model.json"),
+              run_tom_export),
+    ]
+
+    if profile_backend == "pandas":
+        stages.append(Stage("raw_data", (SOURCE_HYPER, "parsed_hyper_schema.json"), (RAW_DATA_DIR,), run_raw_data))
+        relationship_inputs = ("parsed_hyper_schema.json", RAW_DATA_DIR)
+
+    stages.append(Stage("relationships", relationship_inputs, ("inferred_powerbi_relationships.json",),
+                        run_relationships, options=("profile_backend",)))
+    return stages
+
+
+# ========== PLANNING ==========
+def producers(graph):
+    """artifact -> Stage writing it"""
+    result = {}
+    for stage in graph:
+        for artifact in stage.outputs:
+            if artifact in result:
+                raise ValueError(f"{artifact} is written by both {result[artifact].name} and {stage.name}")
+            result[artifact] = stage
+    return result
+
+
+def plan(graph, targets):
+    """
+    Stages needed for targets, mapped to the needed stages they wait on.
+    Targets are artifact or stage names.
+    """
+    by_output = producers(graph)
+    by_name = {stage.name: stage for stage in graph}
+
+    pending = []
+    for target in targets:
+        stage = by_output.get(target) or by_name.get(target)
+        if stage is None:
+            raise KeyError(f"No stage produces {target!r}")
+        pending.append(stage)
+
+    needed = {}
+    while pending:
+        stage = pending.pop()
+        if stage.name in needed:
+            continue
+        upstream = {by_output[artifact] for artifact in stage.inputs if artifact in by_output}
+        needed[stage.name] = {dep.name for dep in upstream}
+        pending.extend(upstream)
+    return needed
+
+
+# ========== UP-TO-DATE CHECKS ==========
+class ArtifactState:
+    """
+    Hashes recorded for the data directory: per file its (mtime, size,
+    sha256), per stage the input, option and output hashes of its last run.
+    """
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, STATE_FILE)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        self.files = state.get("files", {})
+        self.stages = state.get("stages", {})
+
+    def _file_digest(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            known = self.files.get(path)
+        if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+
+        with open(path, "rb") as f:
+            digest = hash_bytes(f.read())
+        with self._lock:
+            self.files[path] = [stat.st_mtime_ns, stat.st_size, digest]
+        return digest
+
+    def digest(self, path):
+        """Content hash of a file or directory, None when it does not exist"""
+        if os.path.isdir(path):
+            return hash_inputs({
+                name: self._file_digest(os.path.join(path, name))
+                for name in sorted(os.listdir(path))
+                if os.path.isfile(os.path.join(path, name))
+            })
+        if os.path.exists(path):
+            return self._file_digest(path)
+        return None
+
+    def stamp(self, stage, ctx, sources):
+        return {
+            "inputs": {
+                artifact: sources[artifact]() if artifact in sources else self.digest(ctx.path(artifact))
+                for artifact in stage.inputs
+            },
+            "options": {option: getattr(ctx, option) for option in stage.options},
+        }
+
+    def outputs(self, stage, ctx):
+        return {artifact: self.digest(ctx.path(artifact)) for artifact in stage.outputs}
+
+    def up_to_date(self, stage, stamp, ctx):
+        with self._lock:
+            recorded = self.stages.get(stage.name)
+        if recorded is None or {k: recorded.get(k) for k in stamp} != stamp:
+            return False
+        outputs = self.outputs(stage, ctx)
+        return None not in outputs.values() and outputs == recorded.get("outputs")
+
+    def record(self, stage, stamp, ctx):
+        outputs = self.outputs(stage, ctx)
+        with self._lock:
+            self.stages[stage.name] = {**stamp, "outputs": outputs}
+            self.save()
+
+    def save(self):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files, "stages": self.stages}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def source_hashes(archive):
+    """Hash functions of the archive sources; the extracts are only hashed for stages reading them"""
+    return {SOURCE_TWB: lambda: archive.twb_hash, SOURCE_HYPER: lambda: hash_inputs(archive.hyper_hash)}
+
+
+# ========== SCHEDULER ==========
+def build(twbx_path, targets, data_dir=DATA_DIR, jobs=2, force=False,
+          extract_dir=None, pool=None, profile_backend="hyper", unused_fields="drop",
+          max_workers=HYPER_WORKERS, verbose=True, graph=None):
+    """
+    Bring targets (artifact file names or stage names) up to date in
+    data_dir and return the stage names {"built": [...], "skipped": [...]}
+    plus the wall time of each built stage ("seconds").
+
+    A stage starts as soon as every stage it reads from has finished, up to
+    jobs at a time. It is skipped when its recorded input, option and
+    output hashes still match; force rebuilds every needed stage. graph
+    replaces pipeline_graph(profile_backend), e.g. with instrumented stages.
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+
+    graph = graph or pipeline_graph(profile_backend)
+    by_name = {stage.name: stage for stage in graph}
+    needed = plan(graph, targets)
+
+    os.makedirs(data_dir, exist_ok=True)
+    state = ArtifactState(data_dir)
+
+    with WorkbookArchive(twbx_path, extract_dir) as archive, borrow_pool(pool) as pool:
+        ctx = BuildContext(archive, data_dir, pool, profile_backend, unused_fields, max_workers, verbose)
+        sources = source_hashes(archive)
+
+        def run(stage):
+            stamp = state.stamp(stage, ctx, sources)
+            if not force and state.up_to_date(stage, stamp, ctx):
+                ctx.skipped.append(stage.name)
+                log(f"[{stage.name}] up to date")
+                return
+            started = time.perf_counter()
+            stage.run(ctx)
+            state.record(stage, stamp, ctx)
+            ctx.built.append(stage.name)
+            ctx.seconds[stage.name] = time.perf_counter() - started
+            log(f"[{stage.name}] built in {ctx.seconds[stage.name]:.2f}s")
+
+        waiting = {name: set(deps) for name, deps in needed.items()}
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            while waiting or running:
+                for name in sorted(n for n, deps in waiting.items() if not deps):
+                    del waiting[name]
+                    running[executor.submit(run, by_name[name])] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    future.result()
+                    for deps in waiting.values():
+                        deps.discard(name)
+
+    return {"built": ctx.built, "skipped": ctx.skipped, "seconds": ctx.seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build pipeline artifacts on demand")
+    parser.add_argument("twbx_path", nargs="?", default=TWBX_PATH, help="Path to the .twbx workbook")
+    parser.add_argument("targets", nargs="*", default=["Model.json"],
+                        help="Artifacts or stages to build (default: Model.json)")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Artifact directory (default: data)")
+    parser.add_argument("--jobs", type=int, default=2, help="Stages run concurrently")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if up to date")
+    parser.add_argument("--extract-dir", default=None,
+                        help="Keep extracted hyper files here (default: temporary directory)")
+    parser.add_argument("--profile-backend", choices=["hyper", "pandas"], default="hyper",
+                        help="Run column profiling inside Hyper (default) or in pandas")
+    parser.add_argument("--unused-fields", choices=DEAD_FIELD_MODES, default="drop",
+                        help="Drop, annotate (hide) or keep fields no worksheet uses (default: drop)")
+    parser.add_argument("--workers", type=int, default=HYPER_WORKERS,
+                        help="Concurrent Hyper connections for export and profiling")
+    parser.add_argument("--list", action="store_true", help="Print the stages the targets need and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        graph = pipeline_graph(args.profile_backend)
+        needed = plan(graph, args.targets)
+        for stage in graph:
+            if stage.name in needed:
+                after = ", ".join(sorted(needed[stage.name])) or "-"
+                print(f"{stage.name}: {', '.join(stage.outputs)} (after: {after})")
+        return
+
+    started = time.perf_counter()
+    result = build(
+        args.twbx_path, args.targets, args.data_dir, args.jobs, args.force,
+        args.extract_dir, profile_backend=args.profile_backend, unused_fields=args.unused_fields,
+        max_workers=args.workers
+    )
+    print(f"\n{len(result['built'])} stage(s) built, {len(result['skipped'])} up to date "
+          f"in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
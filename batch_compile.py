@@ -0,0 +1,192 @@
+"""
+Batch driver: compile many Tableau workbooks across a process pool.
+
+Workbooks come from a folder (every *.twbx in it) or a manifest file
+listing one path per line. Each workbook gets its own output directory
+under --output-dir, holding its TOM model (and audit artifacts with
+--audit); hyper files are extracted to per-workbook temporary
+directories, so workers never share files. Every worker process keeps
+one HyperPool open, so Hyper starts once per worker and its connections
+are reused by every stage of every workbook the worker compiles.
+
+Usage:
+    python batch_compile.py workbooks/ --output-dir batch_output --workers 4
+    python batch_compile.py manifest.txt --audit
+"""
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
+
+from parsing_tableau import HYPER_WORKERS
+from hyper_pool import HyperPool
+from run_pipeline import compile_model, write_outputs, TRACE_DIR
+from tracing import Tracer
+from eliminate_dead_fields import DEAD_FIELD_MODES
+
+BATCH_OUTPUT_DIR = "batch_output"
+BATCH_REPORT = "batch_report.json"
+
+# Hyper pool owned by the current worker process
+_worker_pool = None
+
+
+def collect_workbooks(source):
+    """Workbook paths from a folder of .twbx files or a manifest file"""
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name)
+            for name in os.listdir(source)
+            if name.lower().endswith(".twbx")
+        )
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        if source.lower().endswith(".json"):
+            entries = json.load(f)
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    return [os.path.join(base_dir, entry) for entry in entries]
+
+
+def output_namespaces(workbooks):
+    """One output directory name per workbook, unique even when file names repeat"""
+    names = []
+    seen = {}
+    for path in workbooks:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        names.append(stem if seen[stem] == 1 else f"{stem}_{seen[stem]}")
+    return names
+
+
+def _close_worker_pool():
+    global _worker_pool
+    if _worker_pool is not None:
+        _worker_pool.close()
+        _worker_pool = None
+
+
+def _init_worker():
+    global _worker_pool
+    _worker_pool = HyperPool()
+    # Pool workers exit without running atexit hooks; multiprocessing
+    # finalizers do run
+    Finalize(None, _close_worker_pool, exitpriority=10)
+
+
+def _compile_one(twbx_path, output_dir, options, tmdl=False, trace=False):
+    started = time.perf_counter()
+    result = {"workbook": twbx_path, "output_dir": output_dir, "pid": os.getpid()}
+    tracer = Tracer()
+
+    try:
+        model_ir = compile_model(twbx_path, data_dir=output_dir, pool=_worker_pool, tracer=tracer, **options)
+        write_outputs(
+            model_ir, os.path.join(output_dir, "powerbi_tom_model.json"), options.get("audit", False),
+            output_dir, os.path.join(output_dir, "tmdl") if tmdl else None, tracer=tracer
+        )
+        result["status"] = "ok"
+        result["tables"] = len(model_ir.tables)
+    except Exception as exc:
+        result["status"] = "failed"
+        result["error"] = f"{type(exc).__name__}: {exc}"
+        result["traceback"] = traceback.format_exc()
+
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    #Where the time went, also for workbooks that failed part way
+    result["stages"] = {name: round(seconds, 3) for name, seconds in tracer.summary().items()}
+    if trace:
+        tracer.write(os.path.join(output_dir, TRACE_DIR))
+    result["hyper_pool"] = dict(_worker_pool.stats) if _worker_pool is not None else None
+    return result
+
+
+def compile_batch(workbooks, output_root=BATCH_OUTPUT_DIR, workers=None, tmdl=False, trace=False, **options):
+    """
+    Compile every workbook in a process pool and return the summary report.
+
+    options are passed on to run_pipeline.compile_model (audit,
+    profile_backend, max_workers, cache_dir, unused_fields). With tmdl,
+    each output directory also gets a tmdl/ folder, with trace a trace/
+    folder holding the workbook's stage spans. The report lists the
+    seconds spent in each stage of every workbook. A failing workbook is
+    recorded in the report and does not stop the batch.
+    """
+    started = time.perf_counter()
+    os.makedirs(output_root, exist_ok=True)
+
+    jobs = [
+        (path, os.path.join(output_root, name))
+        for path, name in zip(workbooks, output_namespaces(workbooks))
+    ]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(_compile_one, path, output_dir, options, tmdl, trace) for path, output_dir in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"[{len(results)}/{len(jobs)}] {result['status']:<6} {result['seconds']:>8.2f}s  {result['workbook']}")
+
+    order = {output_dir: i for i, (_, output_dir) in enumerate(jobs)}
+    results.sort(key=lambda r: order[r["output_dir"]])
+    failed = [r for r in results if r["status"] != "ok"]
+
+    return {
+        "workbooks": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "compile_seconds": round(sum(r["seconds"] for r in results), 3),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a folder or manifest of Tableau workbooks")
+    parser.add_argument("source", help="Folder of .twbx files, or a manifest (.txt: one path per line, .json: list)")
+    parser.add_argument("--output-dir", default=BATCH_OUTPUT_DIR,
+                        help="Root of the per-workbook output directories (default: batch_output)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--hyper-workers", type=int, default=HYPER_WORKERS,
+                        help="Concurrent Hyper connections per workbook")
+    parser.add_argument("--audit", action="store_true",
+                        help="Write every intermediate artifact to each workbook's output directory")
+    parser.add_argument("--profile-backend", choices=["hyper", "pandas"], default="hyper")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Build cache shared by all workers")
+    parser.add_argument("--unused-fields", choices=DEAD_FIELD_MODES, default="drop",
+                        help="Drop, annotate (hide) or keep fields no worksheet uses")
+    parser.add_argument("--tmdl", action="store_true",
+                        help="Also write each model as a TMDL folder (<output-dir>/<workbook>/tmdl)")
+    parser.add_argument("--trace", action="store_true",
+                        help="Write each workbook's stage spans to <output-dir>/<workbook>/trace")
+    args = parser.parse_args()
+
+    workbooks = collect_workbooks(args.source)
+    if not workbooks:
+        raise FileNotFoundError(f"No .twbx workbooks found in {args.source}")
+
+    report = compile_batch(
+        workbooks, args.output_dir, args.workers, tmdl=args.tmdl, trace=args.trace,
+        audit=args.audit, profile_backend=args.profile_backend,
+        max_workers=args.hyper_workers, cache_dir=args.cache_dir, unused_fields=args.unused_fields
+    )
+
+    report_path = os.path.join(args.output_dir, BATCH_REPORT)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+
+    print(f"\n{report['succeeded']}/{report['workbooks']} workbooks compiled "
+          f"in {report['wall_seconds']:.2f}s ({report['failed']} failed)")
+    print(f"Batch report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
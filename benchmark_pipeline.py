@@ -0,0 +1,247 @@
+"""
+Benchmark the pipeline stages on synthetic workbooks of increasing size.
+
+Every tier describes a synthetic workbook (synthetic_workbook.py), which
+is generated once and kept under --bench-dir. Each run compiles it
+through the artifact graph in a fresh process, one stage at a time, and
+records per stage the wall time, CPU time and the process peak RSS
+(plus how much the stage raised it). Hyper runs in its own process; its
+peak RSS is recorded per run. With --repeat, times are the fastest run
+and memory the highest.
+
+Results are written to benchmark_results/<label>.json (label: the git
+commit by default), so runs on two commits can be compared with
+--compare, which flags stages that got slower.
+
+Usage:
+    python benchmark_pipeline.py --tiers small medium
+    python benchmark_pipeline.py --tiers large --profile-backend pandas --repeat 3
+    python benchmark_pipeline.py --tiers small --compare benchmark_results/abc1234.json
+"""
+import argparse
+import dataclasses
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+from artifact_graph import build, pipeline_graph
+from build_cache import hash_inputs
+from synthetic_workbook import generate_workbook
+
+BENCH_DIR = "benchmarks"
+RESULTS_DIR = "benchmark_results"
+
+#Size tiers, as generate_workbook() arguments
+TIERS = {
+    "small": {"datasources": 1, "tables": 3, "rows": 10_000, "worksheets": 10,
+              "calculations": 20, "filters_per_worksheet": 1},
+    "medium": {"datasources": 2, "tables": 6, "rows": 200_000, "worksheets": 50,
+               "calculations": 200, "filters_per_worksheet": 2},
+    "large": {"datasources": 4, "tables": 10, "rows": 1_000_000, "worksheets": 200,
+              "calculations": 1000, "filters_per_worksheet": 3, "calculation_depth": 6},
+}
+
+#A stage counts as slower than the baseline past both thresholds
+REGRESSION_RATIO = 1.25
+REGRESSION_SECONDS = 0.05
+
+
+def _peak_rss_mb(who=None):
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    #kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _in_fresh_process(fn, *args):
+    """
+    fn(*args) in a newly spawned process. A process keeps the peak RSS of
+    whoever started it, so generation and runs never share one.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def _generate(path, params):
+    return generate_workbook(path, verbose=False, **params)
+
+
+def workbook_for_tier(tier, params, bench_dir=BENCH_DIR):
+    """Generate the tier's workbook, or reuse it when its parameters are unchanged"""
+    name = f"{tier}-{hash_inputs(params)[:10]}"
+    path = os.path.join(bench_dir, "workbooks", f"{name}.twbx")
+    summary_path = os.path.join(bench_dir, "workbooks", f"{name}.json")
+
+    if os.path.exists(path) and os.path.exists(summary_path):
+        with open(summary_path, encoding="utf-8") as f:
+            return path, json.load(f)
+
+    summary = _in_fresh_process(_generate, path, params)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=4)
+    return path, summary
+
+
+def _measured(stage, metrics):
+    """Stage whose run records its wall time, CPU time and peak RSS into metrics"""
+    def run(ctx):
+        rss_before = _peak_rss_mb()
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        stage.run(ctx)
+        rss_after = _peak_rss_mb()
+        metrics[stage.name] = {
+            "seconds": time.perf_counter() - started,
+            "cpu_seconds": time.process_time() - cpu_started,
+            "peak_rss_mb": rss_after,
+            "rss_growth_mb": None if rss_after is None else rss_after - rss_before,
+        }
+    return dataclasses.replace(stage, run=run)
+
+
+def run_once(twbx_path, profile_backend="hyper", unused_fields="drop"):
+    """One full compile of a workbook, stage by stage; meant for a fresh process"""
+    metrics = {}
+    graph = [_measured(stage, metrics) for stage in pipeline_graph(profile_backend)]
+    data_dir = tempfile.mkdtemp(prefix="bench_")
+    started = time.perf_counter()
+    try:
+        build(twbx_path, [stage.name for stage in graph], data_dir, jobs=1, force=True,
+              profile_backend=profile_backend, unused_fields=unused_fields, verbose=False, graph=graph)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    return {
+        "total_seconds": time.perf_counter() - started,
+        "peak_rss_mb": _peak_rss_mb(),
+        "hyper_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+        "stages": metrics,
+    }
+
+
+def benchmark_tier(twbx_path, repeat=1, profile_backend="hyper", unused_fields="drop"):
+    """Fastest time and highest memory over repeat runs, each in a new process"""
+    runs = [_in_fresh_process(run_once, twbx_path, profile_backend, unused_fields) for _ in range(repeat)]
+
+    def best(values, pick):
+        values = [v for v in values if v is not None]
+        return pick(values) if values else None
+
+    stages = {}
+    for name in runs[0]["stages"]:
+        samples = [run["stages"][name] for run in runs]
+        stages[name] = {
+            "seconds": min(s["seconds"] for s in samples),
+            "cpu_seconds": min(s["cpu_seconds"] for s in samples),
+            "peak_rss_mb": best([s["peak_rss_mb"] for s in samples], max),
+            "rss_growth_mb": best([s["rss_growth_mb"] for s in samples], max),
+        }
+
+    return {
+        "total_seconds": min(run["total_seconds"] for run in runs),
+        "peak_rss_mb": best([run["peak_rss_mb"] for run in runs], max),
+        "hyper_peak_rss_mb": best([run["hyper_peak_rss_mb"] for run in runs], max),
+        "stages": stages,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """(tier, stage, baseline seconds, seconds, ratio) for every stage slower than the baseline"""
+    regressions = []
+    for tier, result in results["tiers"].items():
+        base = baseline.get("tiers", {}).get(tier)
+        if base is None or base.get("params") != result["params"]:
+            continue
+        for stage, metrics in result["stages"].items():
+            before = base["stages"].get(stage, {}).get("seconds")
+            if before is None:
+                continue
+            after = metrics["seconds"]
+            ratio = after / before if before else float("inf")
+            print(f"  {tier:<8} {stage:<26} {before:8.3f}s -> {after:8.3f}s  x{ratio:.2f}")
+            if ratio > REGRESSION_RATIO and after - before > REGRESSION_SECONDS:
+                regressions.append((tier, stage, before, after, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic workbooks")
+    parser.add_argument("--tiers", nargs="+", choices=list(TIERS), default=["small", "medium"])
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per tier (fastest time is kept)")
+    parser.add_argument("--profile-backend", choices=["hyper", "pandas"], default="hyper")
+    parser.add_argument("--bench-dir", default=BENCH_DIR, help="Where generated workbooks are kept")
+    parser.add_argument("--label", default=None, help="Result name (default: current git commit)")
+    parser.add_argument("--compare", default=None, metavar="RESULTS",
+                        help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    label = args.label or commit or time.strftime("%Y%m%d-%H%M%S")
+    results = {
+        "label": label,
+        "commit": commit,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "profile_backend": args.profile_backend,
+        "tiers": {},
+    }
+
+    for tier in args.tiers:
+        params = TIERS[tier]
+        twbx_path, summary = workbook_for_tier(tier, params, args.bench_dir)
+        print(f"\n[{tier}] {summary['tables']} tables, {summary['rows']} rows, "
+              f"{summary['calculations']} calculations, {summary['worksheets']} worksheets")
+
+        result = benchmark_tier(twbx_path, args.repeat, args.profile_backend)
+        result["params"] = params
+        result["workbook"] = summary
+        results["tiers"][tier] = result
+
+        for stage, metrics in result["stages"].items():
+            rss = "" if metrics["peak_rss_mb"] is None else \
+                f"  peak {metrics['peak_rss_mb']:7.1f} MB (+{metrics['rss_growth_mb']:.1f})"
+            print(f"  {stage:<26} {metrics['seconds']:8.3f}s{rss}")
+        hyper = "" if result["hyper_peak_rss_mb"] is None else f"  (Hyper peak {result['hyper_peak_rss_mb']:.1f} MB)"
+        print(f"  {'total':<26} {result['total_seconds']:8.3f}s{hyper}")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, f"{label}.json")
+    with open(results_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+    print(f"\nBenchmark results written to {results_path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {baseline.get('label', args.compare)}:")
+        regressions = compare(results, baseline)
+        for tier, stage, before, after, ratio in regressions:
+            print(f"SLOWER: {tier} {stage} {before:.3f}s -> {after:.3f}s (x{ratio:.2f})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import zipfile
+from collections import defaultdict
+
+CACHE_DIR = ".build_cache"
+# Bump when a cached stage changes its output format or logic
+CACHE_VERSION = 5
+# Bytes read at a time when hashing archive members
+HASH_CHUNK = 1 << 20
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_stream(stream, chunk_size=HASH_CHUNK) -> str:
+    """SHA-256 of a binary file object, read chunk_size bytes at a time"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hash_bytes(text.encode("utf-8"))
+
+
+def hash_inputs(inputs) -> str:
+    return hash_text(json.dumps(inputs, sort_keys=True, default=str))
+
+
+def twb_fingerprint(twbx_path):
+    """SHA-256 of the TWB of a .twbx, read without extracting the archive"""
+    with zipfile.ZipFile(twbx_path) as z:
+        for info in z.infolist():
+            if info.filename.lower().endswith(".twb"):
+                return hash_bytes(z.read(info))
+    return None
+
+
+def hyper_fingerprint(twbx_path):
+    """
+    {member: key} of every hyper file of a .twbx: CRC-32 and size from the
+    zip directory plus a SHA-256 of the content, streamed from the
+    archive. This reads every extract in full, so callers only ask for it
+    when a Hyper step needs a cache key.
+    """
+    hyper = {}
+    with zipfile.ZipFile(twbx_path) as z:
+        for info in z.infolist():
+            if info.filename.lower().endswith(".hyper"):
+                with z.open(info) as member:
+                    hyper[info.filename] = f"{info.CRC:08x}-{info.file_size}-{hash_stream(member)}"
+    return hyper
+
+
+def workbook_fingerprint(twbx_path):
+    """Content hashes of the parts of a .twbx: {"twb": ..., "hyper": {member: ...}}"""
+    return {"twb": twb_fingerprint(twbx_path), "hyper": hyper_fingerprint(twbx_path)}
+
+
+class BuildCache:
+    """
+    Content-addressed store of stage outputs.
+
+    Every entry is keyed by the stage name and a hash of the inputs it
+    was derived from, and stores those inputs alongside the value, so a
+    stage is skipped whenever its inputs are unchanged. Writes are atomic,
+    so concurrent workers can share one cache directory.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    def key(self, stage, inputs):
+        return hash_inputs([CACHE_VERSION, stage, inputs])
+
+    def _entry_path(self, stage, key):
+        return os.path.join(self.cache_dir, stage, f"{key}.pkl")
+
+    def memo(self, stage, inputs, compute):
+        key = self.key(stage, inputs)
+        path = self._entry_path(stage, key)
+
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    entry = pickle.load(f)
+                self.stats[stage]["hits"] += 1
+                return entry["value"]
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+
+        value = compute()
+        self.stats[stage]["misses"] += 1
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump({"stage": stage, "inputs": inputs, "value": value}, f)
+        os.replace(tmp_path, path)
+
+        return value
+
+    def artifact_dir(self, stage, inputs):
+        """
+        Directory for file outputs derived from inputs.
+
+        Returns (path, hit); the directory is only considered built once
+        mark_built() has been called on it.
+        """
+        path = os.path.join(self.cache_dir, stage, self.key(stage, inputs))
+        hit = os.path.exists(os.path.join(path, ".built"))
+        self.stats[stage]["hits" if hit else "misses"] += 1
+        if not hit:
+            os.makedirs(path, exist_ok=True)
+        return path, hit
+
+    @staticmethod
+    def mark_built(path):
+        open(os.path.join(path, ".built"), "w").close()
+
+    def report(self):
+        return {stage: dict(counts) for stage, counts in self.stats.items()}
+
+
+def memo(cache, stage, inputs, compute):
+    """cache.memo() that simply computes when caching is disabled"""
+    if cache is None:
+        return compute()
+    return cache.memo(stage, inputs, compute)
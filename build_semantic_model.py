@@ -0,0 +1,135 @@
+import json
+from pathlib import Path
+from tableau_formula import parse_formula, Binary, Call, Field, FormulaSyntaxError
+
+DATA_DIR = Path("data")
+
+#Input files
+SCHEMA_FILE = DATA_DIR / "parsed_hyper_schema.json"
+TABLEAU_SCHEMA_FILE = DATA_DIR / "parsed_tableau_schema.json"
+TWB_RELATIONSHIPS_FILE = DATA_DIR / "relationships_from_twb.json"
+
+#Output file
+OUTPUT_FILE = DATA_DIR / "semantic_model.json"
+
+# Tableau aggregation → DAX aggregation
+AGGREGATIONS = {
+    "SUM": "SUM",
+    "AVG": "AVERAGE",
+    "MIN": "MIN",
+    "MAX": "MAX",
+    "COUNT": "COUNT",
+    "COUNTD": "DISTINCTCOUNT",
+}
+
+#Build the measure AST understood by resolve_table_context
+def _aggregated_field(node):
+    """{"agg", "field"} for AGG([Field]), None for anything else"""
+    if (
+        isinstance(node, Call)
+        and node.name in AGGREGATIONS
+        and len(node.args) == 1
+        and isinstance(node.args[0], Field)
+    ):
+        return {"agg": AGGREGATIONS[node.name], "field": node.args[0].name}
+    return None
+
+
+def parse_measure_ast(formula: str):
+    try:
+        ast = parse_formula(formula)
+    except FormulaSyntaxError as exc:
+        return {
+            "node": "unsupported",
+            "formula": formula,
+            "error": str(exc)
+        }
+
+    single = _aggregated_field(ast)
+    if single:
+        return {"node": "single", **single}
+
+    if isinstance(ast, Binary) and ast.op in "+-*/":
+        left = _aggregated_field(ast.left)
+        right = _aggregated_field(ast.right)
+        if left and right:
+            return {
+                "node": "binary",
+                "op": ast.op,
+                "left": left,
+                "right": right
+            }
+
+    #Anything else keeps its formula; table context comes from its field references
+    return {
+        "node": "raw",
+        "formula": formula
+    }
+
+
+def build_semantic_model(hyper_schema, datasources, twb_relationships=()):
+    #The widest table is treated as the fact table, the rest as dimensions
+    fact_table = max(hyper_schema, key=lambda t: len(t["columns"]))["table"] if hyper_schema else None
+
+    tables = {}
+    for entry in hyper_schema:
+        tables[entry["table"]] = {
+            "columns": [col["column_name"] for col in entry["columns"]],
+            "type": "fact" if entry["table"] == fact_table else "dimension"
+        }
+
+    #Only relationships with explicit join keys are carried over
+    relationships = [
+        {
+            "from_table": rel["from_table"],
+            "from_column": rel["from_column"],
+            "to_table": rel["to_table"],
+            "to_column": rel["to_column"],
+            "type": rel["mode"],
+            "confidence": "high"
+        }
+        for rel in twb_relationships
+        if rel.get("from_column") and rel.get("to_column")
+    ]
+
+    #First definition of a calculation wins (datasources repeat across worksheets)
+    measures = {}
+    for ds in datasources:
+        for calc in ds.get("calculations", []):
+            name = calc["field_name"]
+            if name in measures:
+                continue
+            measures[name] = {
+                "ast": parse_measure_ast(calc.get("formula", "")),
+                "source": "tableau"
+            }
+
+    return {
+        "tables": tables,
+        "relationships": relationships,
+        "measures": measures
+    }
+
+
+def main():
+    print("BUILDING SEMANTIC MODEL")
+
+    with open(SCHEMA_FILE, encoding="utf-8") as f:
+        hyper_schema = json.load(f)
+
+    with open(TABLEAU_SCHEMA_FILE, encoding="utf-8") as f:
+        datasources = json.load(f)
+
+    with open(TWB_RELATIONSHIPS_FILE, encoding="utf-8") as f:
+        twb_relationships = json.load(f)
+
+    semantic_model = build_semantic_model(hyper_schema, datasources, twb_relationships)
+
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(semantic_model, f, indent=4)
+
+    print(f"Semantic model written to {OUTPUT_FILE} - {len(semantic_model['measures'])} measures")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Dependency graph between calculated fields.
+
+A calculation depends on every other calculation its formula references
+by name ([Calculation_...] ids, parameters, renamed copies). The graph
+gives the order calculations are translated in, the cycles that can
+never be translated, and the calculations no worksheet reaches.
+"""
+from resolve_table_context import normalize_field_name, field_references as formula_references
+
+
+def build_calculation_graph(calculations):
+    """
+    {calculation: set of calculations it references}, keyed by normalized
+    name. calculations are {"calculation_name", "formula"} records; the
+    first definition of a name wins, as in the semantic model.
+    """
+    formulas = {}
+    for calc in calculations:
+        formulas.setdefault(normalize_field_name(calc["calculation_name"]), calc.get("formula") or "")
+
+    return {
+        name: {ref for ref in formula_references(formula) if ref in formulas}
+        for name, formula in formulas.items()
+    }
+
+
+def find_cycles(graph):
+    """Strongly connected components that form a cycle (Tarjan, iterative)"""
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    cycles = []
+    counter = 0
+
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(sorted(graph[root])))]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+
+        while work:
+            node, deps = work[-1]
+            for dep in deps:
+                if dep not in index:
+                    index[dep] = low[dep] = counter
+                    counter += 1
+                    stack.append(dep)
+                    on_stack.add(dep)
+                    work.append((dep, iter(sorted(graph[dep]))))
+                    break
+                if dep in on_stack:
+                    low[node] = min(low[node], index[dep])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in graph[node]:
+                        cycles.append(sorted(component))
+
+    return cycles
+
+
+def topological_levels(graph, nodes=None):
+    """
+    Calculations grouped into levels: every calculation only references
+    calculations of earlier levels, so the members of one level are
+    independent of each other. Calculations in or behind a cycle are left
+    out and returned separately as (levels, blocked).
+    """
+    nodes = set(graph if nodes is None else nodes)
+    pending = {node: len(graph[node] & nodes) for node in nodes}
+    dependents = {node: [] for node in nodes}
+    for node in nodes:
+        for dep in graph[node] & nodes:
+            dependents[dep].append(node)
+
+    levels = []
+    ready = sorted(node for node, count in pending.items() if count == 0)
+    while ready:
+        levels.append(ready)
+        following = []
+        for node in ready:
+            for dependent in dependents[node]:
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    following.append(dependent)
+        ready = sorted(following)
+
+    placed = {node for level in levels for node in level}
+    return levels, sorted(nodes - placed)
+
+
+def worksheet_references(field_usage, filters=(), parameters=()):
+    """Every field reference and calculation formula used by a worksheet, filter or parameter"""
+    references = [
+        entry
+        for ws in field_usage
+        for entry in ws.get("used_fields_or_calculations", [])
+    ]
+    references += [flt.get("column") or flt["field"] for flt in filters if flt.get("column") or flt.get("field")]
+    references += [param["parameter_name"] for param in parameters if param.get("parameter_name")]
+    return references
+
+
+def used_field_names(references):
+    """Normalized field names behind worksheet references"""
+    return {name for reference in references for name in formula_references(reference)}
+
+
+def live_calculations(graph, calculations, references):
+    """
+    Calculations reachable from worksheet references: those named by a
+    worksheet or whose formula a worksheet embeds, plus everything they
+    reference, transitively.
+    """
+    used_formulas = {reference.strip() for reference in references}
+    live = {name for name in used_field_names(references) if name in graph}
+    live |= {
+        normalize_field_name(calc["calculation_name"])
+        for calc in calculations
+        if (calc.get("formula") or "").strip() in used_formulas
+    }
+
+    stack = list(live)
+    while stack:
+        for dep in graph[stack.pop()]:
+            if dep not in live:
+                live.add(dep)
+                stack.append(dep)
+    return live
@@ -1,46 +1,97 @@
 import json
-import re
 from pathlib import Path
+from tableau_formula import parse_formula, walk, Call, Field, Lod, FormulaSyntaxError
+from resolve_table_context import build_field_types
 
 DATA_DIR = Path("data")
 
 INPUT_SCHEMA = DATA_DIR / "parsed_tableau_schema.json"
 OUTPUT_FILE = DATA_DIR / "calculation_classification.json"
-print("CLASSIFYING TABLEAU CALCULATIONS")
 
-with open(INPUT_SCHEMA, encoding="utf-8") as f:
-    datasources= json.load(f)
 
-classified = []
+# Functions evaluated over the table of marks rather than the data
+TABLE_CALC_FUNCTIONS = {
+    "LOOKUP", "PREVIOUS_VALUE", "INDEX", "FIRST", "LAST", "SIZE", "TOTAL",
+    "RANK", "RANK_DENSE", "RANK_MODIFIED", "RANK_PERCENTILE", "RANK_UNIQUE",
+    "RUNNING_SUM", "RUNNING_AVG", "RUNNING_MIN", "RUNNING_MAX", "RUNNING_COUNT",
+}
+AGGREGATE_FUNCTIONS = {"SUM", "AVG", "MIN", "MAX", "COUNT", "COUNTD"}
+
+
+def _is_aggregate(node):
+    # MIN/MAX with two arguments compare values, they do not aggregate
+    return isinstance(node, Call) and node.name in AGGREGATE_FUNCTIONS and len(node.args) == 1
+
+
+def classify_ast(ast):
+    nodes = list(walk(ast))
 
-def classify_formula(formula: str):
-    f = formula.lower()
     #Tableau specific constructs
-    if "fixed" in f or "include" in f or "exclude" in f:
+    if any(isinstance(n, Lod) for n in nodes):
         return "lod_expression", "requires semantic rewrite"
 
-    if "lookup" in f or "window_" in f:
+    if any(isinstance(n, Call) and (n.name in TABLE_CALC_FUNCTIONS or n.name.startswith("WINDOW_")) for n in nodes):
         return "table_calculation", "not directly supported in DAX"
 
-    if "parameter" in f:
+    if any(isinstance(n, Field) and n.datasource == "Parameters" for n in nodes):
         return "parameter_driven", "requires model redesign"
 
-    if re.search(r"\b(sum|avg|min|max|count)\b", f):
+    if any(_is_aggregate(n) for n in nodes):
         return "simple_aggregation", "directly convertible"
 
     return "unknown", "manual review required"
 
-for ds in datasources:
-    for calc in ds.get("calculations", []):
-        formula = calc.get("formula", "")
-        calc_type, note = classify_formula(formula)
-
-        classified.append({
-            "calculation_name": calc["field_name"],
-            "formula": formula,
-            "classification": calc_type,
-            "note": note
-        })
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(classified, f, indent=4)
-print(f"Classification complete - results saved to {OUTPUT_FILE}")
\ No newline at end of file
+
+def classify_formula(formula: str):
+    try:
+        ast = parse_formula(formula)
+    except FormulaSyntaxError:
+        return "unknown", "manual review required"
+    return classify_ast(ast)
+
+
+def classify_calculations(datasources, formula_cache=None, field_to_table=None):
+    """
+    Classify every calculation of every datasource.
+
+    With a FormulaCache, formulas seen before (in any workbook) are looked
+    up instead of parsed; field_to_table (and the field types of the
+    schema) select the cache context so the entry can be reused when the
+    calculations are rewritten.
+    """
+    classified = []
+    field_types = build_field_types(datasources)
+
+    for ds in datasources:
+        for calc in ds.get("calculations", []):
+            formula = calc.get("formula", "")
+            if formula_cache is not None:
+                calc_type, note = formula_cache.compile(formula, field_to_table, field_types)[:2]
+            else:
+                calc_type, note = classify_formula(formula)
+
+            classified.append({
+                "calculation_name": calc["field_name"],
+                "formula": formula,
+                "classification": calc_type,
+                "note": note
+            })
+
+    return classified
+
+
+def main():
+    print("CLASSIFYING TABLEAU CALCULATIONS")
+
+    with open(INPUT_SCHEMA, encoding="utf-8") as f:
+        datasources = json.load(f)
+
+    classified = classify_calculations(datasources)
+
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(classified, f, indent=4)
+    print(f"Classification complete - results saved to {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+# Columns with more distinct values than this are only sketched
+SKETCH_THRESHOLD = 1_000_000
+# Number of minimum hash values kept per sketched column (KMV / bottom-k)
+SKETCH_SIZE = 4096
+# Sketch estimates this far below the coverage threshold are rejected
+# without an exact check
+SKETCH_MARGIN = 0.05
+
+
+def hash_values(values):
+    """64-bit hashes of the distinct non-null values, sorted"""
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+    series = series.dropna()
+    if series.empty:
+        return np.empty(0, dtype=np.uint64)
+    return np.unique(pd.util.hash_pandas_object(series, index=False).to_numpy())
+
+
+def _bottom_k(hashes, k):
+    if len(hashes) <= k:
+        return hashes
+    return np.sort(np.partition(hashes, k - 1)[:k])
+
+
+class _ColumnEntry:
+    __slots__ = ("hashes", "sketch", "distinct_count")
+
+    def __init__(self, hashes, sketch, distinct_count):
+        self.hashes = hashes
+        self.sketch = sketch
+        self.distinct_count = distinct_count
+
+
+class ColumnValueIndex:
+    """
+    Cached per-column value structures for FK coverage checks.
+
+    Each column is hashed once. Columns up to sketch_threshold distinct
+    values keep their full sorted hash set, so coverage between two of
+    them is an exact vectorised lookup. Larger columns keep only a
+    bottom-k (KMV) sketch; their coverage is estimated from the sketches
+    and only pairs that could pass the threshold are verified exactly.
+
+    load_values(table, column) returns an iterable of value chunks (any
+    array-like) for a column. verify(fact_table, fk_col, dim_table, pk_col)
+    returns exact coverage for sketched pairs; by default the full hash
+    sets are rebuilt on demand for that one pair.
+    """
+
+    def __init__(self, column_stats, load_values, threshold, verify=None,
+                 sketch_threshold=SKETCH_THRESHOLD, sketch_size=SKETCH_SIZE):
+        self.column_stats = column_stats
+        self.load_values = load_values
+        self.threshold = threshold
+        self.verify = verify or self._exact_coverage
+        self.sketch_threshold = sketch_threshold
+        self.sketch_size = sketch_size
+        self._entries = {}
+        self.stats = {"columns_hashed": 0, "columns_sketched": 0, "exact_checks": 0, "sketch_rejections": 0}
+
+    def _full_hashes(self, table, column):
+        chunks = [hash_values(chunk) for chunk in self.load_values(table, column)]
+        if not chunks:
+            return np.empty(0, dtype=np.uint64)
+        return np.unique(np.concatenate(chunks))
+
+    def _sketch(self, table, column):
+        sketch = np.empty(0, dtype=np.uint64)
+        for chunk in self.load_values(table, column):
+            merged = np.union1d(sketch, hash_values(chunk))
+            sketch = _bottom_k(merged, self.sketch_size)
+        return sketch
+
+    def entry(self, table, column):
+        key = (table, column)
+        if key not in self._entries:
+            distinct_count = self.column_stats[table][column]["distinct_count"]
+            if distinct_count > self.sketch_threshold:
+                entry = _ColumnEntry(None, self._sketch(table, column), distinct_count)
+                self.stats["columns_sketched"] += 1
+            else:
+                hashes = self._full_hashes(table, column)
+                entry = _ColumnEntry(hashes, _bottom_k(hashes, self.sketch_size), len(hashes))
+                self.stats["columns_hashed"] += 1
+            self._entries[key] = entry
+        return self._entries[key]
+
+    def _exact_coverage(self, fact_table, fk_col, dim_table, pk_col):
+        fk_hashes = self._full_hashes(fact_table, fk_col)
+        pk_hashes = self._full_hashes(dim_table, pk_col)
+        return _containment(fk_hashes, pk_hashes)
+
+    def estimate(self, fk, pk):
+        """KMV estimate of |FK ∩ PK| / |FK| from the two sketches"""
+        if fk.distinct_count == 0:
+            return 0.0
+
+        union = _bottom_k(np.union1d(fk.sketch, pk.sketch), self.sketch_size)
+        if len(union) == 0:
+            return 0.0
+        in_both = np.isin(union, fk.sketch, assume_unique=True) & np.isin(union, pk.sketch, assume_unique=True)
+        jaccard = in_both.sum() / len(union)
+
+        estimate = jaccard * (fk.distinct_count + pk.distinct_count) / ((1 + jaccard) * fk.distinct_count)
+        return min(float(estimate), 1.0)
+
+    def coverage(self, fact_table, fk_col, dim_table, pk_col):
+        fk = self.entry(fact_table, fk_col)
+        pk = self.entry(dim_table, pk_col)
+
+        if fk.hashes is not None and pk.hashes is not None:
+            return _containment(fk.hashes, pk.hashes)
+
+        estimate = self.estimate(fk, pk)
+        if estimate < self.threshold - SKETCH_MARGIN:
+            self.stats["sketch_rejections"] += 1
+            return estimate
+
+        self.stats["exact_checks"] += 1
+        return self.verify(fact_table, fk_col, dim_table, pk_col)
+
+    __call__ = coverage
+
+
+def _containment(fk_hashes, pk_hashes):
+    if len(fk_hashes) == 0:
+        return 0.0
+    return float(np.isin(fk_hashes, pk_hashes, assume_unique=True).sum()) / len(fk_hashes)
@@ -0,0 +1,170 @@
+import json
+from pathlib import Path
+
+from calculation_graph import (
+    build_calculation_graph, live_calculations, used_field_names, formula_references, worksheet_references
+)
+from resolve_table_context import normalize_field_name
+
+DATA_DIR = Path("data")
+
+#Input files
+CANONICAL_MODEL_FILE = DATA_DIR / "canonical_powerbi_model.json"
+CLASSIFICATION_FILE = DATA_DIR / "calculation_classification.json"
+FIELD_USAGE_FILE = DATA_DIR / "parsed_tableau_field_usage.json"
+FILTERS_FILE = DATA_DIR / "parsed_tableau_filters.json"
+PARAMETERS_FILE = DATA_DIR / "parsed_tableau_parameters.json"
+MAPPING_FILE = DATA_DIR / "logical_physical_mapping.json"
+SEMANTIC_CONTEXT_FILE = DATA_DIR / "semantic_model_with_context.json"
+
+#The pass rewrites the canonical model in place
+OUTPUT_FILE = CANONICAL_MODEL_FILE
+
+#"drop" removes unused objects, "annotate" only lists them (TOM export hides the columns)
+DEAD_FIELD_MODES = ("drop", "annotate", "keep")
+RELATIONSHIP_KEYS = ("from_table", "from_column", "to_table", "to_column")
+
+
+def build_column_index(tables, mappings):
+    """Normalized field name -> [(table, column)] for every canonical column"""
+    index = {}
+    for table_name, table in tables.items():
+        for column in table["columns"]:
+            index.setdefault(normalize_field_name(column), []).append((table_name, column))
+
+    #Logical names that differ from the physical column
+    for m in mappings:
+        if m["table"] in tables and m["physical_column"] in tables[m["table"]]["columns"]:
+            entry = (m["table"], m["physical_column"])
+            targets = index.setdefault(normalize_field_name(m["logical_field"]), [])
+            if entry not in targets:
+                targets.append(entry)
+    return index
+
+
+def find_dead_fields(model, calculations, references, mappings, measure_table_map=None):
+    """
+    Columns, tables, measures and relationships of the canonical model that
+    no worksheet, filter or parameter reaches.
+
+    Roots are the worksheet references; calculations they reach (directly
+    or through other calculations) keep every field their formulas use.
+    Relationships are kept between tables that are otherwise used, and
+    keep their key columns. A table hosting a live measure but no used
+    column keeps all its columns, a table cannot be empty.
+    """
+    graph = build_calculation_graph(calculations)
+    live = live_calculations(graph, calculations, references)
+
+    used_names = used_field_names(references)
+    for calc in calculations:
+        if normalize_field_name(calc["calculation_name"]) in live:
+            used_names.update(formula_references(calc.get("formula") or ""))
+
+    tables = model["tables"]
+    index = build_column_index(tables, mappings)
+    used_columns = {table_name: set() for table_name in tables}
+    for name in used_names:
+        for table_name, column in index.get(name, ()):
+            used_columns[table_name].add(column)
+
+    measure_tables = {
+        table for name, table in (measure_table_map or {}).items()
+        if normalize_field_name(name) in live
+    }
+    field_tables = {t for t, columns in used_columns.items() if columns}
+    live_tables = field_tables | (measure_tables & set(tables))
+
+    dead_relationships = []
+    for rel in model.get("relationships", []):
+        if rel["from_table"] in live_tables and rel["to_table"] in live_tables:
+            used_columns[rel["from_table"]].add(rel["from_column"])
+            used_columns[rel["to_table"]].add(rel["to_column"])
+        else:
+            dead_relationships.append({key: rel[key] for key in RELATIONSHIP_KEYS})
+
+    dead_columns = {}
+    for table_name, table in tables.items():
+        if table_name not in field_tables:
+            continue
+        unused = [col for col in table["columns"] if col not in used_columns[table_name]]
+        if unused:
+            dead_columns[table_name] = unused
+
+    return {
+        "tables": sorted(set(tables) - live_tables),
+        "columns": dead_columns,
+        "measures": [name for name in model.get("measures", {}) if normalize_field_name(name) not in live],
+        "relationships": dead_relationships,
+    }
+
+
+def eliminate_dead_fields(model, calculations, references, mappings,
+                          measure_table_map=None, mode="drop", verbose=True):
+    """
+    Drop (mode="drop") or list (mode="annotate") the parts of the canonical
+    model no worksheet uses. The findings are recorded under "dead_fields"
+    either way; mode="keep" leaves the model untouched.
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+
+    if mode == "keep":
+        return model
+    if mode not in DEAD_FIELD_MODES:
+        raise ValueError(f"Unknown dead field mode {mode!r}, expected one of {DEAD_FIELD_MODES}")
+
+    dead = find_dead_fields(model, calculations, references, mappings, measure_table_map)
+    column_count = sum(len(columns) for columns in dead["columns"].values())
+    log(f"Unused: {len(dead['tables'])} tables, {column_count} columns, "
+        f"{len(dead['measures'])} measures, {len(dead['relationships'])} relationships")
+
+    if mode == "drop":
+        for table_name in dead["tables"]:
+            del model["tables"][table_name]
+        for table_name, columns in dead["columns"].items():
+            unused = set(columns)
+            table = model["tables"][table_name]
+            table["columns"] = [col for col in table["columns"] if col not in unused]
+        for name in dead["measures"]:
+            del model["measures"][name]
+        dropped = [tuple(rel.values()) for rel in dead["relationships"]]
+        model["relationships"] = [
+            rel for rel in model.get("relationships", [])
+            if tuple(rel[key] for key in RELATIONSHIP_KEYS) not in dropped
+        ]
+        log("Unused objects dropped from the canonical model")
+
+    model["dead_fields"] = {"mode": mode, **dead}
+    return model
+
+
+def main():
+    print("ELIMINATING UNUSED FIELDS FROM THE CANONICAL MODEL")
+
+    #Loading the required inputs
+    with open(CANONICAL_MODEL_FILE, encoding="utf-8") as f:
+        model = json.load(f)
+    with open(CLASSIFICATION_FILE, encoding="utf-8") as f:
+        calculations = json.load(f)
+    with open(FIELD_USAGE_FILE, encoding="utf-8") as f:
+        field_usage = json.load(f)
+    with open(FILTERS_FILE, encoding="utf-8") as f:
+        filters = json.load(f)
+    with open(PARAMETERS_FILE, encoding="utf-8") as f:
+        parameters = json.load(f)
+    with open(MAPPING_FILE, encoding="utf-8") as f:
+        mappings = json.load(f)
+    with open(SEMANTIC_CONTEXT_FILE, encoding="utf-8") as f:
+        measure_table_map = json.load(f).get("measure_table_map", {})
+
+    references = worksheet_references(field_usage, filters, parameters)
+    model = eliminate_dead_fields(model, calculations, references, mappings, measure_table_map)
+
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(model, f, indent=4)
+
+    print(f"\nCanonical Power BI model written to: {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,118 +1,217 @@
 import json
+import os
 from pathlib import Path
+from typing import Any, Dict
+
+from model_ir import SemanticModel, Table, Relationship, build_model_ir, build_type_lookup, read_ir
+from export_tmdl import TmdlWriter
 
 DATA_DIR = Path("data")
 
 SEMANTIC_MODEL = DATA_DIR / "final_powerbi_semantic_model.json"
+SEMANTIC_MODEL_IR = DATA_DIR / "final_powerbi_semantic_model.ir"
 HYPER_SCHEMA = DATA_DIR / "parsed_hyper_schema.json"
 OUTPUT_TOM = DATA_DIR / "powerbi_tom_model.json"
+OUTPUT_MODEL_JSON = DATA_DIR / "Model.json"
+
+# The TOM export is a plain JSON-compatible dict (BIM layout)
+TomModel = Dict[str, Any]
+
+
+TOM_NAME = "Tableau_Migrated_Model"
+COMPATIBILITY_LEVEL = 1567
+MIGRATION_NOTE = "Generated via semantic-preserving Tableau → Power BI pipeline"
+
+
+def tom_table(table: Table):
+    columns = []
+    for col in table.columns:
+        tom_column = {
+            "name": col.name,
+            "dataType": col.data_type,
+            "sourceColumn": col.source_column
+        }
+        #Columns the dead field pass kept in annotate mode
+        if col.hidden:
+            tom_column["isHidden"] = True
+        columns.append(tom_column)
+
+    return {
+        "name": table.name,
+        "columns": columns,
+        "measures": [
+            {
+                "name": measure.name,
+                "expression": measure.expression,
+                "formatString": measure.format_string
+            }
+            for measure in table.measures
+        ]
+    }
 
-print("EXPORTING POWER BI TABULAR OBJECT MODEL (TOM)")
-
-#LOading final semantic model
-with open(SEMANTIC_MODEL, encoding="utf-8") as f:
-    semantic_model = json.load(f)
-
-with open(HYPER_SCHEMA, encoding="utf-8") as f:
-    hyper_schema = json.load(f)
-
-#Build the type lookup from hyper
-type_lookup = {}
-for table in hyper_schema:
-    tname = table["table"]
-    for col in table["columns"]:
-        raw = col["data_type"].lower()
-        if "int" in raw:
-            dtype = "int64"
-        elif "double" in raw or "float" in raw or "numeric" in raw:
-            dtype = "double"
-        elif "date" in raw or "time" in raw:
-            dtype = "dateTime"
-        else:
-            dtype = "string"
-        type_lookup[(tname, col["column_name"])] = dtype
-
-#Building TOM structure
-tom_model = {
-    "name": "Tableau_Migrated_Model",
-    "compatibilityLevel": 1567,
-    "model": {
-        "tables": [],
-        "relationships": [],
-        "annotations": []
+
+def tom_relationship(rel: Relationship):
+    return {
+        "fromTable": rel.from_table,
+        "fromColumn": rel.from_column,
+        "toTable": rel.to_table,
+        "toColumn": rel.to_column,
+        "cardinality": rel.cardinality,
+        "crossFilteringBehavior": rel.cross_filter_direction
     }
-}
-
-#Create the tebles and the columns
-for table_name, table_info in semantic_model["tables"].items():
-    tom_table = {
-        "name": table_name,
-        "columns": [],
-        "measures": []
+
+
+def tom_annotations(model: SemanticModel):
+    for measure in model.unplaced_measures:
+        yield {
+            "name": f"UnplacedMeasure::{measure.name}",
+            "value": "No reliable table context"
+        }
+    yield {"name": "MigrationNote", "value": MIGRATION_NOTE}
+
+
+def tom_from_ir(model: SemanticModel, verbose=True) -> TomModel:
+    """The whole TOM document as a dict (see write_tom for the streaming export)"""
+    log = print if verbose else (lambda *args, **kwargs: None)
+
+    tom_model = {
+        "name": TOM_NAME,
+        "compatibilityLevel": COMPATIBILITY_LEVEL,
+        "model": {
+            "tables": [tom_table(table) for table in model.tables],
+            "relationships": [tom_relationship(rel) for rel in model.relationships],
+            "annotations": list(tom_annotations(model))
+        }
     }
 
-    for col in table_info["columns"]:
-        tom_table["columns"].append({
-            "name": col,
-            "dataType": type_lookup.get((table_name, col), "string"),
-            "sourceColumn": col
-        })
+    log(f"Tables exported: {len(tom_model['model']['tables'])}")
+    log(f"Measures exported: {sum(len(t['measures']) for t in tom_model['model']['tables'])}")
+    log(f"Relationships exported: {len(tom_model['model']['relationships'])}")
 
-    tom_model["model"]["tables"].append(tom_table)
+    return tom_model
 
-print(f"Tables exported: {len(tom_model['model']['tables'])}")
 
-#create measures
-# Build table lookup
-table_map = {
-    table["name"]: table
-    for table in tom_model["model"]["tables"]
-}
+# ========== STREAMING EXPORT ==========
+class _JsonSink:
+    """One output file, laid out exactly as json.dump(..., indent=indent) would"""
 
-# semantic_model["measure_table_map"] must exist
-measure_table_map = semantic_model.get("measure_table_map", {})
+    def __init__(self, f, indent):
+        self.f = f
+        self.indent = indent
 
-for measure_name, dax_expr in semantic_model["measures"].items():
+    def pad(self, level):
+        return " " * (self.indent * level)
 
-    target_table = measure_table_map.get(measure_name)
+    def dumps(self, value, level):
+        return json.dumps(value, indent=self.indent).replace("\n", "\n" + self.pad(level))
 
-    if not target_table or target_table not in table_map:
-        tom_model["model"]["annotations"].append({
-            "name": f"UnplacedMeasure::{measure_name}",
-            "value": "No reliable table context"
-        })
-        continue
-
-    table = table_map[target_table]
-
-    table["measures"].append({
-        "name": measure_name,
-        "expression": dax_expr,
-        "formatString": "General"
-    })
-
-print(f"Measures exported: {sum(len(t['measures']) for t in tom_model['model']['tables'])}")
-
-#Create relationships
-for rel in semantic_model.get("relationships", []):
-    tom_model["model"]["relationships"].append({
-        "fromTable": rel["from_table"],
-        "fromColumn": rel["from_column"],
-        "toTable": rel["to_table"],
-        "toColumn": rel["to_column"],
-        "cardinality": rel["cardinality"],
-        "crossFilteringBehavior": rel["cross_filter_direction"]
-    })
-
-print(f"Relationships exported: {len(tom_model['model']['relationships'])}")
-
-#Add the global annotations
-tom_model["model"]["annotations"].append({
-    "name": "MigrationNote",
-    "value": "Generated via semantic-preserving Tableau → Power BI pipeline"
-})
-#save the TOM model
-with open(OUTPUT_TOM, "w", encoding="utf-8") as f:
-    json.dump(tom_model, f, indent=4)
-
-print(f"\nPower BI TOM model written to {OUTPUT_TOM}")
+
+def _write_array(sinks, key, items, level, last=False):
+    """Write "key": [...] to every sink, consuming items once"""
+    count = 0
+    for item in items:
+        for sink in sinks:
+            if count == 0:
+                sink.f.write(f'{sink.pad(level)}{json.dumps(key)}: [\n{sink.pad(level + 1)}')
+            else:
+                sink.f.write(f",\n{sink.pad(level + 1)}")
+            sink.f.write(sink.dumps(item, level + 1))
+        count += 1
+
+    for sink in sinks:
+        if count:
+            sink.f.write(f"\n{sink.pad(level)}]")
+        else:
+            sink.f.write(f"{sink.pad(level)}{json.dumps(key)}: []")
+        sink.f.write("\n" if last else ",\n")
+    return count
+
+
+def write_tom(model: SemanticModel, tom_paths=(), model_json_paths=(), tmdl_dir=None, verbose=True):
+    """
+    Stream the TOM export to disk in one pass over the model.
+
+    Every table is converted, written to each TOM/BIM file (tom_paths,
+    indent 4), each Tabular Editor Model.json (model_json_paths, indent 2)
+    and the TMDL folder (tmdl_dir, optional), then dropped, so memory does
+    not grow with the exported document. Output is byte-identical to
+    json.dump of tom_from_ir() and to_tabular_editor_model().
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+
+    files = []
+    sinks = []
+    try:
+        for paths, indent, header in (
+            (tom_paths, 4, [("name", TOM_NAME), ("compatibilityLevel", COMPATIBILITY_LEVEL)]),
+            (model_json_paths, 2, []),
+        ):
+            for path in paths:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                f = open(path, "w", encoding="utf-8")
+                files.append(f)
+                sink = _JsonSink(f, indent)
+                f.write("{\n")
+                for key, value in header:
+                    f.write(f"{sink.pad(1)}{json.dumps(key)}: {json.dumps(value)},\n")
+                f.write(f'{sink.pad(1)}"model": {{\n')
+                sinks.append(sink)
+
+        tmdl = TmdlWriter(tmdl_dir) if tmdl_dir else None
+        measures = 0
+
+        def tables():
+            nonlocal measures
+            for table in model.tables:
+                if tmdl is not None:
+                    tmdl.write_table(table)
+                measures += len(table.measures)
+                yield tom_table(table)
+
+        table_count = _write_array(sinks, "tables", tables(), 2)
+        relationship_count = _write_array(sinks, "relationships", map(tom_relationship, model.relationships), 2)
+        _write_array(sinks, "annotations", tom_annotations(model), 2, last=True)
+
+        for sink in sinks:
+            sink.f.write(f"{sink.pad(1)}}}\n}}")
+
+        if tmdl is not None:
+            tmdl.finish(model, TOM_NAME, COMPATIBILITY_LEVEL, MIGRATION_NOTE)
+    finally:
+        for f in files:
+            f.close()
+
+    log(f"Tables exported: {table_count}")
+    log(f"Measures exported: {measures}")
+    log(f"Relationships exported: {relationship_count}")
+
+
+def build_tom_model(semantic_model, hyper_schema, verbose=True) -> TomModel:
+    """TOM export of the final semantic model (through its IR)"""
+    return tom_from_ir(build_model_ir(semantic_model, hyper_schema), verbose=verbose)
+
+
+def main():
+    print("EXPORTING POWER BI TABULAR OBJECT MODEL (TOM)")
+
+    #Loading the final semantic model, from its IR when finalize wrote one
+    if SEMANTIC_MODEL_IR.exists():
+        model = read_ir(SEMANTIC_MODEL_IR)
+    else:
+        with open(SEMANTIC_MODEL, encoding="utf-8") as f:
+            semantic_model = json.load(f)
+
+        with open(HYPER_SCHEMA, encoding="utf-8") as f:
+            hyper_schema = json.load(f)
+
+        model = build_model_ir(semantic_model, hyper_schema)
+
+    #save the TOM model and its Tabular Editor copy in one pass
+    write_tom(model, [OUTPUT_TOM], [OUTPUT_MODEL_JSON])
+
+    print(f"\nPower BI TOM model written to {OUTPUT_TOM}")
+    print(f"Model.json generated in Tabular Editor format ({OUTPUT_MODEL_JSON})")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,15 +6,25 @@ DATA_DIR = Path("data")
 INPUT_TOM = DATA_DIR / "powerbi_tom_model.json"
 OUTPUT_MODEL = DATA_DIR / "Model.json"
 
-with open(INPUT_TOM, encoding="utf-8") as f:
-    tom = json.load(f)
 
-# Wrap into Tabular Editor–compatible structure
-model_json = {
-    "model": tom["model"]
-}
+def to_tabular_editor_model(tom):
+    # Wrap into Tabular Editor–compatible structure
+    return {
+        "model": tom["model"]
+    }
 
-with open(OUTPUT_MODEL, "w", encoding="utf-8") as f:
-    json.dump(model_json, f, indent=2)
 
-print("Model.json generated in Tabular Editor format")
+def main():
+    with open(INPUT_TOM, encoding="utf-8") as f:
+        tom = json.load(f)
+
+    model_json = to_tabular_editor_model(tom)
+
+    with open(OUTPUT_MODEL, "w", encoding="utf-8") as f:
+        json.dump(model_json, f, indent=2)
+
+    print("Model.json generated in Tabular Editor format")
+
+
+if __name__ == "__main__":
+    main()
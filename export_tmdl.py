@@ -0,0 +1,135 @@
+"""
+TMDL (Tabular Model Definition Language) folder export.
+
+Layout:
+    database.tmdl         database name and compatibility level
+    model.tmdl            model properties, annotations, table references
+    relationships.tmdl    one relationship block each
+    tables/<table>.tmdl   measures and columns of one table
+
+Tables are written one file at a time as the TOM export streams them.
+"""
+import os
+import re
+import uuid
+
+from model_ir import SemanticModel, Table, Relationship
+
+# Names made only of these characters are written unquoted
+_PLAIN_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# Characters not allowed in file names on Windows
+_UNSAFE_FILE_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+CARDINALITIES = {
+    "ManyToOne": ("many", "one"),
+    "OneToMany": ("one", "many"),
+    "OneToOne": ("one", "one"),
+    "ManyToMany": ("many", "many"),
+}
+CROSS_FILTERING = {"Single": "oneDirection", "Both": "bothDirections"}
+
+
+def tmdl_name(name):
+    if _PLAIN_NAME.match(name):
+        return name
+    return "'" + name.replace("'", "''") + "'"
+
+
+def tmdl_expression(expression, depth):
+    """Expression after "=": inline, or a fenced block when it spans lines"""
+    if "\n" not in expression:
+        return expression
+    indent = "\t" * (depth + 2)
+    body = "\n".join(indent + line for line in expression.splitlines())
+    return f"```\n{body}\n{indent}```"
+
+
+def table_tmdl(table: Table):
+    lines = [f"table {tmdl_name(table.name)}", ""]
+
+    for measure in table.measures:
+        lines.append(f"\tmeasure {tmdl_name(measure.name)} = {tmdl_expression(measure.expression, 0)}")
+        lines.append(f"\t\tformatString: {measure.format_string}")
+        lines.append("")
+
+    for col in table.columns:
+        lines.append(f"\tcolumn {tmdl_name(col.name)}")
+        lines.append(f"\t\tdataType: {col.data_type}")
+        if col.hidden:
+            lines.append("\t\tisHidden")
+        lines.append(f"\t\tsourceColumn: {col.source_column}")
+        lines.append("")
+
+    return "\n".join(lines)
+
+
+def relationship_tmdl(rel: Relationship):
+    # Stable id, so re-exports of the same model produce the same file
+    rel_id = uuid.uuid5(uuid.NAMESPACE_URL, "|".join(
+        (rel.from_table, rel.from_column, rel.to_table, rel.to_column)
+    ))
+    lines = [
+        f"relationship {rel_id}",
+        f"\tfromColumn: {tmdl_name(rel.from_table)}.{tmdl_name(rel.from_column)}",
+        f"\ttoColumn: {tmdl_name(rel.to_table)}.{tmdl_name(rel.to_column)}",
+    ]
+    from_cardinality, to_cardinality = CARDINALITIES.get(rel.cardinality, ("many", "one"))
+    if from_cardinality != "many":
+        lines.append(f"\tfromCardinality: {from_cardinality}")
+    if to_cardinality != "one":
+        lines.append(f"\ttoCardinality: {to_cardinality}")
+    cross_filtering = CROSS_FILTERING.get(rel.cross_filter_direction, "oneDirection")
+    if cross_filtering != "oneDirection":
+        lines.append(f"\tcrossFilteringBehavior: {cross_filtering}")
+    return "\n".join(lines) + "\n"
+
+
+def table_file_name(name, used):
+    base = _UNSAFE_FILE_CHARS.sub("_", name).strip(" .") or "table"
+    file_name = base
+    n = 1
+    while file_name.casefold() in used:
+        n += 1
+        file_name = f"{base}_{n}"
+    used.add(file_name.casefold())
+    return f"{file_name}.tmdl"
+
+
+class TmdlWriter:
+    """Writes a TMDL folder, one table file at a time"""
+
+    def __init__(self, tmdl_dir):
+        self.tmdl_dir = tmdl_dir
+        self.tables = []
+        self._file_names = set()
+        os.makedirs(os.path.join(tmdl_dir, "tables"), exist_ok=True)
+
+    def _write(self, relative_path, text):
+        with open(os.path.join(self.tmdl_dir, relative_path), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def write_table(self, table: Table):
+        file_name = table_file_name(table.name, self._file_names)
+        self._write(os.path.join("tables", file_name), table_tmdl(table))
+        self.tables.append(table.name)
+
+    def finish(self, model: SemanticModel, name, compatibility_level, note):
+        self._write("database.tmdl", f"database {tmdl_name(name)}\n\tcompatibilityLevel: {compatibility_level}\n")
+
+        lines = ["model Model", "\tculture: en-US", ""]
+        for measure in model.unplaced_measures:
+            lines.append(f"\tannotation {tmdl_name('UnplacedMeasure::' + measure.name)} = No reliable table context")
+        lines.append(f"\tannotation MigrationNote = {note}")
+        lines.append("")
+        lines += [f"ref table {tmdl_name(table)}" for table in self.tables]
+        self._write("model.tmdl", "\n".join(lines) + "\n")
+
+        self._write("relationships.tmdl", "\n".join(relationship_tmdl(rel) for rel in model.relationships))
+
+
+def write_tmdl(model: SemanticModel, tmdl_dir, name, compatibility_level, note):
+    """The whole TMDL folder for a model (write_tom streams it alongside the JSON)"""
+    writer = TmdlWriter(tmdl_dir)
+    for table in model.tables:
+        writer.write_table(table)
+    writer.finish(model, name, compatibility_level, note)
@@ -1,132 +1,206 @@
-import xml.etree.ElementTree as ET
 import json
 import re
 import os
+import zipfile
+from twb_stream import TwbHandler, stream_twb
 
 DATA_DIR = "data"
-os.makedirs(DATA_DIR, exist_ok=True)
+TWBX_PATH = "Superstore.twbx"
 
 
-print("EXTRACTING RELATIONSHIPS FROM TWB XML")
-
-##Locate the TWB file
-def find_twb_file(extract_dir):
-    for root, _, files in os.walk(extract_dir):
-        for f in files:
-            if f.lower().endswith(".twb"):
-                return os.path.join(root, f)
+##Locate the TWB file inside the archive
+def find_twb_member(z):
+    for name in z.namelist():
+        if name.lower().endswith(".twb"):
+            return name
     return None
-extract_dir = "twbx_extracted"
-twb_path = find_twb_file(extract_dir)
 
-if not twb_path:
-    raise FileNotFoundError("No TWB file found in extracted TWBX")
 
-print(f"TWB file located: {twb_path}")
+JOIN_PATTERN = re.compile(
+    r"\[([^\]]+)\]\.\[([^\]]+)\]\s*=\s*\[([^\]]+)\]\.\[([^\]]+)\]"
+)
+
+
+#Collect joins and relationships while the TWB streams past
+class RelationshipHandler(TwbHandler):
+    """
+    Records every <relation type='join'> with the expression of its first
+    <clause> child, and every <relationship> with the from/to pairs of its
+    <column> descendants, in document order.
+    """
+    tags = ("relation", "clause", "relationship", "column")
+
+    def __init__(self):
+        self.joins = []
+        self.logical = []
+        self._relations = []
+        self._relationships = []
+
+    def start(self, elem, path):
+        tag = elem.tag
+
+        if tag == "relation":
+            record = None
+            if elem.get("type") == "join":
+                record = {"join_type": elem.get("join", "inner"), "clause": None}
+                self.joins.append(record)
+            self._relations.append(record)
+
+        elif tag == "clause":
+            # Only the first clause directly under a join counts
+            if path and path[-1] == "relation" and self._relations:
+                record = self._relations[-1]
+                if record is not None and record["clause"] is None:
+                    record["clause"] = {"expression": elem.get("expression")}
+
+        elif tag == "relationship":
+            record = {"attributes": dict(elem.attrib), "columns": []}
+            self.logical.append(record)
+            self._relationships.append(record)
+
+        elif tag == "column":
+            for record in self._relationships:
+                record["columns"].append((elem.get("from"), elem.get("to")))
+
+    def end(self, elem, path):
+        if elem.tag == "relation":
+            self._relations.pop()
+        elif elem.tag == "relationship":
+            self._relationships.pop()
+
+    def result(self, verbose=True):
+        return select_relationships(self.logical, self.joins, verbose)
 
-#Parse the TWB XML
-tree = ET.parse(twb_path)
-root = tree.getroot()
 
 #Detect the modeling model(logical or it is physical)
-has_physical_joins = bool(root.findall(".//relation[@type='join']"))
-has_logical_relationships = bool(root.findall(".//relationship"))
+def detect_modeling_mode(logical, joins):
+    return bool(logical), bool(joins)
 
-print("\nDetected modeling mode:")
-if has_logical_relationships:
-    print(" - Logical Relationships (Tableau semantic layer)")
-if has_physical_joins:
-    print(" - Physical Joins (SQL-based)")
-if not has_physical_joins and not has_logical_relationships:
-    print(" - No explicit relationships found")
 
 #Extract physical joins
-def extract_physical_joins(root):
-    joins = []
-
-    join_pattern = re.compile(
-        r"\[([^\]]+)\]\.\[([^\]]+)\]\s*=\s*\[([^\]]+)\]\.\[([^\]]+)\]"
-    )
+def extract_physical_joins(joins):
+    physical = []
 
-    for rel in root.findall(".//relation[@type='join']"):
-        join_type = rel.attrib.get("join", "inner")
-        clause = rel.find("clause")
+    for rel in joins:
+        clause = rel["clause"]
 
         if clause is None:
             continue
 
-        expr = clause.attrib.get("expression")
+        expr = clause["expression"]
         if not expr:
             continue
 
-        match = join_pattern.search(expr)
+        match = JOIN_PATTERN.search(expr)
         if not match:
             continue
 
         left_table, left_col, right_table, right_col = match.groups()
 
-        joins.append({
+        physical.append({
             "from_table": left_table,
             "from_column": left_col,
             "to_table": right_table,
             "to_column": right_col,
-            "join_type": join_type,
+            "join_type": rel["join_type"],
             "mode": "physical_join",
             "expression": expr
         })
 
-    return joins
+    return physical
+
 
 #Extract Logical relationships
-def extract_logical_relationships(root):
+def extract_logical_relationships(logical):
     relationships = []
 
-    for rel in root.findall(".//relationship"):
-        from_table = rel.attrib.get("from-table")
-        to_table = rel.attrib.get("to-table")
+    for rel in logical:
+        attributes = rel["attributes"]
+        from_table = attributes.get("from-table")
+        to_table = attributes.get("to-table")
 
         # Some versions store column pairs explicitly
-        for col in rel.findall(".//column"):
+        for from_column, to_column in rel["columns"]:
             relationships.append({
                 "from_table": from_table,
-                "from_column": col.attrib.get("from"),
+                "from_column": from_column,
                 "to_table": to_table,
-                "to_column": col.attrib.get("to"),
+                "to_column": to_column,
                 "mode": "logical_relationship",
-                "raw_attributes": rel.attrib
+                "raw_attributes": attributes
             })
 
         # Fallback: store raw relationship if no columns found
-        if not rel.findall(".//column"):
+        if not rel["columns"]:
             relationships.append({
                 "mode": "logical_relationship_raw",
-                "raw_attributes": rel.attrib,
+                "raw_attributes": attributes,
                 "note": "Tableau logical relationship – join keys resolved at query time",
                 "confidence": "engine-resolved"
             })
 
     return relationships
 
+
 # NOTE:
 # If both logical and physical are present, Tableau prefers logical.
 # We mirror that behavior here.
 #Conditional extraction
-relationships = []
+def select_relationships(logical, joins, verbose=True):
+    log = print if verbose else (lambda *args, **kwargs: None)
+
+    has_logical_relationships, has_physical_joins = detect_modeling_mode(logical, joins)
+
+    log("\nDetected modeling mode:")
+    if has_logical_relationships:
+        log(" - Logical Relationships (Tableau semantic layer)")
+    if has_physical_joins:
+        log(" - Physical Joins (SQL-based)")
+    if not has_physical_joins and not has_logical_relationships:
+        log(" - No explicit relationships found")
+
+    if has_logical_relationships:
+        log("\n[✓] Extracting logical relationships...")
+        return extract_logical_relationships(logical)
+
+    if has_physical_joins:
+        log("\n[✓] Extracting physical joins...")
+        return extract_physical_joins(joins)
+
+    log("\n[!] No relationships detected — model may rely on single table")
+    return []
+
+
+def extract_relationships(twb_file, verbose=True):
+    """Stream a TWB (path or file object) and return its relationships"""
+    handler = RelationshipHandler()
+    stream_twb(twb_file, [handler])
+    return handler.result(verbose)
+
+
+def main():
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    print("EXTRACTING RELATIONSHIPS FROM TWB XML")
+
+    with zipfile.ZipFile(TWBX_PATH) as z:
+        twb_member = find_twb_member(z)
+        if not twb_member:
+            raise FileNotFoundError("No TWB file found in TWBX")
+
+        print(f"TWB file located: {twb_member}")
 
-if has_logical_relationships:
-    print("\n[✓] Extracting logical relationships...")
-    relationships = extract_logical_relationships(root)
+        #Stream the TWB XML straight from the archive
+        with z.open(twb_member) as twb_file:
+            relationships = extract_relationships(twb_file)
 
-elif has_physical_joins:
-    print("\n[✓] Extracting physical joins...")
-    relationships = extract_physical_joins(root)
+    #Save relationships to JSON
+    output_file = os.path.join(DATA_DIR, "relationships_from_twb.json")
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(relationships, f, indent=4)
 
-else:
-    print("\n[!] No relationships detected — model may rely on single table")
+    print(f"\nRelationships extracted and saved to {output_file}")
 
-#Save relationships to JSON
-output_file = os.path.join(DATA_DIR, "relationships_from_twb.json")
-with open(output_file, "w", encoding="utf-8") as f:
-    json.dump(relationships, f, indent=4)
 
-print(f"\nRelationships extracted and saved to {output_file}")
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,95 @@
 import json
 from pathlib import Path
 
-print("FINALIZING POWER BI SEMANTIC MODEL")
+from model_ir import build_model_ir, write_ir
 
 DATA_DIR = Path("data")
 
 CANONICAL_MODEL_FILE = DATA_DIR / "canonical_powerbi_model.json"
 CONVERTED_MEASURES_FILE = DATA_DIR / "converted_dax_measures.json"
 SEMANTIC_CONTEXT_FILE = DATA_DIR / "semantic_model_with_context.json"
+HYPER_SCHEMA_FILE = DATA_DIR / "parsed_hyper_schema.json"
 OUTPUT_FILE = DATA_DIR / "final_powerbi_semantic_model.json"
+#Binary IR read by the TOM export; the JSON above is the audit copy
+OUTPUT_IR = DATA_DIR / "final_powerbi_semantic_model.ir"
 
-# -------------------------------------------------------------------
-# 1. LOAD CANONICAL MODEL
-# -------------------------------------------------------------------
-with open(CANONICAL_MODEL_FILE, encoding="utf-8") as f:
-    model = json.load(f)
 
-print("Loaded canonical_powerbi_model.json")
+def finalize_model(model, context_model, conversion, verbose=True):
+    log = print if verbose else (lambda *args, **kwargs: None)
 
-# -------------------------------------------------------------------
-# 2. LOAD CONTEXT-AWARE SEMANTIC MODEL (TABLE OWNERSHIP)
-# -------------------------------------------------------------------
-with open(SEMANTIC_CONTEXT_FILE, encoding="utf-8") as f:
-    context_model = json.load(f)
+    # ---------------------------------------------------------------
+    # 1. ATTACH TABLE OWNERSHIP FROM CONTEXT-AWARE SEMANTIC MODEL
+    # ---------------------------------------------------------------
+    if "measure_table_map" not in context_model:
+        raise KeyError("measure_table_map missing from semantic_model_with_context.json")
 
-if "measure_table_map" not in context_model:
-    raise KeyError("measure_table_map missing from semantic_model_with_context.json")
+    model["measure_table_map"] = context_model["measure_table_map"]
 
-model["measure_table_map"] = context_model["measure_table_map"]
+    log(f"Loaded measure_table_map ({len(model['measure_table_map'])} entries)")
 
-print(f"Loaded measure_table_map ({len(model['measure_table_map'])} entries)")
+    # ---------------------------------------------------------------
+    # 2. ATTACH CONVERTED MEASURES
+    # ---------------------------------------------------------------
+    converted_measures = conversion.get("converted_measures", {})
+    skipped_measures = conversion.get("skipped_measures", [])
 
-# -------------------------------------------------------------------
-# 3. LOAD CONVERTED MEASURES
-# -------------------------------------------------------------------
-with open(CONVERTED_MEASURES_FILE, encoding="utf-8") as f:
-    conversion = json.load(f)
+    log(f"Converted measures: {len(converted_measures)}")
+    log(f"Skipped measures: {len(skipped_measures)}")
 
-converted_measures = conversion.get("converted_measures", {})
-skipped_measures = conversion.get("skipped_measures", [])
+    model["measures"] = converted_measures
 
-print(f"Converted measures: {len(converted_measures)}")
-print(f"Skipped measures: {len(skipped_measures)}")
+    # Attach explicit conversion report (audit-safe)
+    model["conversion_report"] = {
+        "converted_count": len(converted_measures),
+        "skipped_count": len(skipped_measures),
+        "skipped_measures": skipped_measures,
+    }
 
-# -------------------------------------------------------------------
-# 4. ATTACH MEASURES TO FINAL MODEL
-# -------------------------------------------------------------------
-model["measures"] = converted_measures
+    return model
 
-# Attach explicit conversion report (audit-safe)
-model["conversion_report"] = {
-    "converted_count": len(converted_measures),
-    "skipped_count": len(skipped_measures),
-    "skipped_measures": skipped_measures,
-}
 
-# -------------------------------------------------------------------
-# 5. SAVE FINAL SEMANTIC MODEL
-# -------------------------------------------------------------------
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(model, f, indent=4)
+def main():
+    print("FINALIZING POWER BI SEMANTIC MODEL")
 
-print("\nFinal Power BI semantic model written to:")
-print(f" → {OUTPUT_FILE}")
+    # -------------------------------------------------------------------
+    # 1. LOAD CANONICAL MODEL
+    # -------------------------------------------------------------------
+    with open(CANONICAL_MODEL_FILE, encoding="utf-8") as f:
+        model = json.load(f)
+
+    print("Loaded canonical_powerbi_model.json")
+
+    # -------------------------------------------------------------------
+    # 2. LOAD CONTEXT-AWARE SEMANTIC MODEL (TABLE OWNERSHIP)
+    # -------------------------------------------------------------------
+    with open(SEMANTIC_CONTEXT_FILE, encoding="utf-8") as f:
+        context_model = json.load(f)
+
+    # -------------------------------------------------------------------
+    # 3. LOAD CONVERTED MEASURES
+    # -------------------------------------------------------------------
+    with open(CONVERTED_MEASURES_FILE, encoding="utf-8") as f:
+        conversion = json.load(f)
+
+    # -------------------------------------------------------------------
+    # 4. ATTACH MEASURES TO FINAL MODEL
+    # -------------------------------------------------------------------
+    model = finalize_model(model, context_model, conversion)
+
+    # -------------------------------------------------------------------
+    # 5. SAVE FINAL SEMANTIC MODEL
+    # -------------------------------------------------------------------
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(model, f, indent=4)
+
+    with open(HYPER_SCHEMA_FILE, encoding="utf-8") as f:
+        hyper_schema = json.load(f)
+    write_ir(OUTPUT_IR, build_model_ir(model, hyper_schema))
+
+    print("\nFinal Power BI semantic model written to:")
+    print(f" → {OUTPUT_FILE}")
+    print(f" → {OUTPUT_IR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import re
+from bisect import bisect_right
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+# Types whose min/max can be compared safely outside the engine. Text is
+# left out because Hyper and Python may order strings differently.
+RANGE_COMPARABLE_TYPES = {"integer", "float", "decimal", "date", "datetime"}
+
+_TYPE_PATTERNS = [
+    (re.compile(r"^(big_?int|int|small_?int|oid|u?int\d*)"), "integer"),
+    (re.compile(r"^(double|float|real)"), "float"),
+    (re.compile(r"^(numeric|decimal)"), "decimal"),
+    (re.compile(r"^(timestamp|datetime)"), "datetime"),
+    (re.compile(r"^date"), "date"),
+    (re.compile(r"^time"), "time"),
+    (re.compile(r"^(bool)"), "bool"),
+    (re.compile(r"^(text|varchar|char|string|str|object|category)"), "string"),
+]
+
+
+def normalize_type(dtype) -> str:
+    """Collapse Hyper SQL types and pandas dtypes onto one type vocabulary"""
+    raw = str(dtype).strip().lower()
+    for pattern, normalized in _TYPE_PATTERNS:
+        if pattern.match(raw):
+            return normalized
+    return raw
+
+
+def normalize_column_name(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+def name_similarity(a: str, b: str) -> float:
+    return SequenceMatcher(None, normalize_column_name(a), normalize_column_name(b)).ratio()
+
+
+def _ranges_disjoint(fk_stats, pk_stats):
+    try:
+        return fk_stats["max"] < pk_stats["min"] or fk_stats["min"] > pk_stats["max"]
+    except (KeyError, TypeError):
+        return False
+
+
+def generate_fk_candidates(column_stats, primary_keys, coverage_threshold, min_name_similarity=None):
+    """
+    Candidate (FK, PK) column pairs that could reach coverage_threshold.
+
+    PK columns are indexed by normalized type and sorted by distinct count,
+    so each FK column only visits PKs of its own type that have enough
+    distinct values to cover it. The remaining pairs are dropped when the
+    value ranges of numeric/temporal columns are disjoint, and optionally
+    when the column names are too dissimilar.
+
+    Returns (candidates, pruning) where candidates are
+    (fact_table, fk_col, dim_table, pk_col, name_similarity) tuples and
+    pruning counts the pairs removed at each step.
+    """
+    pk_index = defaultdict(list)
+    pk_count_by_table = defaultdict(int)
+    for dim_table, pk_cols in primary_keys.items():
+        for pk_col in pk_cols:
+            stats = column_stats[dim_table][pk_col]
+            pk_index[normalize_type(stats["dtype"])].append((stats["distinct_count"], dim_table, pk_col))
+            pk_count_by_table[dim_table] += 1
+
+    for entries in pk_index.values():
+        entries.sort(key=lambda e: e[0])
+    distinct_index = {ntype: [e[0] for e in entries] for ntype, entries in pk_index.items()}
+    total_pks = sum(pk_count_by_table.values())
+
+    pruning = {
+        "total_pairs": 0,
+        "pruned_type": 0,
+        "pruned_cardinality": 0,
+        "pruned_range": 0,
+        "pruned_name": 0,
+        "candidates": 0,
+    }
+    candidates = []
+
+    for fact_table, fact_cols in column_stats.items():
+        other_pks = total_pks - pk_count_by_table.get(fact_table, 0)
+
+        for fk_col, fk_stats in fact_cols.items():
+            pruning["total_pairs"] += other_pks
+
+            ntype = normalize_type(fk_stats["dtype"])
+            entries = pk_index.get(ntype, [])
+            same_type = [e for e in entries if e[1] != fact_table]
+            pruning["pruned_type"] += other_pks - len(same_type)
+
+            # A PK can cover at most pk_distinct of the FK's distinct values
+            fk_distinct = fk_stats["distinct_count"]
+            start = bisect_right(distinct_index.get(ntype, []), coverage_threshold * fk_distinct)
+            if fk_distinct == 0:
+                start = len(entries)
+            pruning["pruned_cardinality"] += sum(1 for e in entries[:start] if e[1] != fact_table)
+
+            for _, dim_table, pk_col in entries[start:]:
+                if dim_table == fact_table:
+                    continue
+
+                pk_stats = column_stats[dim_table][pk_col]
+                if ntype in RANGE_COMPARABLE_TYPES and _ranges_disjoint(fk_stats, pk_stats):
+                    pruning["pruned_range"] += 1
+                    continue
+
+                similarity = name_similarity(fk_col, pk_col)
+                if min_name_similarity is not None and similarity < min_name_similarity:
+                    pruning["pruned_name"] += 1
+                    continue
+
+                candidates.append((fact_table, fk_col, dim_table, pk_col, similarity))
+
+    pruning["candidates"] = len(candidates)
+
+    return candidates, pruning
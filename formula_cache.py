@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Any, Optional
+
+from tableau_formula import tokenize, parse_formula, FormulaSyntaxError, PARSE_CACHE_SIZE
+from classify_tableau_calculations import classify_ast
+from rewrite_convertible_calculations import ast_to_dax_expression
+
+FORMULA_CACHE_FILE = "formulas.sqlite"
+# Entries kept on disk; the least recently used are evicted beyond this
+FORMULA_CACHE_SIZE = 200_000
+# Evictions are checked after this many inserts
+EVICTION_INTERVAL = 1000
+# Compiled formulas kept in memory, least recently used dropped first
+MEMORY_CACHE_SIZE = PARSE_CACHE_SIZE
+# In-memory hits are written back to disk after this many distinct keys
+TOUCH_FLUSH_INTERVAL = 1000
+# Bump when classification or DAX emission changes
+FORMULA_CACHE_VERSION = 2
+
+
+class CompiledFormula(NamedTuple):
+    classification: str
+    note: str
+    ast: Any
+    dax: Optional[str]
+
+
+def normalize_formula(formula):
+    """
+    Canonical text of a formula and the fields it references.
+
+    Whitespace and comments are dropped and keywords/functions upper-cased,
+    so formulas that only differ in layout share one cache entry. Text
+    that does not tokenize is only stripped.
+    """
+    try:
+        tokens = tokenize(formula or "")
+    except FormulaSyntaxError:
+        return (formula or "").strip(), ()
+
+    normalized = " ".join(value for kind, value, _ in tokens if kind != "end")
+    fields = tuple(dict.fromkeys(
+        value[1:-1].replace("]]", "]").strip().lower()
+        for kind, value, _ in tokens if kind == "field"
+    ))
+    return normalized, fields
+
+
+def context_hash(fields, field_to_table=None, field_types=None):
+    """Hash of the tables and types the referenced fields resolve to ("" without either)"""
+    if not field_to_table and not field_types:
+        return ""
+    field_to_table, field_types = field_to_table or {}, field_types or {}
+    context = [[field, field_to_table.get(field), field_types.get(field)] for field in sorted(fields)]
+    return hashlib.sha1(json.dumps(context).encode("utf-8")).hexdigest()
+
+
+def compile_formula(formula, field_to_table=None, field_types=None):
+    """
+    Parse, classify and (when convertible) rewrite one formula to DAX.
+    A convertible formula with no DAX translation keeps its classification
+    with the reason as note and no DAX.
+    """
+    try:
+        ast = parse_formula(formula)
+    except FormulaSyntaxError:
+        return CompiledFormula("unknown", "manual review required", None, None)
+
+    classification, note = classify_ast(ast)
+    dax = None
+    if classification == "simple_aggregation":
+        try:
+            dax = ast_to_dax_expression(ast, field_to_table, field_types)
+        except ValueError as exc:
+            note = str(exc)
+    return CompiledFormula(classification, note, ast, dax)
+
+
+class FormulaCache:
+    """
+    Persistent cache of compiled formulas in SQLite.
+
+    Entries are keyed by normalized formula text plus the hash of the
+    field-to-table context the DAX was emitted for, and hold the
+    classification, pickled AST and DAX. The database runs in WAL mode so
+    batch workers can share one file. The memory_size most recently used
+    entries are also kept in memory; hits served from there are recorded
+    and written to disk in batches (and on close), so entries that are
+    hot in any worker stay recent for eviction. On disk, the least
+    recently used entries are evicted past max_entries. Every write is
+    committed at once, so the write lock is never held across compiles
+    and other processes on the same file are not blocked. One cache may
+    be shared by threads; only database access is serialized.
+    """
+
+    def __init__(self, path, max_entries=FORMULA_CACHE_SIZE, memory_size=MEMORY_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_size = memory_size
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._memory = OrderedDict()
+        self._touched = {}  # key -> (in-memory hits, last used) not yet on disk
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS formulas ("
+            " key TEXT PRIMARY KEY, normalized TEXT, context TEXT,"
+            " classification TEXT, note TEXT, ast BLOB, dax TEXT,"
+            " hits INTEGER DEFAULT 0, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS formulas_last_used ON formulas (last_used)")
+        self._db.commit()
+
+    @staticmethod
+    def key(normalized, context):
+        raw = f"{FORMULA_CACHE_VERSION}\0{normalized}\0{context}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def compile(self, formula, field_to_table=None, field_types=None):
+        normalized, fields = normalize_formula(formula)
+        context = context_hash(fields, field_to_table, field_types)
+        key = self.key(normalized, context)
+
+        with self._lock:
+            if key in self._memory:
+                self.stats["hits"] += 1
+                self._memory.move_to_end(key)
+                hits, _ = self._touched.get(key, (0, None))
+                self._touched[key] = (hits + 1, time.time())
+                if len(self._touched) >= TOUCH_FLUSH_INTERVAL:
+                    self._flush_touches()
+                return self._memory[key]
+
+            row = self._db.execute(
+                "SELECT classification, note, ast, dax FROM formulas WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is not None:
+                classification, note, ast, dax = row
+                compiled = CompiledFormula(classification, note, pickle.loads(ast), dax)
+                self._db.execute(
+                    "UPDATE formulas SET hits = hits + 1, last_used = ? WHERE key = ?",
+                    (time.time(), key)
+                )
+                self._db.commit()
+                self.stats["hits"] += 1
+                self._remember(key, compiled)
+                return compiled
+
+        compiled = compile_formula(formula, field_to_table, field_types)
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO formulas"
+                " (key, normalized, context, classification, note, ast, dax, hits, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)",
+                (key, normalized, context, compiled.classification, compiled.note,
+                 pickle.dumps(compiled.ast), compiled.dax, time.time())
+            )
+            self._db.commit()
+            self.stats["misses"] += 1
+            self._inserts += 1
+            if self._inserts % EVICTION_INTERVAL == 0:
+                self._evict()
+            self._remember(key, compiled)
+
+        return compiled
+
+    def _remember(self, key, compiled):
+        self._memory[key] = compiled
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _flush_touches(self):
+        """Write the hits served from memory to disk in one transaction"""
+        if not self._touched:
+            return
+        self._db.executemany(
+            "UPDATE formulas SET hits = hits + ?, last_used = MAX(COALESCE(last_used, 0), ?) WHERE key = ?",
+            [(hits, last_used, key) for key, (hits, last_used) in self._touched.items()]
+        )
+        self._db.commit()
+        self._touched.clear()
+
+    def evict(self):
+        """Drop the least recently used entries beyond max_entries"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        #recent in-memory hits must count before picking what to drop
+        self._flush_touches()
+        (count,) = self._db.execute("SELECT COUNT(*) FROM formulas").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM formulas WHERE key IN"
+                " (SELECT key FROM formulas ORDER BY last_used ASC LIMIT ?)",
+                (excess,)
+            )
+            self.stats["evictions"] += excess
+        self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self.evict()
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
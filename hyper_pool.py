@@ -0,0 +1,109 @@
+import threading
+from contextlib import contextmanager
+from tableauhyperapi import HyperProcess, Connection, Telemetry, HyperException
+
+
+def start_hyper():
+    return HyperProcess(
+        telemetry=Telemetry.DO_NOT_SEND_USAGE_DATA_TO_TABLEAU
+    )
+
+
+class HyperPool:
+    """
+    One long-lived HyperProcess and a pool of reusable connections to it.
+
+    The process is started on first use and kept until close(), so every
+    stage, and every workbook compiled while the pool is open, shares it.
+    Connections are opened on demand and reused; each checkout attaches
+    the requested databases ({alias: path}) and detaches them on return.
+    A connection is used by one caller at a time.
+    """
+
+    def __init__(self):
+        self._process = None
+        self._idle = []
+        self._connections = []
+        self._lock = threading.Lock()
+        self.stats = {"process_starts": 0, "connections_opened": 0, "checkouts": 0}
+
+    @property
+    def process(self):
+        with self._lock:
+            if self._process is None:
+                self._process = start_hyper()
+                self.stats["process_starts"] += 1
+            return self._process
+
+    def acquire(self, databases=None):
+        endpoint = self.process.endpoint
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+            self.stats["checkouts"] += 1
+
+        if connection is None:
+            connection = Connection(endpoint=endpoint)
+            with self._lock:
+                self._connections.append(connection)
+                self.stats["connections_opened"] += 1
+
+        try:
+            for alias, path in (databases or {}).items():
+                connection.catalog.attach_database(path, alias=alias)
+        except HyperException:
+            self._discard(connection)
+            raise
+
+        return connection
+
+    def release(self, connection, databases=None):
+        try:
+            for alias in databases or {}:
+                connection.catalog.detach_database(alias)
+        except HyperException:
+            self._discard(connection)
+            return
+
+        with self._lock:
+            self._idle.append(connection)
+
+    def _discard(self, connection):
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        connection.close()
+
+    @contextmanager
+    def connection(self, databases=None):
+        connection = self.acquire(databases)
+        try:
+            yield connection
+        finally:
+            self.release(connection, databases)
+
+    def close(self):
+        with self._lock:
+            connections, self._connections, self._idle = self._connections, [], []
+            process, self._process = self._process, None
+
+        for connection in connections:
+            connection.close()
+        if process is not None:
+            process.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def borrow_pool(pool=None):
+    """Use the caller's HyperPool when given, otherwise one for this block"""
+    if pool is not None:
+        yield pool
+        return
+
+    with HyperPool() as own:
+        yield own
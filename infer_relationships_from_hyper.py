@@ -1,101 +1,543 @@
 import json
+import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tableauhyperapi import HyperException, escape_name
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from column_value_index import ColumnValueIndex
+from fk_candidates import generate_fk_candidates, normalize_type, RANGE_COMPARABLE_TYPES
+from key_discovery import discover_keys, dataframe_uniqueness, MAX_KEY_WIDTH, NON_KEY_TYPES
+from parsing_tableau import (
+    extract_aliases, hyper_table_name, ExtractConnections,
+    EXTRACT_DIR, RAW_DATA_DIR, HYPER_WORKERS, TWBX_PATH,
+)
+from twbx_archive import WorkbookArchive
+from hyper_pool import borrow_pool
+from tracing import Tracer
 
 DATA_DIR = Path("data")
 
-with open(DATA_DIR / "parsed_hyper_schema.json") as f:
-    hyper_schema = json.load(f)
+# Preferred first: per-table columnar exports, then legacy single-file dumps
+RAW_DATA_FILES = [RAW_DATA_DIR, "hyper_raw_data.parquet", "hyper_raw_data.arrow", "hyper_raw_data.csv"]
+
+
+#Loading the exported extract
+# Text columns with at most this share of distinct values per row stay
+# dictionary-encoded (pandas categoricals)
+CATEGORY_RATIO = 0.5
+
+# Integers keep their type when they hold nulls instead of becoming float
+_NULLABLE_INTEGERS = {
+    pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(), pa.int64(): pd.Int64Dtype(),
+}
+_CSV_DTYPES = {"integer": "Int64", "string": "category"}
+
+
+def key_columns(hyper_schema):
+    """{table: {column: Hyper type}} of the columns that can take part in a key"""
+    return {
+        entry["table"]: {
+            col["column_name"]: col["data_type"]
+            for col in entry["columns"]
+            if normalize_type(col["data_type"]) not in NON_KEY_TYPES
+        }
+        for entry in hyper_schema
+    }
+
+
+def _text_column(column):
+    """Keep a text column dictionary-encoded when few of its values are distinct"""
+    if not pa.types.is_dictionary(column.type):
+        column = column.dictionary_encode()
+    column = column.unify_dictionaries()
+    distinct = len(column.chunk(0).dictionary) if column.num_chunks else 0
+    if distinct > CATEGORY_RATIO * len(column):
+        return column.cast(column.type.value_type)
+    return column
+
+
+def arrow_to_frame(table):
+    """DataFrame over an Arrow table: categoricals for low-cardinality text, nullable integers, datetime64 dates"""
+    columns = [
+        _text_column(column) if pa.types.is_string(column.type) or pa.types.is_large_string(column.type)
+        or pa.types.is_dictionary(column.type) else column
+        for column in table.columns
+    ]
+    return pa.table(columns, names=table.column_names).to_pandas(
+        types_mapper=_NULLABLE_INTEGERS.get, date_as_object=False, split_blocks=True
+    )
+
+
+def load_table_file(path, columns=None):
+    """
+    Load one exported table; Parquet and Arrow IPC files are memory-mapped.
+
+    columns ({column: Hyper type}) restricts what is read; columns missing
+    from the file are skipped. Parquet text columns are read straight into
+    dictionaries. CSV has no types of its own, so they come from columns.
+    """
+    path = Path(path)
+
+    if path.suffix == ".parquet":
+        schema = pq.read_schema(path, memory_map=True)
+        names = [name for name in columns if name in schema.names] if columns is not None else schema.names
+        text = [name for name in names if pa.types.is_string(schema.field(name).type)]
+        return arrow_to_frame(pq.read_table(path, columns=names, memory_map=True, read_dictionary=text))
+
+    if path.suffix == ".arrow":
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select([name for name in columns if name in table.column_names])
+        return arrow_to_frame(table)
+
+    if columns is None:
+        return pd.read_csv(path)
+    header = pd.read_csv(path, nrows=0).columns
+    return pd.read_csv(
+        path,
+        usecols=[name for name in columns if name in header],
+        dtype={name: _CSV_DTYPES[normalize_type(dtype)] for name, dtype in columns.items()
+               if normalize_type(dtype) in _CSV_DTYPES and name in header},
+    )
+
+
+def load_raw_data(path, hyper_schema=None):
+    """
+    Load exported extract data as {table: DataFrame}.
+
+    A directory holds one file per table, named after the table. A single
+    file is a legacy dump with "table.column" headers. With hyper_schema
+    only the columns that can take part in a key are loaded (float and
+    bool columns never do).
+    """
+    path = Path(path)
+    columns = key_columns(hyper_schema) if hyper_schema is not None else None
+
+    if path.is_dir():
+        return {
+            table_file.stem: load_table_file(table_file, columns.get(table_file.stem, {}) if columns else None)
+            for table_file in sorted(path.iterdir())
+            if table_file.suffix in (".parquet", ".arrow", ".csv")
+        }
+
+    if columns is not None:
+        columns = {f"{table}.{col}": dtype for table, cols in columns.items() for col, dtype in cols.items()}
+    return split_by_table(path, columns)
+
+
+def find_raw_data(data_dir=DATA_DIR):
+    for file_name in RAW_DATA_FILES:
+        path = Path(data_dir) / file_name
+        if path.exists():
+            return path
+    raise FileNotFoundError(f"No exported extract found in {data_dir}")
+
+
+def _file_columns(path):
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return pq.read_schema(path, memory_map=True).names
+    if path.suffix == ".arrow":
+        with pa.memory_map(str(path)) as source:
+            return pa.ipc.open_file(source).schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
 
-df = pd.read_csv(DATA_DIR / "hyper_raw_data.csv")
 
 #splitting the data by table
-tables = defaultdict(pd.DataFrame)
+#each table's columns are loaded on their own, so no frame of the whole dump is built
+def split_by_table(path, columns=None):
+    """
+    {table: DataFrame} from a legacy dump with "table.column" headers,
+    optionally restricted to columns ({"table.column": Hyper type}).
+    Parquet and Arrow dumps are memory-mapped, so only each table's
+    columns are read; a CSV dump is read once per table.
+    """
+    tables = defaultdict(dict)
+
+    for col in _file_columns(path):
+        if '.' not in col or (columns is not None and col not in columns):
+            continue
+        table = col.split('.', 1)[0]
+        tables[table][col] = columns[col] if columns is not None else None
 
-for col in df.columns:
-    if '.' not in col:
-        continue 
-    table, column = col.split('.', 1)
-    tables[table][column] = df[col]
+    return {
+        table: load_table_file(path, cols).rename(columns=lambda col: col.split('.', 1)[1])
+        for table, cols in tables.items()
+    }
 
 
 #Column profiling
 #this is the engine level evidence not the inference
-column_stats = defaultdict(dict)
-for table, tdf in tables.items():
-    row_count = len(tdf)
+PROFILE_BACKENDS = ("hyper", "pandas")
+
+
+def profile_table_hyper(connection, entry, table):
+    """
+    Profile every column of one table inside Hyper with a single query.
 
-    for col in tdf.columns:
-        series = tdf[col]
-        column_stats[table][col] = {
+    COUNT(*), COUNT(DISTINCT col) and COUNT(*) - COUNT(col) are computed
+    for all columns in one scan, so no row data reaches Python, plus
+    MIN/MAX for numeric and temporal columns. dtype is the Hyper SQL type.
+    """
+    aggregates = ["COUNT(*)"]
+    for col in entry["columns"]:
+        quoted = escape_name(col["column_name"])
+        aggregates.append(f"COUNT(DISTINCT {quoted})")
+        aggregates.append(f"COUNT(*) - COUNT({quoted})")
+        if normalize_type(col["data_type"]) in RANGE_COMPARABLE_TYPES:
+            aggregates.append(f"MIN({quoted})")
+            aggregates.append(f"MAX({quoted})")
+
+    row = connection.execute_list_query(f"SELECT {', '.join(aggregates)} FROM {table}")[0]
+    values = iter(row)
+    row_count = next(values)
+
+    profile = {}
+    for col in entry["columns"]:
+        stats = {
             "row_count": row_count,
-            "distinct_count": series.nunique(dropna=True),
-            "null_count": series.isna().sum(),
-            "dtype": str(series.dtype)
+            "distinct_count": next(values),
+            "null_count": next(values),
+            "dtype": col["data_type"]
         }
+        if normalize_type(col["data_type"]) in RANGE_COMPARABLE_TYPES:
+            stats["min"] = next(values)
+            stats["max"] = next(values)
+        profile[col["column_name"]] = stats
+
+    return profile
+
+
+def profile_columns_hyper(connections, hyper_schema, max_workers=HYPER_WORKERS):
+    """Profile all tables of all extracts concurrently, one connection per worker"""
+    aliases = extract_aliases(hyper_schema)
+
+    def profile_entry(entry):
+        return profile_table_hyper(connections.get(), entry, hyper_table_name(entry, aliases))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        profiles = list(pool.map(profile_entry, hyper_schema))
+
+    column_stats = defaultdict(dict)
+    for entry, profile in zip(hyper_schema, profiles):
+        column_stats[entry["table"]] = profile
+
+    return column_stats
+
+
+def profile_columns(tables, hyper_schema=None):
+    """
+    Profile every column of {table: DataFrame}. With hyper_schema, dtype
+    is the Hyper SQL type, as in the hyper backend, rather than however
+    the column was loaded.
+    """
+    hyper_types = {
+        (entry["table"], col["column_name"]): col["data_type"]
+        for entry in hyper_schema or []
+        for col in entry["columns"]
+    }
+
+    column_stats = defaultdict(dict)
+    for table, tdf in tables.items():
+        row_count = len(tdf)
+
+        for col in tdf.columns:
+            series = tdf[col]
+            stats = {
+                "row_count": row_count,
+                "distinct_count": series.nunique(dropna=True),
+                "null_count": series.isna().sum(),
+                "dtype": hyper_types.get((table, col), str(series.dtype))
+            }
+            if normalize_type(stats["dtype"]) in RANGE_COMPARABLE_TYPES:
+                stats["min"] = series.min()
+                stats["max"] = series.max()
+            column_stats[table][col] = stats
+
+    return column_stats
+
 
 #Primary key detection
-primary_keys = defaultdict(list)
+def detect_primary_keys(column_stats, is_unique, max_key_width=MAX_KEY_WIDTH, max_workers=1):
+    """
+    Keys of every table (key_discovery.discover_keys).
+
+    Returns (primary_keys, composite_keys, counters): single-column keys
+    per table, which are the FK targets, and the wider minimal keys.
+    """
+    keys, counters = discover_keys(column_stats, is_unique, max_key_width, max_workers)
+
+    primary_keys = defaultdict(list)
+    composite_keys = {}
+    for table, table_keys in keys.items():
+        for key in table_keys:
+            if len(key) == 1:
+                primary_keys[table].append(key[0])
+            else:
+                composite_keys.setdefault(table, []).append(key)
+
+    return primary_keys, composite_keys, counters
+
+
+#Foreign key coverage
+#share of distinct non-null FK values that exist in the PK column
+FK_COVERAGE_THRESHOLD = 0.95
+HYPER_FETCH_CHUNK = 65536
+
+
+def dataframe_coverage(tables, column_stats):
+    def load_values(table, column):
+        yield tables[table][column]
+
+    return ColumnValueIndex(column_stats, load_values, FK_COVERAGE_THRESHOLD)
+
+
+def _hyper_table_names(hyper_schema):
+    aliases = extract_aliases(hyper_schema)
+    return {
+        entry["table"]: hyper_table_name(entry, aliases)
+        for entry in hyper_schema
+    }
+
+
+def hyper_value_loader(connection, hyper_schema):
+    """Stream the distinct non-null values of a column out of Hyper in chunks"""
+    table_names = _hyper_table_names(hyper_schema)
+
+    def load_values(table, column):
+        col = escape_name(column)
+        chunk = []
+        with connection.execute_query(
+            f"SELECT DISTINCT {col} FROM {table_names[table]} WHERE {col} IS NOT NULL"
+        ) as result:
+            for row in result:
+                chunk.append(row[0])
+                if len(chunk) >= HYPER_FETCH_CHUNK:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    return load_values
+
+
+def hyper_coverage(connection, hyper_schema):
+    table_names = _hyper_table_names(hyper_schema)
+
+    def coverage(fact_table, fk_col, dim_table, pk_col):
+        fk = escape_name(fk_col)
+        pk = escape_name(pk_col)
+        fk_distinct, matched = connection.execute_list_query(
+            f"SELECT COUNT(*), COUNT(p.k) "
+            f"FROM (SELECT DISTINCT {fk} AS k FROM {table_names[fact_table]} WHERE {fk} IS NOT NULL) f "
+            f"LEFT JOIN (SELECT DISTINCT {pk} AS k FROM {table_names[dim_table]}) p ON f.k = p.k"
+        )[0]
+
+        return matched / max(fk_distinct, 1)
+
+    return coverage
+
+
+def hyper_uniqueness(connections, hyper_schema, column_stats):
+    """
+    is_unique(table, columns) answered inside Hyper: the distinct
+    combinations are counted there and compared with the profiled row
+    count, so no rows reach Python. Hyper builds the whole distinct set
+    either way; only the pandas path (unique_rows) stops at the first
+    duplicate. Single columns never get here, their distinct counts
+    already come from the profile.
+    """
+    table_names = _hyper_table_names(hyper_schema)
+
+    def is_unique(table, columns):
+        cols = ", ".join(escape_name(col) for col in columns)
+        row_count = next(iter(column_stats[table].values()))["row_count"]
+        return connections.get().execute_scalar_query(
+            f"SELECT COUNT(*) FROM (SELECT DISTINCT {cols} FROM {table_names[table]}) AS combinations"
+        ) == row_count
+
+    return is_unique
 
-for table, cols in column_stats.items():
-    for col, stats in cols.items():
-        if (
-            stats["distinct_count"] == stats["row_count"]
-            and stats["null_count"] == 0
-        ):
-            primary_keys[table].append(col)
 
 #Foreign key detection
-foreign_keys = []
+#only pairs surviving candidate pruning reach the coverage check
+def detect_foreign_keys(column_stats, primary_keys, coverage):
+    foreign_keys = []
 
-for fact_table, fact_cols in column_stats.items():
-    for dim_table, dim_pks in primary_keys.items():
-        if fact_table == dim_table:
-            continue
+    candidates, pruning = generate_fk_candidates(column_stats, primary_keys, FK_COVERAGE_THRESHOLD)
 
-        for fk_col, fk_stats in fact_cols.items():
-            for pk_col in dim_pks:
-                if fk_stats["dtype"] != column_stats[dim_table][pk_col]["dtype"]:
-                    continue
+    for fact_table, fk_col, dim_table, pk_col, _ in candidates:
+        fk_coverage = coverage(fact_table, fk_col, dim_table, pk_col)
 
-                fk_values = tables[fact_table][fk_col].dropna().unique()
-                pk_values = tables[dim_table][pk_col].unique()
+        if fk_coverage > FK_COVERAGE_THRESHOLD:
+            foreign_keys.append({
+                "from_table": fact_table,
+                "from_column": fk_col,
+                "to_table": dim_table,
+                "to_column": pk_col,
+                "coverage": fk_coverage
+            })
 
-                coverage = len(set(fk_values) & set(pk_values)) / max(len(fk_values), 1)
+    return foreign_keys, pruning
 
-                if coverage > 0.95:
-                    foreign_keys.append({
-                        "from_table": fact_table,
-                        "from_column": fk_col,
-                        "to_table": dim_table,
-                        "to_column": pk_col,
-                        "coverage": coverage
-                    })
 
 #Cardinality resolution
-relationships = []
-
-for fk in foreign_keys:
-    relationships.append({
-        "from_table": fk["from_table"],
-        "from_column": fk["from_column"],
-        "to_table": fk["to_table"],
-        "to_column": fk["to_column"],
-        "cardinality": "ManyToOne",
-        "cross_filter_direction": "Single",
-        "confidence": round(fk["coverage"], 3),
-        "evidence": {
-            "fk_coverage": fk["coverage"],
-            "pk_verified": True
-        }
-    })
-#Save output
-output = {
-    "relationships": relationships,
-    "unresolved_relationships": []
-}
+def resolve_cardinality(foreign_keys):
+    relationships = []
+
+    for fk in foreign_keys:
+        relationships.append({
+            "from_table": fk["from_table"],
+            "from_column": fk["from_column"],
+            "to_table": fk["to_table"],
+            "to_column": fk["to_column"],
+            "cardinality": "ManyToOne",
+            "cross_filter_direction": "Single",
+            "confidence": round(fk["coverage"], 3),
+            "evidence": {
+                "fk_coverage": fk["coverage"],
+                "pk_verified": True
+            }
+        })
+
+    return relationships
+
+
+def _count_profiled(span, column_stats):
+    span.count(
+        rows=sum(next(iter(cols.values()))["row_count"] for cols in column_stats.values() if cols),
+        objects=sum(len(cols) for cols in column_stats.values())
+    )
+
+
+def _relationships_from_profile(column_stats, is_unique, coverage, tracer, max_key_width, max_workers=1):
+    with tracer.span("key_discovery") as span:
+        primary_keys, composite_keys, key_search = detect_primary_keys(
+            column_stats, is_unique, max_key_width, max_workers
+        )
+        span.count(objects=sum(map(len, primary_keys.values())) + sum(map(len, composite_keys.values())))
+        span.set(**key_search)
+
+    with tracer.span("fk_inference") as span:
+        foreign_keys, pruning = detect_foreign_keys(column_stats, primary_keys, coverage)
+        span.count(objects=len(foreign_keys))
+        span.set(candidates=pruning["candidates"])
+
+    return {
+        "relationships": resolve_cardinality(foreign_keys),
+        "unresolved_relationships": [],
+        "primary_keys": dict(primary_keys),
+        "composite_keys": composite_keys,
+        "key_search": key_search,
+        "candidate_pruning": pruning
+    }
+
+
+def infer_relationships(tables, tracer=None, max_key_width=MAX_KEY_WIDTH, hyper_schema=None):
+    """Run profiling, key detection and cardinality resolution over {table: DataFrame} (pandas backend)"""
+    tracer = tracer or Tracer()
+    with tracer.span("column_profiling") as span:
+        column_stats = profile_columns(tables, hyper_schema)
+        _count_profiled(span, column_stats)
+    return _relationships_from_profile(
+        column_stats, dataframe_uniqueness(tables), dataframe_coverage(tables, column_stats),
+        tracer, max_key_width
+    )
+
+
+def infer_relationships_hyper(pool, hyper_schema, extract_dir=EXTRACT_DIR, max_workers=HYPER_WORKERS,
+                              tracer=None, max_key_width=MAX_KEY_WIDTH):
+    """
+    Same inference with profiling and coverage answered by Hyper (hyper backend).
+
+    Every extract is attached to each worker connection, so coverage can
+    be checked between tables that live in different .hyper files. Each
+    candidate column's distinct values are hashed once; sketched columns
+    are verified with an exact join in Hyper. Composite keys of different
+    tables are searched concurrently, max_workers at a time.
+    """
+    tracer = tracer or Tracer()
+    aliases = extract_aliases(hyper_schema)
+    extract_paths = {alias: os.path.join(extract_dir, hf) for hf, alias in aliases.items()}
+
+    with ExtractConnections(pool, extract_paths) as connections:
+        with tracer.span("column_profiling") as span:
+            column_stats = profile_columns_hyper(connections, hyper_schema, max_workers)
+            _count_profiled(span, column_stats)
+        connection = connections.get()
+        coverage = ColumnValueIndex(
+            column_stats,
+            hyper_value_loader(connection, hyper_schema),
+            FK_COVERAGE_THRESHOLD,
+            verify=hyper_coverage(connection, hyper_schema)
+        )
+        return _relationships_from_profile(
+            column_stats, hyper_uniqueness(connections, hyper_schema, column_stats), coverage,
+            tracer, max_key_width, max_workers
+        )
+
+
+def infer_relationships_from_extract(hyper_schema, extract_dir=EXTRACT_DIR, raw_data_path=None,
+                                     backend="hyper", max_workers=HYPER_WORKERS, pool=None, tracer=None,
+                                     max_key_width=MAX_KEY_WIDTH):
+    """
+    Infer relationships with the requested profiling backend.
+
+    The hyper backend falls back to the pandas path over the exported
+    extract when Hyper rejects a profiling query and an export exists.
+    Hyper connections are borrowed from pool (a HyperPool) when given.
+    Composite keys are searched up to max_key_width columns (1 turns the
+    search off). Loading, profiling, key discovery and FK inference are
+    spans of tracer.
+    """
+    if backend not in PROFILE_BACKENDS:
+        raise ValueError(f"Unknown profiling backend: {backend}")
+
+    if backend == "hyper":
+        try:
+            with borrow_pool(pool) as hyper_pool:
+                return infer_relationships_hyper(
+                    hyper_pool, hyper_schema, extract_dir, max_workers, tracer, max_key_width
+                )
+        except HyperException:
+            if raw_data_path is None:
+                raise
+
+    tracer = tracer or Tracer()
+    with tracer.span("load_raw_data") as span:
+        tables = load_raw_data(raw_data_path, hyper_schema)
+        span.count(rows=sum(len(df) for df in tables.values()), objects=len(tables))
+        span.set(memory_mb=sum(df.memory_usage(deep=True).sum() for df in tables.values()) / 2**20)
+    return infer_relationships(tables, tracer, max_key_width, hyper_schema)
+
+
+def main(backend="hyper"):
+    with open(DATA_DIR / "parsed_hyper_schema.json", encoding="utf-8") as f:
+        hyper_schema = json.load(f)
+
+    try:
+        raw_data_path = find_raw_data(DATA_DIR)
+    except FileNotFoundError:
+        raw_data_path = None
+
+    if not Path(TWBX_PATH).exists():
+        backend = "pandas"
+
+    if backend == "hyper":
+        with WorkbookArchive(TWBX_PATH) as archive:
+            output = infer_relationships_from_extract(hyper_schema, archive.hyper_dir(), raw_data_path, backend)
+    else:
+        output = infer_relationships_from_extract(hyper_schema, EXTRACT_DIR, raw_data_path, backend)
+
+    #Save output
+    with open(DATA_DIR / "inferred_powerbi_relationships.json", "w") as f:
+        json.dump(output, f, indent=4)
 
-with open(DATA_DIR / "inferred_powerbi_relationships.json", "w") as f:
-    json.dump(output, f, indent=4)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from math import prod
+
+import numpy as np
+import pandas as pd
+
+from fk_candidates import normalize_type
+
+# Widest column combination tried as a composite key
+MAX_KEY_WIDTH = 3
+# Only this many columns per table (most distinct values first) are combined
+KEY_SEARCH_COLUMNS = 24
+# Rows hashed in the first step of the streaming uniqueness check; each
+# later step doubles, so an early duplicate is cheap and a full scan merges
+# the seen hashes only O(log n) times
+KEY_CHECK_CHUNK = 65536
+# Types never used as key columns
+NON_KEY_TYPES = {"float", "bool"}
+
+
+def distinct_upper_bound(table_stats, columns):
+    """Most distinct combinations the columns can hold, from their profiled distinct counts"""
+    row_count = next(iter(table_stats.values()))["row_count"]
+    return min(row_count, prod(table_stats[col]["distinct_count"] for col in columns))
+
+
+def unique_rows(chunks):
+    """
+    True if no row repeats across the DataFrame chunks.
+
+    Each chunk's rows are hashed (64-bit, all columns combined) and
+    checked against the sorted hashes seen so far; the scan stops at the
+    first repeated hash. A hash collision reads as a duplicate, so a key
+    can be missed but never invented.
+    """
+    seen = np.empty(0, dtype=np.uint64)
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        hashes = np.sort(pd.util.hash_pandas_object(chunk, index=False).to_numpy())
+        if (hashes[1:] == hashes[:-1]).any():
+            return False
+        if seen.size:
+            positions = np.searchsorted(seen, hashes).clip(max=seen.size - 1)
+            if (seen[positions] == hashes).any():
+                return False
+        #both runs are sorted, so the stable sort only merges them
+        seen = np.sort(np.concatenate([seen, hashes]), kind="stable")
+    return True
+
+
+def dataframe_uniqueness(tables, chunk_size=KEY_CHECK_CHUNK):
+    """is_unique(table, columns) streaming the rows of {table: DataFrame}"""
+    def chunks(frame):
+        start, size = 0, chunk_size
+        while start < len(frame):
+            yield frame.iloc[start:start + size]
+            start, size = start + size, size * 2
+
+    def is_unique(table, columns):
+        return unique_rows(chunks(tables[table][list(columns)]))
+
+    return is_unique
+
+
+def _key_columns(table_stats, max_columns):
+    """Columns that can take part in a key: no nulls, not constant, not float/bool"""
+    columns = [
+        col for col, stats in table_stats.items()
+        if stats["null_count"] == 0
+        and stats["distinct_count"] > 1
+        and normalize_type(stats["dtype"]) not in NON_KEY_TYPES
+    ]
+    columns.sort(key=lambda col: -table_stats[col]["distinct_count"])
+    return columns[:max_columns]
+
+
+def discover_table_keys(table, table_stats, is_unique, max_width=MAX_KEY_WIDTH, max_columns=KEY_SEARCH_COLUMNS):
+    """
+    Minimal keys of one table as lists of columns, plus search counters.
+
+    Single-column keys come straight from the profile (no nulls, distinct
+    count equal to the row count, not float or bool). Composite keys are only searched for
+    tables without one, level by level up to max_width columns: a
+    combination is only built from non-unique combinations one column
+    narrower (a superset of a key is not minimal), is skipped when the
+    product of its columns' distinct counts is below the row count, and
+    is otherwise checked with is_unique(table, columns).
+    """
+    counters = {"checked": 0, "pruned_bound": 0, "pruned_lattice": 0}
+    if not table_stats:
+        return [], counters
+    row_count = next(iter(table_stats.values()))["row_count"]
+
+    keys = [
+        [col] for col, stats in table_stats.items()
+        if row_count and stats["distinct_count"] == row_count and stats["null_count"] == 0
+        and normalize_type(stats["dtype"]) not in NON_KEY_TYPES
+    ]
+    if keys or row_count < 2:
+        return keys, counters
+
+    columns = _key_columns(table_stats, max_columns)
+    order = {col: i for i, col in enumerate(table_stats)}
+    non_unique = {(col,) for col in columns}
+
+    for width in range(2, max_width + 1):
+        level = set()
+        for combo in combinations(columns, width):
+            if any(subset not in non_unique for subset in combinations(combo, width - 1)):
+                counters["pruned_lattice"] += 1
+                continue
+            if distinct_upper_bound(table_stats, combo) < row_count:
+                counters["pruned_bound"] += 1
+                level.add(combo)
+                continue
+            counters["checked"] += 1
+            if is_unique(table, combo):
+                keys.append(sorted(combo, key=order.get))
+            else:
+                level.add(combo)
+        if not level:
+            break
+        non_unique = level
+
+    return keys, counters
+
+
+def discover_keys(column_stats, is_unique, max_width=MAX_KEY_WIDTH, max_workers=1):
+    """
+    Minimal keys of every table, tables searched concurrently.
+
+    Returns ({table: [key columns, ...]}, counters summed over tables).
+    """
+    tables = list(column_stats)
+
+    def discover(table):
+        return discover_table_keys(table, column_stats[table], is_unique, max_width)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        results = list(pool.map(discover, tables))
+
+    keys = {}
+    totals = {"checked": 0, "pruned_bound": 0, "pruned_lattice": 0}
+    for table, (table_keys, counters) in zip(tables, results):
+        if table_keys:
+            keys[table] = table_keys
+        for name, count in counters.items():
+            totals[name] += count
+
+    return keys, totals
@@ -0,0 +1,217 @@
+"""
+Compact intermediate representation of the final semantic model.
+
+The model the exporters consume is held in __slots__ dataclasses with
+interned table and column names, and serialized as versioned msgpack with
+a shared string table, so every name is stored once however often it is
+referenced. JSON stays the audit/debug format; the IR is what stages hand
+to each other.
+"""
+import sys
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import msgpack
+
+IR_MAGIC = "tableau-powerbi-ir"
+# Bump whenever the encoded layout changes
+IR_VERSION = 1
+
+
+class IRVersionError(ValueError):
+    pass
+
+
+@dataclass(slots=True)
+class Column:
+    name: str
+    data_type: str
+    source_column: str
+    hidden: bool = False
+
+
+@dataclass(slots=True)
+class Measure:
+    name: str
+    expression: str
+    format_string: str = "General"
+
+
+@dataclass(slots=True)
+class Table:
+    name: str
+    columns: List[Column] = field(default_factory=list)
+    measures: List[Measure] = field(default_factory=list)
+    source: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Relationship:
+    from_table: str
+    from_column: str
+    to_table: str
+    to_column: str
+    cardinality: str
+    cross_filter_direction: str
+
+
+@dataclass(slots=True)
+class SemanticModel:
+    model_type: str
+    tables: List[Table] = field(default_factory=list)
+    relationships: List[Relationship] = field(default_factory=list)
+    unplaced_measures: List[Measure] = field(default_factory=list)
+    # Audit-only sections (provenance, conversion and dead field reports)
+    metadata: dict = field(default_factory=dict)
+
+
+# ========== BUILD ==========
+def build_type_lookup(hyper_schema):
+    """(table, column) -> TOM data type from the Hyper column types"""
+    type_lookup = {}
+    for table in hyper_schema:
+        tname = table["table"]
+        for col in table["columns"]:
+            raw = col["data_type"].lower()
+            if "int" in raw:
+                dtype = "int64"
+            elif "double" in raw or "float" in raw or "numeric" in raw:
+                dtype = "double"
+            elif "date" in raw or "time" in raw:
+                dtype = "dateTime"
+            else:
+                dtype = "string"
+            type_lookup[(tname, col["column_name"])] = dtype
+    return type_lookup
+
+
+def build_model_ir(semantic_model, hyper_schema) -> SemanticModel:
+    """
+    IR of the final semantic model: column types resolved from the Hyper
+    schema, measures placed on their owning table (measure_table_map),
+    and columns the dead field pass annotated marked hidden.
+    """
+    intern = sys.intern
+    type_lookup = build_type_lookup(hyper_schema)
+
+    dead_fields = semantic_model.get("dead_fields", {})
+    hidden = dead_fields.get("columns", {}) if dead_fields.get("mode") == "annotate" else {}
+
+    tables = {}
+    for table_name, table_info in semantic_model["tables"].items():
+        name = intern(table_name)
+        hidden_columns = set(hidden.get(table_name, ()))
+        tables[name] = Table(
+            name=name,
+            columns=[
+                Column(intern(col), type_lookup.get((table_name, col), "string"), intern(col), col in hidden_columns)
+                for col in table_info["columns"]
+            ],
+            source=table_info.get("source"),
+        )
+
+    unplaced = []
+    measure_table_map = semantic_model.get("measure_table_map", {})
+    for measure_name, dax_expr in semantic_model["measures"].items():
+        measure = Measure(intern(measure_name), dax_expr)
+        target_table = measure_table_map.get(measure_name)
+        if target_table in tables:
+            tables[target_table].measures.append(measure)
+        else:
+            unplaced.append(measure)
+
+    relationships = [
+        Relationship(
+            intern(rel["from_table"]), intern(rel["from_column"]),
+            intern(rel["to_table"]), intern(rel["to_column"]),
+            rel["cardinality"], rel["cross_filter_direction"]
+        )
+        for rel in semantic_model.get("relationships", [])
+    ]
+
+    metadata = {
+        key: semantic_model[key]
+        for key in ("provenance", "conversion_report", "dead_fields")
+        if key in semantic_model
+    }
+
+    return SemanticModel(semantic_model.get("model_type", "flat_extract"), list(tables.values()),
+                         relationships, unplaced, metadata)
+
+
+# ========== ENCODE / DECODE ==========
+class _StringTable:
+    def __init__(self):
+        self.strings = []
+        self._index = {}
+
+    def ref(self, value):
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+def encode_ir(model: SemanticModel) -> bytes:
+    strings = _StringTable()
+    ref = strings.ref
+
+    tables = [
+        [
+            ref(table.name), table.source,
+            [[ref(c.name), ref(c.data_type), ref(c.source_column), c.hidden] for c in table.columns],
+            [[ref(m.name), m.expression, ref(m.format_string)] for m in table.measures],
+        ]
+        for table in model.tables
+    ]
+    relationships = [
+        [ref(r.from_table), ref(r.from_column), ref(r.to_table), ref(r.to_column),
+         ref(r.cardinality), ref(r.cross_filter_direction)]
+        for r in model.relationships
+    ]
+    unplaced = [[ref(m.name), m.expression, ref(m.format_string)] for m in model.unplaced_measures]
+
+    body = [model.model_type, tables, relationships, unplaced, model.metadata]
+    return msgpack.packb([IR_MAGIC, IR_VERSION, strings.strings, body], use_bin_type=True)
+
+
+def decode_ir(data: bytes) -> SemanticModel:
+    try:
+        magic, version, strings, body = msgpack.unpackb(data, raw=False, strict_map_key=False)
+    except (ValueError, TypeError, msgpack.UnpackException) as exc:
+        raise IRVersionError(f"Not a semantic model IR: {exc}") from exc
+    if magic != IR_MAGIC:
+        raise IRVersionError("Not a semantic model IR")
+    if version != IR_VERSION:
+        raise IRVersionError(f"IR version {version} is not supported (expected {IR_VERSION})")
+
+    s = [sys.intern(value) for value in strings]
+    model_type, tables, relationships, unplaced, metadata = body
+
+    def measure(entry):
+        return Measure(s[entry[0]], entry[1], s[entry[2]])
+
+    return SemanticModel(
+        model_type,
+        [
+            Table(
+                s[name], [Column(s[c[0]], s[c[1]], s[c[2]], c[3]) for c in columns],
+                [measure(m) for m in measures], source
+            )
+            for name, source, columns, measures in tables
+        ],
+        [Relationship(*(s[i] for i in rel)) for rel in relationships],
+        [measure(m) for m in unplaced],
+        metadata,
+    )
+
+
+def write_ir(path, model: SemanticModel):
+    with open(path, "wb") as f:
+        f.write(encode_ir(model))
+
+
+def read_ir(path) -> SemanticModel:
+    with open(path, "rb") as f:
+        return decode_ir(f.read())
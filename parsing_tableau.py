@@ -1,186 +1,316 @@
-import zipfile
 import os
+import re
 import json
-import xml.etree.ElementTree as ET
-from tableauhyperapi import HyperProcess, Connection, CreateMode, Telemetry
-import pandas as pd
+import shutil
+import threading
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from tableauhyperapi import TableName, TypeTag, HyperException, escape_string_literal
+import pyarrow as pa
+import pyarrow.parquet as pq
+from build_cache import memo
+from hyper_pool import borrow_pool
+from twbx_archive import WorkbookArchive
+from twb_stream import TwbHandler, stream_twb
+from tracing import Tracer
+from extract_relationships_from_twb import RelationshipHandler
 
 DATA_DIR = "data"
-os.makedirs(DATA_DIR, exist_ok=True)
 
 # ========== CONFIGURATION ==========
-twbx_path = 'Superstore.twbx'
-extract_dir = "twbx_extracted"
+TWBX_PATH = 'Superstore.twbx'
+EXTRACT_DIR = "twbx_extracted"
 
-# ========== PART 1: EXTRACT TWBX FILE ==========
-os.makedirs(extract_dir, exist_ok=True)
 
-with zipfile.ZipFile(twbx_path, 'r') as z:
-    file_list = z.namelist()
-    z.extractall(extract_dir)
+# ========== PART 1-2: OPEN TWBX ARCHIVE, LOCATE HYPER FILES ==========
+# The archive is read in place through twbx_archive.WorkbookArchive: the TWB
+# is streamed from its zip member, hyper files are extracted on first use.
 
-print(f"[1/9] TWBX extracted - {len(file_list)} files found")
 
-# ========== PART 2: LOCATE HYPER FILES ==========
-hyper_files = []
+# ========== PART 3: STREAM TWB FILE ==========
+# The TWB is read in a single pass (twb_stream.stream_twb); the handlers
+# below each pick out the elements one stage-1 artifact needs.
 
-for root_dir, _, files in os.walk(extract_dir):
-    for f in files:
-        if f.lower().endswith(".hyper"):
-            hyper_files.append(os.path.join(root_dir, f))
 
-if not hyper_files:
-    raise FileNotFoundError("No .hyper extract found inside TWBX")
+# ========== PART 4: PARSE DATASOURCE FIELDS AND CALCULATIONS ==========
+class SchemaHandler(TwbHandler):
+    """
+    Fields and calculations of every <datasource>, from all its <column>
+    descendants, plus a content hash of each datasource element
+    """
+    tags = None
 
-print(f"[2/9] Hyper files located - {len(hyper_files)} file(s)")
+    def __init__(self):
+        self.datasources = []
+        self._open = []
+        self._columns = []
 
-# ========== PART 3: LOCATE AND PARSE TWB FILE ==========
-twb_path = None
+    def start(self, elem, path):
+        tag = elem.tag
 
-for file in file_list:
-    if file.lower().endswith(".twb"):
-        twb_path = os.path.join(extract_dir, file)
-        break
+        if tag == "datasource":
+            self._open.append({
+                "name": elem.get("name", "Unnamed Datasource"),
+                "columns": [],
+                "hash": hashlib.sha256(),
+            })
+            self.datasources.append(self._open[-1])
+
+        if self._open:
+            token = repr((tag, sorted(elem.attrib.items()))).encode("utf-8")
+            for ds in self._open:
+                ds["hash"].update(token)
+
+        if tag == "column":
+            column = {"attributes": dict(elem.attrib), "calculation": None}
+            for ds in self._open:
+                ds["columns"].append(column)
+            self._columns.append(column)
+
+        elif tag == "calculation" and path and path[-1] == "column":
+            column = self._columns[-1]
+            if column["calculation"] is None:
+                column["calculation"] = dict(elem.attrib)
+
+    def end(self, elem, path):
+        if self._open:
+            token = repr(("/" + elem.tag, (elem.text or "").strip())).encode("utf-8")
+            for ds in self._open:
+                ds["hash"].update(token)
+
+        if elem.tag == "column":
+            self._columns.pop()
+        elif elem.tag == "datasource":
+            self._open.pop()
+
+    def schema(self):
+        datasource_details = []
+
+        for ds in self.datasources:
+            fields = []
+            calculations = []
+
+            for col in ds["columns"]:
+                attributes = col["attributes"]
+                calc = col["calculation"]
+                if calc is not None:
+                    calculations.append({
+                        "field_name": attributes.get("name"),
+                        "formula": calc.get("formula", "")
+                    })
+                else:
+                    fields.append({
+                        "field_name": attributes.get("name"),
+                        "caption": attributes.get("caption"),
+                        "role": attributes.get("role"),
+                        "data_type": attributes.get("datatype")
+                    })
+
+            datasource_details.append({
+                "datasource_name": ds["name"],
+                "fields": fields,
+                "calculations": calculations
+            })
 
-if not twb_path:
-    raise FileNotFoundError("No .twb file found inside TWBX")
+        return datasource_details
 
-# Parse TWB XML
-tree = ET.parse(twb_path)
-root = tree.getroot()
+    def hashes(self):
+        return [ds["hash"].hexdigest() for ds in self.datasources]
 
-# Extract major components
-worksheets = root.findall(".//worksheet")
-dashboards = root.findall(".//dashboard")
-datasources = root.findall(".//datasource")
 
-print(f"[3/9] TWB parsed - {len(worksheets)} worksheets, {len(dashboards)} dashboards, {len(datasources)} datasources")
+# ========== PART 5: PARSE FILTERS AND PARAMETERS ==========
+class FilterHandler(TwbHandler):
+    """Every <filter> inside a <worksheet>"""
+    tags = ("worksheet", "filter")
+
+    def __init__(self):
+        self.worksheets = []
+        self._open = []
+
+    def start(self, elem, path):
+        if elem.tag == "worksheet":
+            self._open.append((elem.get("name", "Unnamed Worksheet"), []))
+            self.worksheets.append(self._open[-1])
+            return
+
+        for ws_name, filters in self._open:
+            filters.append({
+                "worksheet": ws_name,
+                "field": elem.get("field"),
+                "column": elem.get("column"),
+                "class": elem.get("class"),
+                "expression": elem.get("expression")
+            })
 
-# ========== PART 4: PARSE DATASOURCE FIELDS AND CALCULATIONS ==========
-datasource_details = []
+    def end(self, elem, path):
+        if elem.tag == "worksheet":
+            self._open.pop()
+
+    def filters(self):
+        return [flt for _, filters in self.worksheets for flt in filters]
+
+
+class ParameterHandler(TwbHandler):
+    """Calculated columns of the "Parameters" datasource"""
+    tags = ("datasource", "column", "calculation")
+
+    def __init__(self):
+        self.parameters = []
+        self._datasources = []
+        self._columns = []
+
+    def start(self, elem, path):
+        tag = elem.tag
+
+        if tag == "datasource":
+            self._datasources.append([] if elem.get("name") == "Parameters" else None)
+            if self._datasources[-1] is not None:
+                self.parameters.append(self._datasources[-1])
+
+        elif tag == "column":
+            column = {"parameter_name": elem.get("name"), "calculation": None}
+            for params in self._datasources:
+                if params is not None:
+                    params.append(column)
+            self._columns.append(column)
+
+        elif path and path[-1] == "column":
+            column = self._columns[-1]
+            if column["calculation"] is None:
+                column["calculation"] = {"formula": elem.get("formula")}
+
+    def end(self, elem, path):
+        if elem.tag == "datasource":
+            self._datasources.pop()
+        elif elem.tag == "column":
+            self._columns.pop()
+
+    def result(self):
+        return [
+            {
+                "parameter_name": col["parameter_name"],
+                "default_value": col["calculation"]["formula"]
+            }
+            for params in self.parameters
+            for col in params
+            if col["calculation"] is not None
+        ]
 
-for ds in datasources:
-    ds_name = ds.attrib.get('name', 'Unnamed Datasource')
-    
-    fields = []
-    calculations = []
-    
-    for col in ds.findall(".//column"):
-        field_name = col.attrib.get("name")
-        field_role = col.attrib.get("role")
-        field_type = col.attrib.get("datatype")
-        
-        calc = col.find("calculation")
-        if calc is not None:
-            formula = calc.attrib.get("formula", "")
-            calculations.append({
-                "field_name": field_name,
-                "formula": formula
-            })
-        else:
-            fields.append({
-                "field_name": field_name,
-                "role": field_role,
-                "data_type": field_type
-            })
-    
-    datasource_details.append({
-        "datasource_name": ds_name,
-        "fields": fields,
-        "calculations": calculations
-    })
 
-with open(os.path.join(DATA_DIR, "parsed_tableau_schema.json"), "w", encoding="utf-8") as f:
-    json.dump(datasource_details, f, indent=4)
+# ========== PART 6: MAP FIELDS TO WORKSHEETS ==========
+class FieldUsageHandler(TwbHandler):
+    """Fields, shelf expressions and calculation formulas referenced by each worksheet"""
+    tags = ("worksheet", "encoding", "column-instance", "rows", "cols", "calculation", "dashboard")
+
+    def __init__(self):
+        self.worksheets = []
+        self.dashboards = 0
+        self._open = []
+
+    def _use(self, value):
+        if value:
+            for _, used_fields in self._open:
+                used_fields[value] = None
+
+    def start(self, elem, path):
+        tag = elem.tag
+
+        if tag == "worksheet":
+            self._open.append((elem.get("name", "Unnamed Worksheet"), {}))
+            self.worksheets.append(self._open[-1])
+        elif tag == "dashboard":
+            self.dashboards += 1
+        elif tag == "encoding":
+            self._use(elem.get("field"))
+        elif tag == "column-instance":
+            self._use(elem.get("column"))
+        elif tag == "calculation":
+            self._use(elem.get("formula"))
+
+    def end(self, elem, path):
+        if elem.tag == "worksheet":
+            self._open.pop()
+        elif elem.tag in ("rows", "cols"):
+            #Shelf contents are only complete once the element has ended
+            self._use((elem.text or "").strip())
+
+    def field_usage(self):
+        return [
+            {
+                "worksheet": ws_name,
+                "used_fields_or_calculations": list(used_fields)
+            }
+            for ws_name, used_fields in self.worksheets
+        ]
 
 
-total_fields = sum(len(ds["fields"]) for ds in datasource_details)
-total_calcs = sum(len(ds["calculations"]) for ds in datasource_details)
-print(f"[4/9] Schema parsed - {total_fields} fields, {total_calcs} calculations")
+# ========== PART 7: PARSE HYPER EXTRACT SCHEMA ==========
+HYPER_WORKERS = 4
 
-# ========== PART 5: PARSE FILTERS AND PARAMETERS ==========
-filters_output = []
-parameters_output = []
-
-for worksheet in root.findall(".//worksheet"):
-    ws_name = worksheet.attrib.get("name", "Unnamed Worksheet")
-    
-    for flt in worksheet.findall(".//filter"):
-        filters_output.append({
-            "worksheet": ws_name,
-            "field": flt.attrib.get("field"),
-            "class": flt.attrib.get("class"),
-            "expression": flt.attrib.get("expression")
-        })
-
-for ds in root.findall(".//datasource"):
-    if ds.attrib.get("name") == "Parameters":
-        for col in ds.findall(".//column"):
-            calc = col.find("calculation")
-            if calc is not None:
-                parameters_output.append({
-                    "parameter_name": col.attrib.get("name"),
-                    "default_value": calc.attrib.get("formula")
-                })
-
-with open(os.path.join(DATA_DIR, "parsed_tableau_filters.json"), "w", encoding="utf-8") as f:
-    json.dump(filters_output, f, indent=4)
-
-with open(os.path.join(DATA_DIR, "parsed_tableau_parameters.json"), "w", encoding="utf-8") as f:
-    json.dump(parameters_output, f, indent=4)
-
-print(f"[5/9] Filters & parameters parsed - {len(filters_output)} filters, {len(parameters_output)} parameters")
 
-# ========== PART 6: MAP FIELDS TO WORKSHEETS ==========
-field_usage = []
-
-for worksheet in root.findall(".//worksheet"):
-    ws_name = worksheet.attrib.get("name", "Unnamed Worksheet")
-    used_fields = set()
-    
-    for enc in worksheet.findall(".//encoding"):
-        field = enc.attrib.get("field")
-        if field:
-            used_fields.add(field)
-    
-    for calc in worksheet.findall(".//calculation"):
-        formula = calc.attrib.get("formula")
-        if formula:
-            used_fields.add(formula)
-    
-    field_usage.append({
-        "worksheet": ws_name,
-        "used_fields_or_calculations": list(used_fields)
-    })
-
-with open(os.path.join(DATA_DIR, "parsed_tableau_field_usage.json"), "w", encoding="utf-8") as f:
-    json.dump(field_usage, f, indent=4)
-
-
-total_mappings = sum(len(ws["used_fields_or_calculations"]) for ws in field_usage)
-print(f"[6/9] Field usage mapped - {total_mappings} field references across worksheets")
+def extract_aliases(hyper_schema):
+    """Stable database alias for every hyper file referenced by the schema"""
+    aliases = {}
+    for entry in hyper_schema:
+        if entry["hyper_file"] not in aliases:
+            aliases[entry["hyper_file"]] = f"extract_{len(aliases)}"
+    return aliases
 
-# ========== PART 7: PARSE HYPER EXTRACT SCHEMA ==========
-def open_hyper(hyper_path):
-    """Open a connection to the Hyper extract (read-only)"""
-    hyper = HyperProcess(
-        telemetry=Telemetry.DO_NOT_SEND_USAGE_DATA_TO_TABLEAU
-    )
 
-    connection = Connection(
-        endpoint=hyper.endpoint,
-        database=hyper_path,
-        create_mode=CreateMode.NONE  
+def hyper_table_name(entry, aliases):
+    """Fully qualified TableName of a schema entry on a connection from connect_extracts()"""
+    return TableName(
+        aliases[entry["hyper_file"]],
+        entry["schema"],
+        entry.get("source_table", entry["table"])
     )
 
-    return hyper, connection
 
+class ExtractConnections:
+    """
+    Per-thread connections to a set of extracts, borrowed from a HyperPool.
+
+    extract_paths maps database alias -> .hyper path, so tables from
+    different extracts can be queried (and joined) on the same connection.
+    Each worker thread checks out its own connection on first use, so a
+    thread pool holds at most one Hyper connection per worker; close()
+    detaches the extracts and returns the connections to the pool.
+    """
 
-def extract_hyper_schema(connection):
-    """Extract schema information from Hyper file"""
+    def __init__(self, pool, extract_paths):
+        self.pool = pool
+        self.extract_paths = extract_paths
+        self._local = threading.local()
+        self._borrowed = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.pool.acquire(self.extract_paths)
+            self._local.connection = connection
+            with self._lock:
+                self._borrowed.append(connection)
+        return connection
+
+    def close(self):
+        with self._lock:
+            for connection in self._borrowed:
+                self.pool.release(connection, self.extract_paths)
+            self._borrowed.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def extract_hyper_schema(connection, hyper_file=None, database=None):
+    """Extract schema information from Hyper file (or the attached database alias)"""
     schema_info = []
-    
-    schemas = connection.catalog.get_schema_names()
+
+    schemas = connection.catalog.get_schema_names(database)
     for schema in schemas:
         tables = connection.catalog.get_table_names(schema)
         for table in tables:
@@ -192,56 +322,225 @@ def extract_hyper_schema(connection):
                 }
                 for col in table_def.columns
             ]
-            
+
             schema_info.append({
                 "schema": schema.name.unescaped,
                 "table": table.name.unescaped,
+                "hyper_file": hyper_file,
                 "columns": columns
             })
-    
+
     return schema_info
 
-hyper, conn = open_hyper(hyper_files[0])
-schema = extract_hyper_schema(conn)
 
-with open(os.path.join(DATA_DIR, "parsed_hyper_schema.json"), "w") as f:
-    json.dump(schema, f, indent=4)
+def extract_all_hyper_schemas(pool, hyper_files, extract_dir=EXTRACT_DIR):
+    """
+    Schema of every table in every extract.
+
+    hyper_file is stored relative to extract_dir. Table names must be unique
+    across the model, so a name already taken by an earlier extract is
+    prefixed with the extract's file name and the physical name is kept in
+    source_table.
+    """
+    schema_info = []
+    seen_tables = set()
+
+    for path in hyper_files:
+        hyper_file = os.path.relpath(path, extract_dir)
+        with pool.connection({"extract": path}) as connection:
+            entries = extract_hyper_schema(connection, hyper_file, "extract")
+
+        for entry in entries:
+            if entry["table"] in seen_tables:
+                stem = os.path.splitext(os.path.basename(path))[0]
+                entry["source_table"] = entry["table"]
+                entry["table"] = f"{stem}_{entry['table']}"
+            seen_tables.add(entry["table"])
+            schema_info.append(entry)
+
+    return schema_info
+
+
+# PART 8: EXTRACT RAW DATA FROM HYPER
+EXPORT_FORMAT = "parquet"
+EXPORT_CHUNK_SIZE = 65536
+RAW_DATA_DIR = "hyper_raw_data"
+
+
+def _identity(value):
+    return value
+
+
+def _hyper_type_to_arrow(sql_type):
+    """Map a Hyper SqlType to an Arrow type and a per-value converter"""
+    tag = sql_type.tag
+
+    if tag == TypeTag.BOOL:
+        return pa.bool_(), _identity
+    if tag == TypeTag.SMALL_INT:
+        return pa.int16(), _identity
+    if tag == TypeTag.INT:
+        return pa.int32(), _identity
+    if tag in (TypeTag.BIG_INT, TypeTag.OID):
+        return pa.int64(), _identity
+    if tag in (TypeTag.DOUBLE, TypeTag.FLOAT):
+        return pa.float64(), _identity
+    if tag == TypeTag.NUMERIC:
+        return pa.decimal128(sql_type.precision, sql_type.scale), _identity
+    if tag == TypeTag.DATE:
+        return pa.date32(), lambda v: v.to_date()
+    if tag == TypeTag.TIMESTAMP:
+        return pa.timestamp("us"), lambda v: v.to_datetime()
+    if tag == TypeTag.TIMESTAMP_TZ:
+        return pa.timestamp("us", tz="UTC"), lambda v: v.to_datetime()
+    if tag == TypeTag.TIME:
+        return pa.time64("us"), _identity
+    if tag in (TypeTag.BYTES, TypeTag.TABGEOGRAPHY):
+        return pa.binary(), _identity
+    # TEXT, VARCHAR, CHAR, JSON, INTERVAL and anything new fall back to text
+    return pa.string(), lambda v: str(v)
+
+
+def _arrow_schema(table_def):
+    fields = []
+    converters = []
+    for col in table_def.columns:
+        arrow_type, convert = _hyper_type_to_arrow(col.type)
+        fields.append(pa.field(col.name.unescaped, arrow_type))
+        converters.append(convert)
+    return pa.schema(fields), converters
+
+
+def _open_batch_writer(output_path, arrow_schema, fmt):
+    if fmt == "parquet":
+        return pq.ParquetWriter(output_path, arrow_schema)
+    if fmt == "arrow":
+        return pa.ipc.new_file(output_path, arrow_schema)
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def export_table_chunked(connection, table, output_path,
+                         fmt=EXPORT_FORMAT, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream a Hyper table into a typed Parquet or Arrow IPC file.
+
+    Rows are fetched through the result cursor and flushed as one record
+    batch every chunk_size rows, so memory stays bounded by the chunk
+    rather than the table. Returns the number of rows written.
+    """
+    arrow_schema, converters = _arrow_schema(connection.catalog.get_table_definition(table))
+    column_count = len(converters)
+
+    row_count = 0
+    writer = _open_batch_writer(output_path, arrow_schema, fmt)
+    try:
+        with connection.execute_query(f'SELECT * FROM {table}') as result:
+            columns = [[] for _ in range(column_count)]
+            for row in result:
+                for i, value in enumerate(row):
+                    columns[i].append(None if value is None else converters[i](value))
+                row_count += 1
+
+                if len(columns[0]) >= chunk_size:
+                    writer.write_batch(pa.record_batch(columns, schema=arrow_schema))
+                    columns = [[] for _ in range(column_count)]
 
-total_tables = len(schema)
-total_cols = sum(len(table["columns"]) for table in schema)
-print(f"[7/9] Hyper schema extracted - {total_tables} tables, {total_cols} columns")
+            if columns and columns[0]:
+                writer.write_batch(pa.record_batch(columns, schema=arrow_schema))
+    finally:
+        writer.close()
 
-# PART 8: EXTRACT RAW DATA FROM HYPER 
-from tableauhyperapi import TableName
+    return row_count
 
-def export_table_to_df(connection, schema_name, table_name):
+
+def export_table(connection, table, output_path,
+                 fmt=EXPORT_FORMAT, chunk_size=EXPORT_CHUNK_SIZE):
     """
-    Export a Hyper table into a Pandas DataFrame
-    using the official Hyper API (no DB-API hacks).
+    Export a Hyper table to a columnar file using the official Hyper API.
+
+    Parquet is written by Hyper itself (COPY ... TO), which streams without
+    passing rows through Python. Older Hyper versions without Parquet
+    export, and Arrow IPC output, go through export_table_chunked().
+    Returns the number of rows written.
     """
-    table = TableName(schema_name, table_name)
+    if fmt == "parquet":
+        try:
+            return connection.execute_command(
+                f"COPY {table} TO {escape_string_literal(str(output_path))} "
+                f"WITH (FORMAT => 'parquet')"
+            )
+        except HyperException:
+            pass
+
+    return export_table_chunked(connection, table, output_path, fmt, chunk_size)
+
+
+def export_tables(pool, hyper_schema, output_dir, extract_dir=EXTRACT_DIR,
+                  fmt=EXPORT_FORMAT, max_workers=HYPER_WORKERS):
+    """
+    Export every table of every extract to output_dir/<table>.<fmt>.
+
+    Tables are exported concurrently, one Hyper connection per worker.
+    Returns {table: row_count}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    aliases = extract_aliases(hyper_schema)
+    extract_paths = {alias: os.path.join(extract_dir, hf) for hf, alias in aliases.items()}
+
+    with ExtractConnections(pool, extract_paths) as connections:
+        def export_entry(entry):
+            output_path = os.path.join(output_dir, f"{entry['table']}.{fmt}")
+            return export_table(connections.get(), hyper_table_name(entry, aliases), output_path, fmt)
 
-    columns = [
-        col.name.unescaped
-        for col in connection.catalog.get_table_definition(table).columns
-    ]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            row_counts = list(pool.map(export_entry, hyper_schema))
 
-    rows = []
-    with connection.execute_query(f'SELECT * FROM {table}') as result:
-        for row in result:
-            rows.append(list(row))
+    return {entry["table"]: rows for entry, rows in zip(hyper_schema, row_counts)}
 
-    return pd.DataFrame(rows, columns=columns)
-schema_name = schema[0]["schema"]
-table_name = schema[0]["table"]
 
-df = export_table_to_df(conn, schema_name, table_name)
+# PART 9: MAP LOGICAL TO PHYSICAL FIELDS
+# Extract tables carry the logical table's object id: Orders_<32 hex digits>
+_OBJECT_ID = re.compile(r"_[0-9A-Fa-f]{32}$")
+
+
+def normalize_column_name(name):
+    return name.strip().strip("[]").casefold()
+
+
+def build_column_index(hyper_schema):
+    """
+    Normalized column name -> [(schema, table, column)] over every extract
+    table. Each column is also indexed under the "column (table)" form
+    Tableau uses to disambiguate same-named columns of joined tables.
+    """
+    index = {}
+    qualified = {}
+    for table in hyper_schema:
+        table_name = _OBJECT_ID.sub("", table["table"]).casefold()
+        for col in table["columns"]:
+            pc = col["column_name"]
+            if pc:
+                target = (table["schema"], table["table"], pc)
+                name = normalize_column_name(pc)
+                index.setdefault(name, []).append(target)
+                qualified.setdefault(f"{name} ({table_name})", []).append(target)
+
+    #Real column names take precedence over the qualified form
+    for name, targets in qualified.items():
+        index.setdefault(name, targets)
+    return index
 
-df.to_csv(os.path.join(DATA_DIR, "hyper_raw_data.csv"), index=False)
 
-print(f"[8/9] Raw data exported - {len(df)} rows, {len(df.columns)} columns")
-# PART 9: MAP LOGICAL TO PHYSICAL FIELDS 
 def map_logical_to_physical(twb_fields, hyper_schema):
+    """
+    Physical column(s) behind every logical field.
+
+    Names are looked up in a column index built once (case-folded,
+    bracket-stripped, [Field (Table)] suffixes included), so mapping is
+    linear in the number of fields. A caption is mapped as an alias of the
+    field it renames.
+    """
+    index = build_column_index(hyper_schema)
     seen = set()
     mappings = []
 
@@ -251,41 +550,191 @@ def map_logical_to_physical(twb_fields, hyper_schema):
             if not lf:
                 continue
 
-            for table in hyper_schema:
-                for col in table["columns"]:
-                    pc = col["column_name"]
-                    if pc and lf.lower() == pc.lower(): 
-                        key = (lf, pc, table["table"])
-                        if key not in seen:
-                            seen.add(key)
-                            mappings.append({
-                                "logical_field": lf,
-                                "physical_column": pc,
-                                "table": table["table"],
-                                "schema": table["schema"]
-                            })
+            targets = index.get(normalize_column_name(lf), [])
+            names = [lf]
+            if field.get("caption") and normalize_column_name(field["caption"]) != normalize_column_name(lf):
+                names.append(field["caption"])
+
+            for schema_name, table_name, pc in targets:
+                for name in names:
+                    key = (name, pc, table_name)
+                    if key not in seen:
+                        seen.add(key)
+                        mappings.append({
+                            "logical_field": name,
+                            "physical_column": pc,
+                            "table": table_name,
+                            "schema": schema_name
+                        })
     return mappings
 
 
-logical_physical_map = map_logical_to_physical(datasource_details, schema)
-
-with open(os.path.join(DATA_DIR, "logical_physical_mapping.json"), "w") as f:
-    json.dump(logical_physical_map, f, indent=4)
-
-
-print(f"[9/9] Logical-physical mapping complete - {len(logical_physical_map)} mappings found")
-
-#  CLEANUP 
-conn.close()
-hyper.close()
-
-# FINAL SUMMARY
-print("PARSING COMPLETE")
-print("\nOutput Files Generated:")
-print("  1. parsed_tableau_schema.json")
-print("  2. parsed_tableau_filters.json")
-print("  3. parsed_tableau_parameters.json")
-print("  4. parsed_tableau_field_usage.json")
-print("  5. parsed_hyper_schema.json")
-print("  6. hyper_raw_data.csv")
-print("  7. logical_physical_mapping.json")
+def parse_twb_metadata(twb_file):
+    """Stages 1-2 in one streaming pass: everything derived from the XML alone"""
+    schema = SchemaHandler()
+    filters = FilterHandler()
+    parameters = ParameterHandler()
+    field_usage = FieldUsageHandler()
+    relationships = RelationshipHandler()
+    stream_twb(twb_file, [schema, filters, parameters, field_usage, relationships])
+
+    return {
+        "counts": {
+            "worksheets": len(field_usage.worksheets),
+            "dashboards": field_usage.dashboards,
+            "datasources": len(schema.datasources),
+        },
+        "datasource_hashes": schema.hashes(),
+        "schema": schema.schema(),
+        "filters": filters.filters(),
+        "parameters": parameters.result(),
+        "field_usage": field_usage.field_usage(),
+        "twb_relationships": relationships.result(verbose=False),
+    }
+
+
+def parse_workbook(archive, verbose=True, export_format=EXPORT_FORMAT,
+                   export_raw_data=True, max_workers=HYPER_WORKERS, cache=None,
+                   pool=None, tracer=None):
+    """
+    Run stages 1-3 on an open WorkbookArchive and return every parsed
+    artifact in memory.
+
+    Keys mirror the JSON artifacts written by main(); "raw_data" is the
+    directory holding one columnar export per extract table (None when
+    export_raw_data is False) and "twb_relationships" the relationships
+    declared in the XML. The raw export lives in the archive's scratch
+    directory unless it is cached, so use it before closing the archive.
+
+    With a BuildCache, each step is keyed by the content hashes of the
+    parts it reads (TWB, datasource elements, hyper files) and skipped when
+    they are unchanged; hyper files are only extracted when a step misses.
+    Hyper steps borrow connections from pool (a HyperPool) when given.
+    Each step is a span of tracer (a tracing.Tracer).
+    """
+    tracer = tracer or Tracer(verbose=verbose)
+
+    with tracer.span("open_twbx") as span:
+        span.count(objects=len(archive.hyper_members))
+        span.report(f"TWBX opened - {len(archive.hyper_members)} hyper file(s)")
+
+    def load_metadata():
+        with archive.open_twb() as twb_file:
+            return parse_twb_metadata(twb_file)
+
+    with tracer.span("twb_metadata", cache) as span:
+        metadata = memo(cache, "twb_metadata", archive.twb_hash if cache is not None else None, load_metadata)
+        counts = metadata["counts"]
+        datasource_details = metadata["schema"]
+        total_fields = sum(len(ds["fields"]) for ds in datasource_details)
+        total_calcs = sum(len(ds["calculations"]) for ds in datasource_details)
+        field_usage = metadata["field_usage"]
+        total_mappings = sum(len(ws["used_fields_or_calculations"]) for ws in field_usage)
+
+        span.count(objects=total_fields + total_calcs + len(metadata["filters"]) + len(metadata["parameters"]))
+        span.set(worksheets=counts["worksheets"], calculations=total_calcs)
+        span.report(f"TWB parsed - {counts['worksheets']} worksheets, {counts['dashboards']} dashboards, {counts['datasources']} datasources")
+        span.report(f"Schema parsed - {total_fields} fields, {total_calcs} calculations")
+        span.report(f"Filters & parameters parsed - {len(metadata['filters'])} filters, {len(metadata['parameters'])} parameters")
+        span.report(f"Field usage mapped - {total_mappings} field references across worksheets")
+
+    #hashing the extracts reads them in full: only done when there is a cache to key
+    hyper_inputs = archive.hyper_hash if cache is not None else None
+
+    with tracer.span("hyper_schema", cache) as span:
+        def load_hyper_schema():
+            hyper_files = archive.hyper_paths()
+            span.report(f"Hyper files extracted - {len(hyper_files)} file(s)")
+            with borrow_pool(pool) as hyper_pool:
+                return extract_all_hyper_schemas(hyper_pool, hyper_files, archive.hyper_dir())
+
+        schema = memo(cache, "hyper_schema", hyper_inputs, load_hyper_schema)
+        total_tables = len(schema)
+        total_cols = sum(len(table["columns"]) for table in schema)
+        span.count(objects=total_cols)
+        span.report(f"Hyper schema extracted - {total_tables} tables, {total_cols} columns")
+
+    raw_data_path = None
+    with tracer.span("raw_data_export") as span:
+        if export_raw_data:
+            if cache is None:
+                raw_data_path, exported = os.path.join(archive.scratch_dir(), RAW_DATA_DIR), False
+            else:
+                raw_data_path, exported = cache.artifact_dir("raw_data", {"hyper": hyper_inputs, "format": export_format})
+
+            if exported:
+                span.set(cached=True)
+                span.report("Raw data export unchanged - reused")
+            else:
+                with borrow_pool(pool) as hyper_pool:
+                    row_counts = export_tables(hyper_pool, schema, raw_data_path, archive.hyper_dir(), export_format, max_workers)
+                if cache is not None:
+                    cache.mark_built(raw_data_path)
+                span.count(rows=sum(row_counts.values()), objects=len(row_counts))
+                span.report(f"Raw data exported - {len(row_counts)} tables, {sum(row_counts.values())} rows")
+        else:
+            span.report("Raw data export skipped")
+
+    with tracer.span("logical_physical_mapping", cache) as span:
+        logical_physical_map = memo(
+            cache, "logical_physical_mapping",
+            {"datasources": metadata["datasource_hashes"], "hyper": hyper_inputs},
+            lambda: map_logical_to_physical(datasource_details, schema)
+        )
+        span.count(objects=len(logical_physical_map))
+        span.report(f"Logical-physical mapping complete - {len(logical_physical_map)} mappings found")
+
+    return {
+        "fingerprint": archive.fingerprint if cache is not None else None,
+        "schema": datasource_details,
+        "filters": metadata["filters"],
+        "parameters": metadata["parameters"],
+        "field_usage": field_usage,
+        "twb_relationships": metadata["twb_relationships"],
+        "hyper_schema": schema,
+        "raw_data": raw_data_path,
+        "logical_physical_mapping": logical_physical_map,
+    }
+
+
+def write_parsed_outputs(parsed, data_dir=DATA_DIR):
+    """Write the stage 1-3 artifacts produced by parse_workbook()"""
+    os.makedirs(data_dir, exist_ok=True)
+
+    outputs = {
+        "parsed_tableau_schema.json": parsed["schema"],
+        "parsed_tableau_filters.json": parsed["filters"],
+        "parsed_tableau_parameters.json": parsed["parameters"],
+        "parsed_tableau_field_usage.json": parsed["field_usage"],
+        "parsed_hyper_schema.json": parsed["hyper_schema"],
+        "logical_physical_mapping.json": parsed["logical_physical_mapping"],
+    }
+    for file_name, payload in outputs.items():
+        with open(os.path.join(data_dir, file_name), "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=4)
+
+    raw_data_path = parsed["raw_data"]
+    if raw_data_path is None:
+        return
+    shutil.copytree(raw_data_path, os.path.join(data_dir, RAW_DATA_DIR), dirs_exist_ok=True)
+
+
+def main():
+    with WorkbookArchive(TWBX_PATH) as archive:
+        parsed = parse_workbook(archive)
+        write_parsed_outputs(parsed, DATA_DIR)
+
+    # FINAL SUMMARY
+    print("PARSING COMPLETE")
+    print("\nOutput Files Generated:")
+    print("  1. parsed_tableau_schema.json")
+    print("  2. parsed_tableau_filters.json")
+    print("  3. parsed_tableau_parameters.json")
+    print("  4. parsed_tableau_field_usage.json")
+    print("  5. parsed_hyper_schema.json")
+    print(f"  6. {RAW_DATA_DIR}/<table>.{EXPORT_FORMAT}")
+    print("  7. logical_physical_mapping.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,24 @@
 import json
-from collections import defaultdict
+import re
+from collections import Counter, defaultdict
 import os
 
-print("Resolving Table Context For Measures")
-
 DATA_DIR = "data"
 INPUT_SEMANTIC_MODEL = os.path.join(DATA_DIR, "semantic_model.json")
 INPUT_MAPPING = os.path.join(DATA_DIR, "logical_physical_mapping.json")
 OUTPUT_MODEL = os.path.join(DATA_DIR, "semantic_model_with_context.json")
 
-# LOAD INPUT FILES
-with open(INPUT_SEMANTIC_MODEL, encoding="utf-8") as f:
-    semantic_model = json.load(f)
 
-with open(INPUT_MAPPING, encoding="utf-8") as f:
-    mappings = json.load(f)
+# Bracketed field references ([Field] or [Datasource].[Field]); string
+# literals and comments are matched too, so brackets inside them are skipped
+_REFERENCE_PATTERN = re.compile(r"""
+    "(?:[^"]|"")*" | '(?:[^']|'')*' | //[^\n]* | /\*.*?\*/
+  | (?P<field>\[(?:[^\]]|\]\])*\])(?:\s*\.\s*(?P<qualified>\[(?:[^\]]|\]\])*\]))?
+""", re.VERBOSE | re.DOTALL)
+
+# Worksheet column instances: derivation:Field:type (e.g. sum:Sales:qk)
+_COLUMN_INSTANCE = re.compile(r"^\w+:(.+):\w+$")
 
-print("Loaded semantic_model.json")
-print("Loaded logical_physical_mapping.json")
 
 # HELPERS
 def normalize_field_name(field: str) -> str:
@@ -26,35 +27,84 @@ def normalize_field_name(field: str) -> str:
     return field.strip().strip("[]").lower()
 
 
+def field_references(formula):
+    """
+    Normalized names of the fields a formula (or worksheet reference)
+    uses, in order of first reference.
+
+    One regex pass over the text: it needs no parse, so invalid formulas
+    resolve too. [Datasource].[Field] yields the field, and column
+    instances ([sum:Sales:qk]) the field they aggregate.
+    """
+    names = {}
+    for match in _REFERENCE_PATTERN.finditer(formula or ""):
+        reference = match.group("qualified") or match.group("field")
+        if reference is None:
+            continue
+        name = normalize_field_name(reference.replace("]]", "]"))
+        instance = _COLUMN_INSTANCE.match(name)
+        names[instance.group(1) if instance else name] = None
+    return list(names)
+
+
+class FieldResolver:
+    """
+    Table bindings for the fields formulas reference, built once per model.
+
+    References are extracted in one pass over each formula and looked up
+    by exact normalized name, so the cost does not grow with the number of
+    fields and [Sales] never binds [Sales Target].
+    """
+
+    def __init__(self, field_to_table):
+        self.field_to_table = field_to_table
+
+    def resolve(self, formula):
+        """{field: table} for every referenced field with a known table"""
+        lookup = self.field_to_table
+        return {
+            field: lookup[field]
+            for field in field_references(formula)
+            if field in lookup
+        }
+
+
 # [1/4] BUILD FIELD → TABLE LOOKUP (NORMALIZED)
-print("\n[1/4] Building field-to-table lookup...")
+def build_field_to_table(mappings, semantic_model):
+    field_to_tables = defaultdict(set)
 
-field_to_tables = defaultdict(set)
+    for m in mappings:
+        logical_field = normalize_field_name(m["logical_field"])
+        field_to_tables[logical_field].add(m["table"])
 
-for m in mappings:
-    logical_field = normalize_field_name(m["logical_field"])
-    field_to_tables[logical_field].add(m["table"])
+    field_to_table = {}
 
-field_to_table = {}
+    for field, tables in field_to_tables.items():
+        if len(tables) == 1:
+            field_to_table[field] = list(tables)[0]
+        else:
+            # Prefer fact table if ambiguous
+            fact_tables = [
+                t for t in tables
+                if semantic_model["tables"].get(t, {}).get("type") == "fact"
+            ]
+            field_to_table[field] = fact_tables[0] if fact_tables else list(tables)[0]
 
-for field, tables in field_to_tables.items():
-    if len(tables) == 1:
-        field_to_table[field] = list(tables)[0]
-    else:
-        # Prefer fact table if ambiguous
-        fact_tables = [
-            t for t in tables
-            if semantic_model["tables"].get(t, {}).get("type") == "fact"
-        ]
-        field_to_table[field] = fact_tables[0] if fact_tables else list(tables)[0]
+    return field_to_table
 
-print(f"Resolved {len(field_to_table)} field-to-table mappings")
 
+def build_field_types(datasources):
+    """Normalized field name -> Tableau data type, from the parsed TWB schema"""
+    field_types = {}
+    for ds in datasources:
+        for field in ds.get("fields", []):
+            if field.get("data_type"):
+                field_types.setdefault(normalize_field_name(field["field_name"]), field["data_type"])
+    return field_types
 
-# [2/4] ENRICH AST WITH TABLE CONTEXT
-print("\n[2/4] Enriching measure ASTs with table context...")
 
-def enrich_ast(ast):
+# [2/4] ENRICH AST WITH TABLE CONTEXT
+def enrich_ast(ast, field_to_table, resolver=None):
     node_type = ast.get("node")
 
     if node_type == "binary":
@@ -71,23 +121,14 @@ def enrich_ast(ast):
         field = normalize_field_name(ast.get("field"))
         ast["table"] = field_to_table.get(field)
 
-    elif node_type == "raw":
-        ast["table_context"] = {
-            field: table
-            for field, table in field_to_table.items()
-            if field in ast.get("formula", "").lower()
-        }
+    elif node_type in ("raw", "unsupported"):
+        resolver = resolver or FieldResolver(field_to_table)
+        ast["table_context"] = resolver.resolve(ast["formula"])
 
     return ast
 
-for name, measure in semantic_model["measures"].items():
-    measure["ast"] = enrich_ast(measure["ast"])
-
-print(f"Updated table context for {len(semantic_model['measures'])} measures")
 
 # [3/4] REGENERATE DAX WITH TABLE CONTEXT
-print("\n[3/4] Regenerating DAX expressions...")
-
 def ast_to_dax(ast):
     node_type = ast.get("node")
 
@@ -108,31 +149,75 @@ def ast_to_dax(ast):
 
     return "-- UNSUPPORTED TABLEAU LOGIC"
 
-semantic_model["dax_measures"] = {
-    name: ast_to_dax(measure["ast"])
-    for name, measure in semantic_model["measures"].items()
-}
-
-print("DAX regeneration complete")
 
 # [4/4] BUILD MEASURE → TABLE OWNERSHIP MAP
-measure_table_map = {}
+def build_measure_table_map(measures):
+    measure_table_map = {}
 
-for name, measure in semantic_model["measures"].items():
-    ast = measure["ast"]
-    node_type = ast.get("node")
+    for name, measure in measures.items():
+        ast = measure["ast"]
+        node_type = ast.get("node")
 
-    if node_type == "single":
-        measure_table_map[name] = ast.get("table")
+        if node_type == "single":
+            measure_table_map[name] = ast.get("table")
+
+        elif node_type == "binary":
+            measure_table_map[name] = ast.get("left", {}).get("table")
+
+        elif node_type in ("raw", "unsupported") and ast.get("table_context"):
+            # Most referenced table; ties go to the first referenced
+            tables = Counter(ast["table_context"].values())
+            measure_table_map[name] = tables.most_common(1)[0][0]
+
+    return measure_table_map
+
+
+def resolve_table_context(semantic_model, mappings, verbose=True):
+    """Attach table context, regenerated DAX and measure ownership to the semantic model"""
+    log = print if verbose else (lambda *args, **kwargs: None)
+
+    field_to_table = build_field_to_table(mappings, semantic_model)
+    log(f"Resolved {len(field_to_table)} field-to-table mappings")
+
+    resolver = FieldResolver(field_to_table)
+    for name, measure in semantic_model["measures"].items():
+        measure["ast"] = enrich_ast(measure["ast"], field_to_table, resolver)
+    log(f"Updated table context for {len(semantic_model['measures'])} measures")
+
+    semantic_model["dax_measures"] = {
+        name: ast_to_dax(measure["ast"])
+        for name, measure in semantic_model["measures"].items()
+    }
+    log("DAX expressions regenerated with table context")
+
+    measure_table_map = build_measure_table_map(semantic_model["measures"])
+    semantic_model["measure_table_map"] = measure_table_map
+    log(f"Measure-to-table ownership mapping complete: {len(measure_table_map)} mapped")
+
+    return semantic_model
+
+
+def main():
+    print("Resolving Table Context For Measures")
+
+    # LOAD INPUT FILES
+    with open(INPUT_SEMANTIC_MODEL, encoding="utf-8") as f:
+        semantic_model = json.load(f)
+
+    with open(INPUT_MAPPING, encoding="utf-8") as f:
+        mappings = json.load(f)
+
+    print("Loaded semantic_model.json")
+    print("Loaded logical_physical_mapping.json")
+
+    semantic_model = resolve_table_context(semantic_model, mappings)
 
-    elif node_type == "binary":
-        measure_table_map[name] = ast.get("left", {}).get("table")
+    # SAVE OUTPUT
+    with open(OUTPUT_MODEL, "w", encoding="utf-8") as f:
+        json.dump(semantic_model, f, indent=4)
 
-semantic_model["measure_table_map"] = measure_table_map
-print(f"Measure-to-table ownership mapping complete: {len(measure_table_map)} mapped")
+    print("\nsemantic_model_with_context.json written to data/")
 
-# SAVE OUTPUT
-with open(OUTPUT_MODEL, "w", encoding="utf-8") as f:
-    json.dump(semantic_model, f, indent=4)
 
-print("\nsemantic_model_with_context.json written to data/")
+if __name__ == "__main__":
+    main()
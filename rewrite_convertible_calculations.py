@@ -1,51 +1,348 @@
 import json
-import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from tableau_formula import parse_formula, referenced_fields, Literal, Field, Call, Unary, Binary, If, Case
+from calculation_graph import (
+    build_calculation_graph, find_cycles, topological_levels, live_calculations, worksheet_references
+)
+from resolve_table_context import normalize_field_name
 DATA_DIR = Path("data")
 CLASSIFICATION_FILE = DATA_DIR / "calculation_classification.json"
+FIELD_USAGE_FILE = DATA_DIR / "parsed_tableau_field_usage.json"
+FILTERS_FILE = DATA_DIR / "parsed_tableau_filters.json"
+PARAMETERS_FILE = DATA_DIR / "parsed_tableau_parameters.json"
 OUTPUT_FILE = DATA_DIR / "converted_dax_measures.json"
 
-with open(CLASSIFICATION_FILE, encoding="utf-8") as f:
-    calculations = json.load(f)
 
-converted = {}
-skipped = []
+# Tableau functions with a DAX counterpart taking the same arguments; any
+# other function has no translation and the calculation is skipped
+DAX_FUNCTIONS = {
+    "SUM": "SUM", "AVG": "AVERAGE", "MIN": "MIN", "MAX": "MAX", "COUNT": "COUNT",
+    "COUNTD": "DISTINCTCOUNT", "ATTR": "SELECTEDVALUE",
+    "ABS": "ABS", "SQRT": "SQRT", "EXP": "EXP", "LN": "LN", "LOG": "LOG", "POWER": "POWER", "SIGN": "SIGN",
+    "INT": "INT", "DIV": "QUOTIENT", "IIF": "IF", "IFNULL": "COALESCE", "ISNULL": "ISBLANK",
+    "YEAR": "YEAR", "QUARTER": "QUARTER", "MONTH": "MONTH", "DAY": "DAY",
+    "UPPER": "UPPER", "LOWER": "LOWER", "TRIM": "TRIM", "LEN": "LEN", "LEFT": "LEFT", "RIGHT": "RIGHT",
+}
+# Aggregates over an expression rather than a column iterate the table
+DAX_ITERATORS = {"SUM": "SUMX", "AVG": "AVERAGEX", "MIN": "MINX", "MAX": "MAXX", "COUNT": "COUNTX"}
+# Arguments DAX requires where Tableau has a default
+DAX_DEFAULT_ARGS = {"ROUND": "0", "CEILING": "1", "FLOOR": "1"}
+# Tableau function -> (min args, max args); checked before translation
+FUNCTION_ARITY = {"IIF": (3, 3), "IFNULL": (2, 2), "MID": (3, 3), "LOG": (1, 2), "DIV": (2, 2), "LEFT": (2, 2),
+                  "RIGHT": (2, 2), "POWER": (2, 2), "ROUND": (1, 2), "CEILING": (1, 1), "FLOOR": (1, 1)}
+DAX_OPERATORS = {"==": "=", "!=": "<>", "AND": "&&", "OR": "||"}
+DATE_PARTS = {"year": "YEAR", "quarter": "QUARTER", "month": "MONTH", "day": "DAY",
+              "hour": "HOUR", "minute": "MINUTE", "second": "SECOND"}
+DATEDIFF_UNITS = {"year", "quarter", "month", "week", "day", "hour", "minute", "second"}
+STRING_FUNCTIONS = {"STR", "LEFT", "RIGHT", "MID", "UPPER", "LOWER", "TRIM", "LTRIM", "RTRIM", "REPLACE"}
+
+# Binding power of DAX operators, used to decide where parentheses go
+_DAX_POWER = {"||": 10, "&&": 20, "=": 40, "<>": 40, "<": 40, "<=": 40, ">": 40, ">=": 40,
+              "&": 45, "+": 50, "-": 50, "*": 60, "/": 60, "^": 70}
+
+
+def _is_string(node, field_types=None):
+    if isinstance(node, Literal):
+        return node.type == "string"
+    if isinstance(node, Field):
+        return (field_types or {}).get(normalize_field_name(node.name)) == "string"
+    if isinstance(node, Call):
+        if node.name in ("MIN", "MAX", "ATTR", "IFNULL") and node.args:
+            return _is_string(node.args[0], field_types)
+        if node.name == "IIF" and len(node.args) > 1:
+            return _is_string(node.args[1], field_types)
+        return node.name in STRING_FUNCTIONS
+    if isinstance(node, Binary):
+        return node.op == "+" and (_is_string(node.left, field_types) or _is_string(node.right, field_types))
+    if isinstance(node, If):
+        return _is_string(node.branches[0][1], field_types)
+    if isinstance(node, Case):
+        return _is_string(node.whens[0][1], field_types)
+    return False
+
+
+def _dax_op(node, field_types):
+    return "&" if node.op == "+" and _is_string(node, field_types) else DAX_OPERATORS.get(node.op, node.op)
+
 
-def rewrite_to_dax(formula: str):
-   #Only for simple aggregations
-    dax = formula
+def _dax_string(value):
+    return '"' + value.replace('"', '""') + '"'
 
-    # Replace Tableau aggregations with DAX equivalents
-    dax = re.sub(r"\bSUM\s*\(", "SUM(", dax, flags=re.IGNORECASE)
-    dax = re.sub(r"\bAVG\s*\(", "AVERAGE(", dax, flags=re.IGNORECASE)
-    dax = re.sub(r"\bCOUNTD\s*\(", "DISTINCTCOUNT(", dax, flags=re.IGNORECASE)
 
-    # Tableau date functions → DAX
-    dax = dax.replace("YEAR(", "YEAR(")
-    dax = dax.replace("DATEDIFF('day'", "DATEDIFF(")
+def _dax_table(name):
+    return "'" + name.replace("'", "''") + "'"
 
+
+def _dax_operand(node, field_to_table, field_types, parent_power, right_side=False):
+    dax = ast_to_dax_expression(node, field_to_table, field_types)
+    if isinstance(node, Binary) and node.op != "%":
+        power = _DAX_POWER[_dax_op(node, field_types)]
+        if power < parent_power or (right_side and power == parent_power):
+            return f"({dax})"
     return dax
 
-for calc in calculations:
-    name = calc["calculation_name"]
-    classification = calc["classification"]
+
+def _iterated_table(node, field_to_table):
+    """Table an X-iterator runs over: the one table every field of node belongs to"""
+    tables = {(field_to_table or {}).get(normalize_field_name(field.name)) for field in referenced_fields(node)}
+    if len(tables) != 1 or None in tables:
+        raise ValueError("No single table to iterate for an aggregate over an expression")
+    return tables.pop()
+
+
+def _dax_aggregate(node, field_to_table, field_types):
+    name, arg = node.name, node.args[0]
+    dax_arg = ast_to_dax_expression(arg, field_to_table, field_types)
+    if isinstance(arg, Field):
+        # An unqualified reference under an aggregate is a calculation, not a column
+        if field_to_table is not None and normalize_field_name(arg.name) not in field_to_table:
+            raise ValueError(f"{name} over [{arg.name}], which is not a column")
+        return f"{DAX_FUNCTIONS[name]}({dax_arg})"
+    if name not in DAX_ITERATORS:
+        raise ValueError(f"No DAX equivalent for {name} over an expression")
+    return f"{DAX_ITERATORS[name]}({_dax_table(_iterated_table(arg, field_to_table))}, {dax_arg})"
+
+
+def _dax_call(node, field_to_table, field_types):
+    name, args = node.name, node.args
+    arity = FUNCTION_ARITY.get(name)
+    if arity and not arity[0] <= len(args) <= arity[1]:
+        raise ValueError(f"No DAX equivalent for {name} with {len(args)} argument(s)")
+
+    if name in DAX_ITERATORS or name in ("COUNTD", "ATTR"):
+        if len(args) == 1:
+            return _dax_aggregate(node, field_to_table, field_types)
+        if name not in ("MIN", "MAX") or len(args) != 2:
+            raise ValueError(f"No DAX equivalent for {name} with {len(args)} argument(s)")
+
+    dax_args = [ast_to_dax_expression(arg, field_to_table, field_types) for arg in args]
+    if name == "ZN" and len(args) == 1:
+        return f"COALESCE({dax_args[0]}, 0)"
+    if name == "STR" and len(args) == 1:
+        return f'FORMAT({dax_args[0]}, "General Number")'
+    if name in DAX_DEFAULT_ARGS:
+        return f"{name}({', '.join(dax_args + [DAX_DEFAULT_ARGS[name]][len(args) - 1:])})"
+    if name == "MID":
+        return f"MID({', '.join(dax_args)})"
+    if name in ("DATEDIFF", "DATEPART") and args and isinstance(args[0], Literal) and args[0].type == "string":
+        unit = args[0].value.lower()
+        if name == "DATEDIFF" and len(args) == 3 and unit in DATEDIFF_UNITS:
+            return f"DATEDIFF({dax_args[1]}, {dax_args[2]}, {unit.upper()})"
+        if name == "DATEPART" and len(args) == 2 and unit in DATE_PARTS:
+            return f"{DATE_PARTS[unit]}({dax_args[1]})"
+    if name not in DAX_FUNCTIONS:
+        raise ValueError(f"No DAX equivalent for {name}")
+    return f"{DAX_FUNCTIONS[name]}({', '.join(dax_args)})"
+
+
+def ast_to_dax_expression(node, field_to_table=None, field_types=None):
+    """
+    DAX text for a Tableau formula AST (row-level and aggregate syntax only).
+
+    With field_to_table (normalized field name -> table), column references
+    are qualified with their table and aggregates over expressions become
+    X-iterators over it. field_types (normalized field name -> Tableau
+    data type) tells string concatenation (&) from addition. Raises
+    ValueError for anything without a DAX translation.
+    """
+    if isinstance(node, Literal):
+        if node.type == "string":
+            return _dax_string(node.value)
+        if node.type == "boolean":
+            return "TRUE()" if node.value else "FALSE()"
+        if node.type == "null":
+            return "BLANK()"
+        if node.type == "date":
+            return f"DATEVALUE({_dax_string(node.value)})"
+        return node.value
+
+    if isinstance(node, Field):
+        table = (field_to_table or {}).get(normalize_field_name(node.name))
+        if table:
+            return f"{_dax_table(table)}[{node.name}]"
+        return f"[{node.name}]"
+
+    if isinstance(node, Call):
+        return _dax_call(node, field_to_table, field_types)
+
+    if isinstance(node, Unary):
+        if node.op == "NOT":
+            return f"NOT({ast_to_dax_expression(node.operand, field_to_table, field_types)})"
+        return f"{node.op}{_dax_operand(node.operand, field_to_table, field_types, _DAX_POWER['^'] + 1)}"
+
+    if isinstance(node, Binary):
+        if node.op == "%":
+            left = ast_to_dax_expression(node.left, field_to_table, field_types)
+            right = ast_to_dax_expression(node.right, field_to_table, field_types)
+            return f"MOD({left}, {right})"
+        op = _dax_op(node, field_types)
+        power = _DAX_POWER[op]
+        # Nested powers are always parenthesized, their grouping differs between engines
+        left = _dax_operand(node.left, field_to_table, field_types, power, right_side=op == "^")
+        right = _dax_operand(node.right, field_to_table, field_types, power, right_side=True)
+        return f"{left} {op} {right}"
+
+    if isinstance(node, If):
+        dax = ast_to_dax_expression(node.otherwise, field_to_table, field_types) if node.otherwise is not None else None
+        for condition, result in reversed(node.branches):
+            parts = [ast_to_dax_expression(condition, field_to_table, field_types),
+                     ast_to_dax_expression(result, field_to_table, field_types)]
+            if dax is not None:
+                parts.append(dax)
+            dax = f"IF({', '.join(parts)})"
+        return dax
+
+    if isinstance(node, Case):
+        parts = [ast_to_dax_expression(node.subject, field_to_table, field_types)]
+        for value, result in node.whens:
+            parts += [ast_to_dax_expression(value, field_to_table, field_types),
+                      ast_to_dax_expression(result, field_to_table, field_types)]
+        if node.otherwise is not None:
+            parts.append(ast_to_dax_expression(node.otherwise, field_to_table, field_types))
+        return f"SWITCH({', '.join(parts)})"
+
+    raise ValueError(f"No DAX equivalent for {type(node).__name__} nodes")
+
+
+def rewrite_to_dax(formula: str, field_to_table=None, field_types=None):
+    #Only for simple aggregations
+    return ast_to_dax_expression(parse_formula(formula), field_to_table, field_types)
+
+
+# Classifications a calculation inherits from the calculations it references
+INHERITED_CLASSIFICATIONS = ("lod_expression", "table_calculation", "parameter_driven")
+# Levels smaller than this are translated on the calling thread
+PARALLEL_LEVEL_SIZE = 64
+
+
+def _translate(calc, deps, results, names, field_to_table, field_types, formula_cache):
+    """(classification, note, dax) of one calculation, given its dependencies' results"""
+    classification, note = calc["classification"], calc["note"]
     formula = calc["formula"]
 
-    if classification == "simple_aggregation":
-        converted[name] = rewrite_to_dax(formula)
-    else:
+    if classification not in INHERITED_CLASSIFICATIONS:
+        inherited = [dep for dep in sorted(deps) if results[dep][0] in INHERITED_CLASSIFICATIONS]
+        if inherited:
+            classification, note, _ = results[inherited[0]]
+            return classification, f"{note} (via {names[inherited[0]]})", None
+        if classification == "unknown" and any(results[dep][0] == "simple_aggregation" for dep in deps):
+            # Row-level syntax over measures is itself a measure
+            classification, note = "simple_aggregation", "directly convertible"
+
+    if classification != "simple_aggregation":
+        return classification, note, None
+
+    if formula_cache is not None and calc["classification"] == "simple_aggregation":
+        compiled = formula_cache.compile(formula, field_to_table, field_types)
+        return classification, compiled.note, compiled.dax
+    try:
+        return classification, note, rewrite_to_dax(formula, field_to_table, field_types)
+    except ValueError as exc:
+        # Reported as the skip reason; nothing half-translated is exported
+        return calc["classification"], str(exc), None
+
+
+def rewrite_calculations(calculations, field_to_table=None, formula_cache=None,
+                         used_fields=None, max_workers=1, field_types=None):
+    """
+    Rewrite every convertible calculation to DAX.
+
+    Calculations are translated in dependency order (calculation_graph),
+    one level of mutually independent calculations at a time, max_workers
+    threads per level. A calculation referencing a table calculation, LOD
+    or parameter-driven calculation inherits that classification from the
+    memoized result of its dependency; one referencing converted measures
+    becomes a measure itself. Calculations in or behind a reference cycle
+    are skipped.
+
+    With used_fields (worksheet_references of the workbook), calculations
+    no worksheet, filter or parameter reaches are skipped without being
+    translated.
+
+    field_to_table qualifies column references with their table and
+    field_types (build_field_types) marks string fields, whose + is
+    translated to &. Calculations with no DAX translation are skipped with
+    the reason. With a FormulaCache, formulas already compiled for the
+    same field context are not parsed or rewritten again.
+    """
+    graph = build_calculation_graph(calculations)
+    first = {}
+    for calc in calculations:
+        first.setdefault(normalize_field_name(calc["calculation_name"]), calc)
+    names = {key: calc["calculation_name"] for key, calc in first.items()}
+
+    live = set(graph) if used_fields is None else live_calculations(graph, calculations, used_fields)
+    cyclic = {name for cycle in find_cycles(graph) for name in cycle}
+    levels, blocked = topological_levels(graph, live)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for level in levels:
+            def translate(name):
+                return _translate(first[name], graph[name], results, names, field_to_table, field_types, formula_cache)
+
+            if max_workers > 1 and len(level) >= PARALLEL_LEVEL_SIZE:
+                results.update(zip(level, executor.map(translate, level)))
+            else:
+                results.update((name, translate(name)) for name in level)
+
+    reasons = {name: "circular reference" if name in cyclic else "depends on a circular reference" for name in blocked}
+
+    converted = {}
+    skipped = []
+
+    for calc in calculations:
+        name = calc["calculation_name"]
+        key = normalize_field_name(name)
+
+        if key not in live:
+            reason = "not used by any worksheet"
+        elif key in reasons:
+            reason = reasons[key]
+        else:
+            _, reason, dax = results[key]
+            if dax is not None:
+                converted[name] = dax
+                continue
+
         skipped.append({
             "calculation_name": name,
-            "reason": calc["note"]
+            "reason": reason
         })
 
-output = {
-    "converted_measures": converted,
-    "skipped_measures": skipped,
-}
+    return {
+        "converted_measures": converted,
+        "skipped_measures": skipped,
+    }
+
+
+def main():
+    with open(CLASSIFICATION_FILE, encoding="utf-8") as f:
+        calculations = json.load(f)
+
+    used_fields = None
+    if FIELD_USAGE_FILE.exists():
+        with open(FIELD_USAGE_FILE, encoding="utf-8") as f:
+            field_usage = json.load(f)
+        filters = []
+        if FILTERS_FILE.exists():
+            with open(FILTERS_FILE, encoding="utf-8") as f:
+                filters = json.load(f)
+        parameters = []
+        if PARAMETERS_FILE.exists():
+            with open(PARAMETERS_FILE, encoding="utf-8") as f:
+                parameters = json.load(f)
+        used_fields = worksheet_references(field_usage, filters, parameters)
+
+    output = rewrite_calculations(calculations, used_fields=used_fields)
+
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=4)
+
+    print(f"\nConverted measures written to {OUTPUT_FILE}")
+    print(f"Converted: {len(output['converted_measures'])} | Skipped: {len(output['skipped_measures'])}")
 
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(output, f, indent=4)
 
-print(f"\nConverted measures written to {OUTPUT_FILE}")
-print(f"Converted: {len(converted)} | Skipped: {len(skipped)}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Single-process driver for the Tableau → Power BI compilation pipeline.
+
+Every stage is imported as a function and intermediate results are passed
+in memory. The data/*.json artifacts of the individual stage scripts are
+only written when audit output is requested.
+
+Usage:
+    python run_pipeline.py Superstore.twbx
+    python run_pipeline.py Superstore.twbx --audit --data-dir data
+    python run_pipeline.py Superstore.twbx --cache-dir .build_cache
+    python run_pipeline.py Superstore.twbx --tmdl powerbi_tmdl
+    python run_pipeline.py Superstore.twbx --trace trace --profile
+    python run_pipeline.py Superstore.twbx --verify-measures --data-dir data
+"""
+import argparse
+import json
+import os
+
+from build_cache import BuildCache, memo, CACHE_DIR
+from twbx_archive import WorkbookArchive
+from hyper_pool import borrow_pool
+from parsing_tableau import parse_workbook, write_parsed_outputs, HYPER_WORKERS
+from classify_tableau_calculations import classify_calculations
+from rewrite_convertible_calculations import rewrite_calculations
+from calculation_graph import worksheet_references
+from infer_relationships_from_hyper import infer_relationships_from_extract
+from key_discovery import MAX_KEY_WIDTH
+from build_semantic_model import build_semantic_model
+from resolve_table_context import resolve_table_context, build_field_to_table, build_field_types
+from formula_cache import FormulaCache, FORMULA_CACHE_FILE
+from build_canonical_powerbi_model import build_canonical_model
+from eliminate_dead_fields import eliminate_dead_fields, DEAD_FIELD_MODES
+from finalize_powerbi_semantic_model import finalize_model
+from export_powerbi_tom import tom_from_ir, write_tom, TomModel
+from model_ir import SemanticModel, build_model_ir, write_ir
+from tracing import Tracer
+from verify_measures import verify_measures as verify_converted_measures
+
+DATA_DIR = "data"
+TRACE_DIR = "trace"
+
+
+def write_artifact(data_dir, file_name, payload, indent=4):
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, file_name), "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=indent)
+
+
+def compile_model(twbx_path, audit=False, data_dir=DATA_DIR,
+                  extract_dir=None, verbose=False,
+                  profile_backend="hyper", max_workers=HYPER_WORKERS,
+                  cache_dir=None, pool=None, unused_fields="drop", tracer=None,
+                  max_key_width=MAX_KEY_WIDTH, verify_measures=False) -> SemanticModel:
+    """
+    Compile a Tableau workbook into the final semantic model IR (stages
+    1-10), ready for write_tom or tom_from_ir.
+
+    With audit=True every intermediate artifact is written to data_dir under
+    the same file names the standalone stage scripts use. Artifacts are
+    written as soon as they are produced because later stages enrich some
+    of them in place.
+
+    profile_backend selects where column profiling runs: "hyper" answers
+    it with aggregate queries inside Hyper, "pandas" loads the exported
+    extract. The raw extract is only exported when it is needed. Every
+    table of every .hyper file is profiled, max_workers at a time. Tables
+    without a single-column key are searched for composite keys of up to
+    max_key_width columns.
+
+    The workbook is read in place: the TWB streams from the archive and
+    hyper files are only extracted once a Hyper stage runs, into
+    extract_dir or a temporary directory removed once relationships are
+    inferred.
+
+    With cache_dir, stage outputs are stored under content hashes of the
+    TWB, its datasources, each calculation and each .hyper file, and
+    reused on the next compile when those are unchanged. Compiled formulas
+    go to a SQLite FormulaCache in the same directory, shared by every
+    workbook compiled against it. The stages after relationship inference
+    only reshape small in-memory models and always run.
+
+    unused_fields controls the dead field pass over the canonical model:
+    "drop" removes columns, tables, measures and relationships no
+    worksheet, filter or parameter reaches, "annotate" keeps them listed
+    (and hidden in TOM), "keep" skips the pass.
+
+    Every Hyper stage borrows connections from pool, a HyperPool the batch
+    runner keeps open per worker. Without one, a pool is opened for this
+    compile; its HyperProcess only starts if a Hyper stage actually runs.
+
+    Every stage is a span of tracer (a tracing.Tracer); without one, a
+    tracer that only prints progress when verbose is used.
+
+    With verify_measures=True the extract is exported and every converted
+    measure is evaluated with Tableau and DAX semantics at each worksheet
+    grain (verify_measures.py); the comparison is written to
+    data_dir/measure_verification.json.
+    """
+    tracer = tracer or Tracer(verbose=verbose)
+    cache = BuildCache(cache_dir) if cache_dir else None
+
+    with WorkbookArchive(twbx_path, extract_dir) as archive, borrow_pool(pool) as pool:
+        # Stages 1-3: TWB parsing, Hyper access, logical-physical mapping
+        with tracer.span("parse", cache):
+            parsed = parse_workbook(
+                archive, verbose=verbose,
+                export_raw_data=audit or verify_measures or profile_backend == "pandas", max_workers=max_workers,
+                cache=cache, pool=pool, tracer=tracer
+            )
+            if audit:
+                write_parsed_outputs(parsed, data_dir)
+
+        # Stage 9 (model skeleton): tables, types and measure ASTs
+        with tracer.span("semantic_model") as span:
+            twb_relationships = parsed["twb_relationships"]
+            semantic_model = build_semantic_model(parsed["hyper_schema"], parsed["schema"], twb_relationships)
+            if audit:
+                write_artifact(data_dir, "semantic_model.json", semantic_model)
+            field_to_table = build_field_to_table(parsed["logical_physical_mapping"], semantic_model)
+            span.count(objects=len(semantic_model["tables"]) + len(semantic_model["measures"]))
+
+        # Stage 5-6: calculation classification and safe DAX rewriting
+        formula_cache = FormulaCache(os.path.join(cache_dir, FORMULA_CACHE_FILE)) if cache_dir else None
+        try:
+            with tracer.span("classification", formula_cache=formula_cache) as span:
+                classification = classify_calculations(parsed["schema"], formula_cache, field_to_table)
+                span.count(objects=len(classification))
+
+            with tracer.span("calculation_rewrite", formula_cache=formula_cache) as span:
+                used_fields = worksheet_references(parsed["field_usage"], parsed["filters"], parsed["parameters"])
+                #only "drop" skips unused calculations here; keep and annotate leave them to the dead field pass
+                conversion = rewrite_calculations(
+                    classification, field_to_table, formula_cache,
+                    used_fields=used_fields if unused_fields == "drop" else None, max_workers=max_workers,
+                    field_types=build_field_types(parsed["schema"])
+                )
+                span.count(objects=len(conversion["converted_measures"]))
+        finally:
+            if formula_cache is not None:
+                formula_cache.close()
+
+        # Stages 7-8: relationships from XML and from data
+        def infer():
+            return infer_relationships_from_extract(
+                parsed["hyper_schema"], archive.hyper_dir(), parsed["raw_data"], profile_backend, max_workers,
+                pool=pool, tracer=tracer, max_key_width=max_key_width
+            )
+
+        with tracer.span("relationship_inference", cache) as span:
+            relationship_inputs = None if cache is None else {
+                "hyper": parsed["fingerprint"]["hyper"], "backend": profile_backend, "max_key_width": max_key_width
+            }
+            relationship_data = memo(cache, "inferred_relationships", relationship_inputs, infer)
+            span.count(objects=len(relationship_data["relationships"]))
+
+        # Measure check: converted DAX against Tableau semantics over the extract
+        if verify_measures:
+            with tracer.span("measure_verification") as span:
+                verification = verify_converted_measures(
+                    conversion, classification, parsed["field_usage"], parsed["logical_physical_mapping"],
+                    parsed["raw_data"], verbose=False
+                )
+                write_artifact(data_dir, "measure_verification.json", verification)
+                summary = verification["summary"]
+                span.count(rows=summary["rows_scanned"], objects=summary["measures"])
+                span.report(f"Measure semantics verified - {summary['semantics_match']} match, "
+                            f"{summary['semantics_mismatch']} mismatch, {summary['not_evaluated']} not evaluated")
+
+        if audit:
+            write_artifact(data_dir, "calculation_classification.json", classification)
+            write_artifact(data_dir, "converted_dax_measures.json", conversion)
+            write_artifact(data_dir, "relationships_from_twb.json", twb_relationships)
+            write_artifact(data_dir, "inferred_powerbi_relationships.json", relationship_data)
+
+    # Stage 9: table context resolution
+    with tracer.span("table_context") as span:
+        context_model = resolve_table_context(
+            semantic_model, parsed["logical_physical_mapping"], verbose=False
+        )
+        if audit:
+            write_artifact(data_dir, "semantic_model_with_context.json", context_model)
+        span.count(objects=len(context_model["measure_table_map"]))
+        span.report(f"Table context resolved - {len(context_model['measure_table_map'])} measures mapped to tables")
+
+    # Stages 4 and 10: canonical and final semantic model
+    with tracer.span("canonical_model") as span:
+        canonical_model = build_canonical_model(
+            parsed["hyper_schema"], context_model, relationship_data, verbose=verbose
+        )
+        canonical_model = eliminate_dead_fields(
+            canonical_model, classification, used_fields, parsed["logical_physical_mapping"],
+            context_model["measure_table_map"], mode=unused_fields, verbose=verbose
+        )
+        if audit:
+            write_artifact(data_dir, "canonical_powerbi_model.json", canonical_model)
+        span.count(objects=sum(len(table["columns"]) for table in canonical_model["tables"].values()))
+
+    with tracer.span("final_model") as span:
+        final_model = finalize_model(canonical_model, context_model, conversion, verbose=verbose)
+        model_ir = build_model_ir(final_model, parsed["hyper_schema"])
+        if audit:
+            write_artifact(data_dir, "final_powerbi_semantic_model.json", final_model)
+            write_ir(os.path.join(data_dir, "final_powerbi_semantic_model.ir"), model_ir)
+        span.count(objects=len(model_ir.tables) + len(model_ir.relationships))
+
+    if audit and cache is not None:
+        report = cache.report()
+        report["formula_cache"] = formula_cache.stats
+        write_artifact(data_dir, "build_cache_report.json", report)
+
+    return model_ir
+
+
+def write_outputs(model_ir, output, audit=False, data_dir=DATA_DIR, tmdl_dir=None, verbose=False, tracer=None):
+    """
+    Stage 11: stream the TOM model to output, plus the audit copies
+    (powerbi_tom_model.json, Model.json) and the TMDL folder, in one pass.
+    """
+    tracer = tracer or Tracer(verbose=verbose)
+    tom_paths = [output]
+    model_json_paths = []
+    if audit:
+        audit_tom = os.path.join(data_dir, "powerbi_tom_model.json")
+        if os.path.abspath(audit_tom) != os.path.abspath(output):
+            tom_paths.append(audit_tom)
+        model_json_paths.append(os.path.join(data_dir, "Model.json"))
+
+    with tracer.span("export") as span:
+        write_tom(model_ir, tom_paths, model_json_paths, tmdl_dir, verbose=verbose)
+        span.count(objects=len(tom_paths) + len(model_json_paths) + (tmdl_dir is not None))
+
+
+def compile_workbook(twbx_path, audit=False, data_dir=DATA_DIR, verbose=False, **options) -> TomModel:
+    """
+    Compile a Tableau workbook into a Power BI TOM model, returned as a
+    dict. options are those of compile_model. With audit=True the TOM
+    exports are also written to data_dir.
+    """
+    model_ir = compile_model(twbx_path, audit=audit, data_dir=data_dir, verbose=verbose, **options)
+    if audit:
+        write_outputs(model_ir, os.path.join(data_dir, "powerbi_tom_model.json"), audit, data_dir)
+    return tom_from_ir(model_ir, verbose=verbose)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a Tableau workbook into a Power BI TOM model")
+    parser.add_argument("twbx_path", help="Path to the .twbx workbook")
+    parser.add_argument("--audit", action="store_true",
+                        help="Write every intermediate artifact to the data directory")
+    parser.add_argument("--data-dir", default=DATA_DIR,
+                        help="Directory for audit artifacts (default: data)")
+    parser.add_argument("--output", default=None,
+                        help="Where to write the TOM model (default: <data-dir>/powerbi_tom_model.json)")
+    parser.add_argument("--profile-backend", choices=["hyper", "pandas"], default="hyper",
+                        help="Run column profiling inside Hyper (default) or in pandas")
+    parser.add_argument("--workers", type=int, default=HYPER_WORKERS,
+                        help="Concurrent Hyper connections for export and profiling")
+    parser.add_argument("--max-key-width", type=int, default=MAX_KEY_WIDTH,
+                        help=f"Widest composite key searched for (default: {MAX_KEY_WIDTH}, 1 turns it off)")
+    parser.add_argument("--extract-dir", default=None,
+                        help="Keep extracted hyper files here (default: temporary directory)")
+    parser.add_argument("--cache-dir", nargs="?", const=CACHE_DIR, default=None,
+                        help="Reuse stage outputs whose inputs are unchanged (default dir: .build_cache)")
+    parser.add_argument("--unused-fields", choices=DEAD_FIELD_MODES, default="drop",
+                        help="Drop, annotate (hide) or keep fields no worksheet uses (default: drop)")
+    parser.add_argument("--tmdl", default=None, metavar="DIR",
+                        help="Also write the model as a TMDL folder")
+    parser.add_argument("--trace", default=None, metavar="DIR",
+                        help="Write per-stage spans as trace.jsonl and trace.chrome.json to DIR")
+    parser.add_argument("--profile", action="store_true",
+                        help="Also run each stage under cProfile (DIR/profiles/<stage>.pstats)")
+    parser.add_argument("--verify-measures", action="store_true",
+                        help="Evaluate converted measures against the extract (data-dir/measure_verification.json)")
+    parser.add_argument("--quiet", action="store_true", help="Suppress stage progress output")
+    args = parser.parse_args()
+
+    trace_dir = args.trace or (TRACE_DIR if args.profile else None)
+    tracer = Tracer(verbose=not args.quiet,
+                    profile_dir=os.path.join(trace_dir, "profiles") if args.profile else None)
+
+    model_ir = compile_model(
+        args.twbx_path, audit=args.audit, data_dir=args.data_dir, verbose=not args.quiet,
+        profile_backend=args.profile_backend, max_workers=args.workers,
+        extract_dir=args.extract_dir, cache_dir=args.cache_dir, unused_fields=args.unused_fields,
+        tracer=tracer, max_key_width=args.max_key_width, verify_measures=args.verify_measures
+    )
+
+    output = args.output or os.path.join(args.data_dir, "powerbi_tom_model.json")
+    write_outputs(model_ir, output, args.audit, args.data_dir, args.tmdl, verbose=not args.quiet, tracer=tracer)
+
+    print(f"\nPower BI TOM model written to {output}")
+    if args.tmdl:
+        print(f"TMDL folder written to {args.tmdl}")
+    if trace_dir:
+        tracer.write(trace_dir)
+        print(f"Stage trace written to {trace_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+"""
+Synthetic Tableau workbooks for benchmarking.
+
+Generates a .twbx with a configurable number of datasources, extract
+tables, rows, worksheets, filters, parameters and (nested) calculated
+fields. Each datasource is one .hyper extract holding a fact table with
+foreign keys into its dimension tables, in a star (every dimension hangs
+off the fact table) or snowflake (dimensions chain off each other)
+layout. Table names carry Tableau's object-id suffix, and a key column
+shared by two tables gets the "Column (Table)" name Tableau gives it, so
+the generated workbook exercises the same code paths as a real one.
+
+Tables are generated with NumPy, written as Parquet and loaded into Hyper
+with external(), so multi-million row extracts take seconds. With
+raw_data_dir the Parquet files are kept there under the hyper_raw_data
+layout (one <table>.parquet each), ready for the pandas profiling path.
+
+Usage:
+    python synthetic_workbook.py synthetic.twbx --rows 100000 --calculations 200
+    python synthetic_workbook.py synthetic.twbx --datasources 3 --tables 8 --fk-structure snowflake
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import uuid
+import zipfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from lxml import etree
+from tableauhyperapi import Connection, CreateMode, TableName, escape_string_literal
+
+from hyper_pool import start_hyper
+
+TABLE_NAMES = ["Orders", "Customers", "Products", "Stores", "Regions", "Suppliers",
+               "Campaigns", "Channels", "Warehouses", "Employees", "Promotions", "Carriers"]
+FK_STRUCTURES = ("star", "snowflake")
+EXTRACT_SCHEMA = "Extract"
+#Each dimension holds this share of its parent's rows (at least MIN_DIMENSION_ROWS)
+DIMENSION_RATIO = 0.05
+MIN_DIMENSION_ROWS = 10
+CATEGORY_COUNT = 12
+START_DATE = np.datetime64("2020-01-01")
+
+TWB_TYPES = {"int64": "integer", "string": "string", "double": "real", "date32[day]": "date"}
+
+
+# ========== SPECIFICATION ==========
+def object_id(seed, *parts):
+    """Deterministic 32 hex digit object id, as Tableau appends to extract tables"""
+    return uuid.uuid5(uuid.NAMESPACE_OID, "/".join(str(p) for p in (seed,) + parts)).hex.upper()
+
+
+def table_names(count):
+    return [
+        TABLE_NAMES[i % len(TABLE_NAMES)] + (f" {i // len(TABLE_NAMES) + 1}" if i >= len(TABLE_NAMES) else "")
+        for i in range(count)
+    ]
+
+
+def datasource_spec(index, tables, rows, measures, fk_structure, seed):
+    """
+    Tables of one datasource: the fact table first, then its dimensions,
+    each with its key, foreign keys and row count
+    """
+    names = table_names(tables)
+    fact = names[0]
+    spec = []
+    for position, name in enumerate(names):
+        if position == 0:
+            parent = None
+            table_rows = rows
+        else:
+            parent = fact if fk_structure == "star" or position == 1 else names[position - 1]
+            parent_rows = next(t["rows"] for t in spec if t["name"] == parent)
+            table_rows = max(MIN_DIMENSION_ROWS, int(parent_rows * DIMENSION_RATIO))
+        spec.append({
+            "name": name,
+            "hyper_table": f"{name.replace(' ', '_')}_{object_id(seed, index, name)}",
+            "rows": table_rows,
+            "key": f"{name} Key",
+            "parent": parent,
+            "measures": measures if position == 0 else 1,
+        })
+
+    #Foreign keys: every table references the tables that hang off it
+    for table in spec:
+        table["references"] = [t for t in spec if t["parent"] == table["name"]]
+    return spec
+
+
+# ========== EXTRACT DATA ==========
+def generate_table(table, rng):
+    """pyarrow Table for one spec entry"""
+    n = table["rows"]
+    prefix = table["name"]
+    columns = {table["key"]: pa.array(np.arange(n, dtype=np.int64))}
+
+    for ref in table["references"]:
+        columns[ref["key"]] = pa.array(rng.integers(0, ref["rows"], n, dtype=np.int64))
+
+    categories = pa.array([f"{prefix} Category {i + 1}" for i in range(CATEGORY_COUNT)])
+    columns[f"{prefix} Category"] = categories.take(pa.array(rng.integers(0, CATEGORY_COUNT, n)))
+    if table["parent"] is not None:
+        columns[f"{prefix} Name"] = pa.array([f"{prefix} {i + 1}" for i in range(n)])
+
+    for m in range(table["measures"]):
+        columns[f"{prefix} Amount {m + 1}"] = pa.array(np.round(rng.gamma(2.0, 50.0, n), 2))
+    if table["parent"] is None:
+        columns["Quantity"] = pa.array(rng.integers(1, 15, n, dtype=np.int64))
+        columns["Order Date"] = pa.array(START_DATE + rng.integers(0, 4 * 365, n).astype("timedelta64[D]"))
+
+    return pa.table(columns)
+
+
+def write_hyper(tables, hyper_path, parquet_dir):
+    """
+    Load every {hyper table name: pyarrow Table} into one .hyper file.
+    The Parquet copies stay in parquet_dir.
+    """
+    os.makedirs(parquet_dir, exist_ok=True)
+    with start_hyper() as hyper, Connection(hyper.endpoint, hyper_path, CreateMode.CREATE_AND_REPLACE) as connection:
+        connection.catalog.create_schema(EXTRACT_SCHEMA)
+        for name, data in tables.items():
+            parquet_path = os.path.join(parquet_dir, f"{name}.parquet")
+            pq.write_table(data, parquet_path)
+            connection.execute_command(
+                f"CREATE TABLE {TableName(EXTRACT_SCHEMA, name)} AS "
+                f"(SELECT * FROM external({escape_string_literal(os.path.abspath(parquet_path))}))"
+            )
+
+
+# ========== WORKBOOK XML ==========
+def field_names(spec, schemas):
+    """
+    (table, physical column) -> logical field name. A column name already
+    used by an earlier table becomes "Column (Table)", as in Tableau.
+    """
+    names = {}
+    taken = set()
+    for table in spec:
+        for column in schemas[table["name"]].names:
+            name = column if column not in taken else f"{column} ({table['name']})"
+            taken.add(column)
+            names[(table["name"], column)] = name
+    return names
+
+
+class CalculationGenerator:
+    """
+    Calculated fields of one datasource. A calculation of depth d only
+    references calculations of depth d - 1, so depth bounds the longest
+    dependency chain. Kinds cover every classification: aggregations, row
+    level expressions, LOD expressions, table calculations and
+    parameter-driven calculations.
+    """
+
+    KINDS = ["aggregate", "aggregate", "ratio", "row", "row", "lod", "table", "parameter"]
+
+    def __init__(self, rng, measures, dimensions, parameters, seed, datasource):
+        self.rng = rng
+        self.measures = measures
+        self.dimensions = dimensions
+        self.parameters = parameters
+        self.seed = seed
+        self.datasource = datasource
+        #depth -> [(name, is_aggregate)]
+        self.by_depth = {}
+
+    def _pick(self, values):
+        return values[int(self.rng.integers(len(values)))]
+
+    def _base(self, kind):
+        m1, m2 = self._pick(self.measures), self._pick(self.measures)
+        if kind == "aggregate":
+            return self._pick([f"SUM([{m1}])", f"AVG([{m1}])", f"COUNTD([{self._pick(self.dimensions)}])"]), True
+        if kind == "ratio":
+            return f"SUM([{m1}]) / SUM([{m2}])", True
+        if kind == "row":
+            return self._pick([f"[{m1}] * [{m2}]", f"IF [{m1}] > [{m2}] THEN [{m1}] ELSE [{m2}] END"]), False
+        if kind == "lod":
+            return f"{{FIXED [{self._pick(self.dimensions)}]: SUM([{m1}])}}", False
+        if kind == "table":
+            return f"RUNNING_SUM(SUM([{m1}]))", True
+        if not self.parameters:
+            return f"MAX([{m1}])", True
+        return f"IF [Parameters].[{self._pick(self.parameters)}] > 0 THEN SUM([{m1}]) ELSE 0 END", True
+
+    def _nested(self, depth):
+        (a, a_agg), (b, b_agg) = self._pick(self.by_depth[depth - 1]), self._pick(self.by_depth[depth - 1])
+        if a_agg and b_agg:
+            return f"[{a}] + [{b}]", True
+        if not a_agg and not b_agg:
+            return self._pick([(f"[{a}] - [{b}]", False), (f"SUM([{a}])", True)])
+        return f"SUM([{a if not a_agg else b}])", True
+
+    def generate(self, count, max_depth):
+        calculations = []
+        max_depth = max(1, max_depth)
+        for i in range(count):
+            depth = int(self.rng.integers(max_depth)) if i >= max_depth else i
+            depth = min(depth, len(self.by_depth))
+            if depth == 0:
+                formula, aggregate = self._base(self._pick(self.KINDS))
+            else:
+                formula, aggregate = self._nested(depth)
+            name = f"Calculation_{int(object_id(self.seed, self.datasource, 'calc', i)[:15], 16)}"
+            self.by_depth.setdefault(depth, []).append((name, aggregate))
+            calculations.append({"name": name, "caption": f"Calc {i + 1}", "formula": formula,
+                                 "aggregate": aggregate})
+        return calculations
+
+
+def _column_instance(name, kind):
+    derivation, prefix, suffix = ("Sum", "sum", "qk") if kind == "measure" else ("None", "none", "nk")
+    return derivation, f"[{prefix}:{name}:{suffix}]"
+
+
+def build_twb(datasources, worksheets, filters_per_worksheet, parameters, rng):
+    """lxml tree of the workbook: datasources, parameters, worksheets with shelves and filters, dashboards"""
+    workbook = etree.Element("workbook", {"source-build": "synthetic", "version": "18.1"})
+    sources = etree.SubElement(workbook, "datasources")
+
+    if parameters:
+        params = etree.SubElement(sources, "datasource", {"hasconnection": "false", "inline": "true",
+                                                          "name": "Parameters", "version": "18.1"})
+        for i in range(parameters):
+            column = etree.SubElement(params, "column", {
+                "caption": f"Parameter {i + 1}", "datatype": "integer", "name": f"[Parameter {i + 1}]",
+                "param-domain-type": "any", "role": "measure", "type": "quantitative", "value": str(i + 1),
+            })
+            etree.SubElement(column, "calculation", {"class": "tableau", "formula": str(i + 1)})
+
+    for ds in datasources:
+        datasource = etree.SubElement(sources, "datasource", {"caption": ds["name"], "inline": "true",
+                                                              "name": ds["name"], "version": "18.1"})
+        connection = etree.SubElement(datasource, "connection", {"class": "federated"})
+        collection = etree.SubElement(connection, "relation", {"type": "collection"})
+        for table in ds["spec"]:
+            relation = etree.SubElement(collection, "relation", {
+                "name": table["name"], "table": f"[{table['name']}$]", "type": "table",
+            })
+            columns = etree.SubElement(relation, "columns", {"header": "yes"})
+            for ordinal, field in enumerate(ds["schemas"][table["name"]]):
+                etree.SubElement(columns, "column", {
+                    "datatype": TWB_TYPES[str(field.type)], "name": field.name, "ordinal": str(ordinal),
+                })
+
+        cols = etree.SubElement(connection, "cols")
+        for (table_name, column), name in ds["fields"].items():
+            etree.SubElement(cols, "map", {"key": f"[{name}]", "value": f"[{table_name}].[{column}]"})
+
+        for calc in ds["calculations"]:
+            column = etree.SubElement(datasource, "column", {
+                "caption": calc["caption"], "datatype": "real", "name": f"[{calc['name']}]",
+                "role": "measure", "type": "quantitative",
+            })
+            etree.SubElement(column, "calculation", {"class": "tableau", "formula": calc["formula"]})
+
+        extract = etree.SubElement(datasource, "extract", {"enabled": "true", "units": "records"})
+        hyper = etree.SubElement(extract, "connection", {
+            "class": "hyper", "dbname": ds["hyper_file"], "schema": EXTRACT_SCHEMA, "tablename": "Extract",
+        })
+        hyper_tables = etree.SubElement(hyper, "relation", {"type": "collection"})
+        for table in ds["spec"]:
+            etree.SubElement(hyper_tables, "relation", {
+                "name": table["hyper_table"], "table": f"[{EXTRACT_SCHEMA}].[{table['hyper_table']}]", "type": "table",
+            })
+
+        graph = etree.SubElement(datasource, "object-graph")
+        objects = etree.SubElement(graph, "objects")
+        for table in ds["spec"]:
+            etree.SubElement(objects, "object", {"caption": table["name"], "id": table["hyper_table"]})
+        relationships = etree.SubElement(graph, "relationships")
+        by_name = {table["name"]: table for table in ds["spec"]}
+        for table in ds["spec"]:
+            if table["parent"] is None:
+                continue
+            parent = by_name[table["parent"]]
+            relationship = etree.SubElement(relationships, "relationship")
+            expression = etree.SubElement(relationship, "expression", {"op": "="})
+            etree.SubElement(expression, "expression", {"op": f"[{ds['fields'][(parent['name'], table['key'])]}]"})
+            etree.SubElement(expression, "expression", {"op": f"[{ds['fields'][(table['name'], table['key'])]}]"})
+            etree.SubElement(relationship, "first-end-point", {"object-id": parent["hyper_table"]})
+            etree.SubElement(relationship, "second-end-point", {"object-id": table["hyper_table"]})
+
+    sheets = etree.SubElement(workbook, "worksheets")
+    names = []
+    for w in range(worksheets):
+        ds = datasources[w % len(datasources)]
+        name = f"Sheet {w + 1}"
+        names.append(name)
+        sheet = etree.SubElement(sheets, "worksheet", {"name": name})
+        table = etree.SubElement(sheet, "table")
+        view = etree.SubElement(table, "view")
+        view_sources = etree.SubElement(view, "datasources")
+        etree.SubElement(view_sources, "datasource", {"caption": ds["name"], "name": ds["name"]})
+        dependencies = etree.SubElement(view, "datasource-dependencies", {"datasource": ds["name"]})
+
+        dimensions = list(rng.choice(ds["dimensions"], size=min(len(ds["dimensions"]), int(rng.integers(1, 4))), replace=False))
+        measures = list(rng.choice(ds["measures"], size=min(len(ds["measures"]), int(rng.integers(1, 3))), replace=False))
+        calcs = [ds["calculations"][int(i)] for i in rng.choice(len(ds["calculations"]), size=min(len(ds["calculations"]), int(rng.integers(0, 4))), replace=False)] if ds["calculations"] else []
+
+        shelf = {"rows": [], "cols": []}
+        for field_name, kind in [(d, "dimension") for d in dimensions] + [(m, "measure") for m in measures]:
+            etree.SubElement(dependencies, "column", {"datatype": "string" if kind == "dimension" else "real",
+                                                      "name": f"[{field_name}]", "role": kind})
+            derivation, instance = _column_instance(field_name, kind)
+            etree.SubElement(dependencies, "column-instance", {"column": f"[{field_name}]", "derivation": derivation,
+                                                               "name": instance, "pivot": "key"})
+            shelf["rows" if kind == "dimension" else "cols"].append(f"[{ds['name']}].{instance}")
+        for calc in calcs:
+            column = etree.SubElement(dependencies, "column", {"caption": calc["caption"], "datatype": "real",
+                                                               "name": f"[{calc['name']}]", "role": "measure"})
+            etree.SubElement(column, "calculation", {"class": "tableau", "formula": calc["formula"]})
+            derivation, instance = ("User", f"[usr:{calc['name']}:qk]") if calc["aggregate"] else _column_instance(calc["name"], "measure")
+            etree.SubElement(dependencies, "column-instance", {"column": f"[{calc['name']}]", "derivation": derivation,
+                                                               "name": instance, "pivot": "key"})
+            shelf["cols"].append(f"[{ds['name']}].{instance}")
+
+        for f in range(filters_per_worksheet):
+            dimension = ds["dimensions"][int(rng.integers(len(ds["dimensions"])))]
+            level = f"[none:{dimension}:nk]"
+            flt = etree.SubElement(view, "filter", {"class": "categorical", "column": f"[{ds['name']}].{level}"})
+            etree.SubElement(flt, "groupfilter", {"function": "member", "level": level, "member": f'"{dimension} {f + 1}"'})
+
+        etree.SubElement(table, "rows").text = " / ".join(shelf["rows"])
+        etree.SubElement(table, "cols").text = " + ".join(shelf["cols"])
+
+    dashboards = etree.SubElement(workbook, "dashboards")
+    for d in range(0, len(names), 10):
+        dashboard = etree.SubElement(dashboards, "dashboard", {"name": f"Dashboard {d // 10 + 1}"})
+        zones = etree.SubElement(dashboard, "zones")
+        for name in names[d:d + 10]:
+            etree.SubElement(zones, "zone", {"name": name})
+
+    return etree.ElementTree(workbook)
+
+
+# ========== WORKBOOK ==========
+def generate_workbook(output, datasources=1, tables=3, rows=10_000, measures=3, worksheets=10,
+                      filters_per_worksheet=1, calculations=20, calculation_depth=3, parameters=2,
+                      fk_structure="star", seed=0, raw_data_dir=None, verbose=True):
+    """
+    Write a synthetic .twbx to output and return a summary of what it holds.
+
+    rows is the fact table size of each datasource; dimension tables hold
+    DIMENSION_RATIO of their parent's rows. calculations and worksheets
+    are per workbook, spread over the datasources.
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+
+    if fk_structure not in FK_STRUCTURES:
+        raise ValueError(f"Unknown FK structure {fk_structure!r}, expected one of {FK_STRUCTURES}")
+
+    rng = np.random.default_rng(seed)
+    parameter_names = [f"Parameter {i + 1}" for i in range(parameters)]
+    scratch = tempfile.mkdtemp(prefix="synthetic_")
+
+    try:
+        sources = []
+        hyper_files = []
+        for d in range(datasources):
+            name = f"Synthetic {d + 1}"
+            spec = datasource_spec(d, tables, rows, measures, fk_structure, seed)
+            data = {table["name"]: generate_table(table, rng) for table in spec}
+            schemas = {table_name: table_data.schema for table_name, table_data in data.items()}
+
+            hyper_file = f"Data/Extracts/synthetic_{d + 1}.hyper"
+            hyper_path = os.path.join(scratch, hyper_file)
+            os.makedirs(os.path.dirname(hyper_path), exist_ok=True)
+            write_hyper({t["hyper_table"]: data[t["name"]] for t in spec}, hyper_path,
+                        raw_data_dir or os.path.join(scratch, "parquet"))
+            hyper_files.append(hyper_file)
+            log(f"{name}: {len(spec)} tables, {sum(t['rows'] for t in spec)} rows")
+
+            fields = field_names(spec, schemas)
+            measure_fields = [fields[(t["name"], c)] for t in spec for c in schemas[t["name"]].names if "Amount" in c]
+            dimension_fields = [fields[(t["name"], c)] for t in spec for c in schemas[t["name"]].names
+                                if "Category" in c or c.endswith(" Name")]
+            calcs = CalculationGenerator(rng, measure_fields, dimension_fields, parameter_names, seed, d).generate(
+                calculations // datasources + (1 if d < calculations % datasources else 0), calculation_depth
+            )
+            sources.append({
+                "name": name, "spec": spec, "schemas": schemas, "fields": fields, "hyper_file": hyper_file,
+                "measures": measure_fields, "dimensions": dimension_fields, "calculations": calcs,
+            })
+            del data
+
+        tree = build_twb(sources, worksheets, filters_per_worksheet, parameters, rng)
+        twb_path = os.path.join(scratch, "synthetic.twb")
+        tree.write(twb_path, encoding="utf-8", xml_declaration=True, pretty_print=True)
+
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as z:
+            z.write(twb_path, "synthetic.twb")
+            for hyper_file in hyper_files:
+                z.write(os.path.join(scratch, hyper_file), hyper_file, compress_type=zipfile.ZIP_STORED)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    summary = {
+        "datasources": datasources,
+        "tables": datasources * tables,
+        "rows": sum(t["rows"] for ds in sources for t in ds["spec"]),
+        "calculations": sum(len(ds["calculations"]) for ds in sources),
+        "worksheets": worksheets,
+        "filters": worksheets * filters_per_worksheet,
+        "parameters": parameters,
+        "fk_structure": fk_structure,
+        "bytes": os.path.getsize(output),
+    }
+    log(f"Synthetic workbook written to {output} ({summary['bytes'] / 1e6:.1f} MB)")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Tableau workbook")
+    parser.add_argument("output", help="Path of the .twbx to write")
+    parser.add_argument("--datasources", type=int, default=1)
+    parser.add_argument("--tables", type=int, default=3, help="Tables per datasource (fact + dimensions)")
+    parser.add_argument("--rows", type=int, default=10_000, help="Fact table rows per datasource")
+    parser.add_argument("--measures", type=int, default=3, help="Amount columns of each fact table")
+    parser.add_argument("--worksheets", type=int, default=10)
+    parser.add_argument("--filters", type=int, default=1, help="Filters per worksheet")
+    parser.add_argument("--calculations", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=3, help="Longest chain of calculations referencing each other")
+    parser.add_argument("--parameters", type=int, default=2)
+    parser.add_argument("--fk-structure", choices=FK_STRUCTURES, default="star")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--raw-data-dir", default=None,
+                        help="Also keep the tables as Parquet here (hyper_raw_data layout)")
+    args = parser.parse_args()
+
+    generate_workbook(
+        args.output, args.datasources, args.tables, args.rows, args.measures, args.worksheets,
+        args.filters, args.calculations, args.depth, args.parameters, args.fk_structure, args.seed,
+        args.raw_data_dir
+    )
+
+
+if __name__ == "__main__":
+    main()
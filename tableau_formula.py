@@ -0,0 +1,320 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Any, Optional, Tuple
+
+# Parsed formulas kept in memory, keyed by formula text
+PARSE_CACHE_SIZE = 65536
+
+
+class FormulaSyntaxError(ValueError):
+    pass
+
+
+# ========== AST NODES ==========
+class Literal(NamedTuple):
+    value: Any
+    type: str  # "number", "string", "date", "boolean" or "null"
+
+
+class Field(NamedTuple):
+    name: str
+    datasource: Optional[str] = None
+
+
+class Call(NamedTuple):
+    name: str
+    args: Tuple
+
+
+class Unary(NamedTuple):
+    op: str
+    operand: Any
+
+
+class Binary(NamedTuple):
+    op: str
+    left: Any
+    right: Any
+
+
+class If(NamedTuple):
+    branches: Tuple  # ((condition, result), ...)
+    otherwise: Any
+
+
+class Case(NamedTuple):
+    subject: Any
+    whens: Tuple  # ((value, result), ...)
+    otherwise: Any
+
+
+class Lod(NamedTuple):
+    kind: str  # "FIXED", "INCLUDE" or "EXCLUDE"
+    dimensions: Tuple
+    expr: Any
+
+
+# ========== TOKENIZER ==========
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<field>\[(?:[^\]]|\]\])*\])
+  | (?P<string>"(?:[^"]|"")*"|'(?:[^']|'')*')
+  | (?P<date>\#[^#]*\#)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op><=|>=|==|!=|<>|[-+*/%^=<>(),{}:.])
+""", re.VERBOSE | re.DOTALL)
+
+
+def tokenize(formula):
+    """(kind, value, position) tuples; identifiers are upper-cased"""
+    tokens = []
+    pos = 0
+    match = _TOKEN_PATTERN.match
+    while pos < len(formula):
+        m = match(formula, pos)
+        if m is None:
+            raise FormulaSyntaxError(f"Unexpected character {formula[pos]!r} at {pos}")
+        kind = m.lastgroup
+        if kind == "ident":
+            tokens.append((kind, m.group().upper(), pos))
+        elif kind != "ws" and kind != "comment":
+            tokens.append((kind, m.group(), pos))
+        pos = m.end()
+    tokens.append(("end", None, pos))
+    return tokens
+
+
+# ========== PARSER ==========
+# Binding power of infix operators (higher binds tighter)
+_INFIX = {
+    "OR": 10, "AND": 20,
+    "=": 40, "==": 40, "!=": 40, "<>": 40, "<": 40, "<=": 40, ">": 40, ">=": 40,
+    "+": 50, "-": 50,
+    "*": 60, "/": 60, "%": 60,
+    "^": 70,
+}
+_PREFIX_NOT = 30
+_PREFIX_SIGN = 80
+LOD_KINDS = ("FIXED", "INCLUDE", "EXCLUDE")
+
+
+def _unquote(text):
+    quote = text[0]
+    return text[1:-1].replace(quote * 2, quote)
+
+
+def _field_name(text):
+    return text[1:-1].replace("]]", "]")
+
+
+class _Parser:
+    """Pratt parser over the token list of one formula"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def at(self, value):
+        kind, token_value, _ = self.tokens[self.pos]
+        return token_value == value and kind in ("op", "ident")
+
+    def expect(self, value):
+        kind, token_value, pos = self.next()
+        if token_value != value or kind not in ("op", "ident"):
+            raise FormulaSyntaxError(f"Expected {value} at {pos}, found {token_value!r}")
+
+    def parse(self):
+        node = self.expression(0)
+        kind, value, pos = self.peek()
+        if kind != "end":
+            raise FormulaSyntaxError(f"Unexpected {value!r} at {pos}")
+        return node
+
+    def expression(self, min_power):
+        left = self.prefix()
+        while True:
+            kind, value, _ = self.peek()
+            power = _INFIX.get(value) if kind in ("op", "ident") else None
+            if power is None or power <= min_power:
+                return left
+            self.next()
+            # ^ is right-associative, everything else left-associative
+            right = self.expression(power - 1 if value == "^" else power)
+            left = Binary(value, left, right)
+
+    def prefix(self):
+        kind, value, pos = self.next()
+        if kind == "end":
+            raise FormulaSyntaxError(f"Unexpected end of formula at {pos}")
+
+        if kind == "number":
+            return Literal(value, "number")
+        if kind == "string":
+            return Literal(_unquote(value), "string")
+        if kind == "date":
+            return Literal(value[1:-1].strip(), "date")
+        if kind == "field":
+            if self.at(".") and self.tokens[self.pos + 1][0] == "field":
+                self.next()
+                return Field(_field_name(self.next()[1]), _field_name(value))
+            return Field(_field_name(value))
+
+        if kind == "op":
+            if value == "(":
+                node = self.expression(0)
+                self.expect(")")
+                return node
+            if value in ("-", "+"):
+                return Unary(value, self.expression(_PREFIX_SIGN))
+            if value == "{":
+                return self.lod()
+
+        if kind == "ident":
+            if value == "IF":
+                return self.if_expression()
+            if value == "CASE":
+                return self.case_expression()
+            if value == "NOT":
+                return Unary("NOT", self.expression(_PREFIX_NOT))
+            if value in ("TRUE", "FALSE"):
+                return Literal(value == "TRUE", "boolean")
+            if value == "NULL":
+                return Literal(None, "null")
+            if self.at("("):
+                return self.call(value)
+
+        raise FormulaSyntaxError(f"Unexpected {value!r} at {pos}")
+
+    def call(self, name):
+        self.expect("(")
+        args = []
+        if not self.at(")"):
+            args.append(self.expression(0))
+            while self.at(","):
+                self.next()
+                args.append(self.expression(0))
+        self.expect(")")
+        return Call(name, tuple(args))
+
+    def if_expression(self):
+        branches = []
+        condition = self.expression(0)
+        self.expect("THEN")
+        branches.append((condition, self.expression(0)))
+
+        otherwise = None
+        while True:
+            if self.at("ELSEIF"):
+                self.next()
+                condition = self.expression(0)
+                self.expect("THEN")
+                branches.append((condition, self.expression(0)))
+            elif self.at("ELSE"):
+                self.next()
+                otherwise = self.expression(0)
+            else:
+                self.expect("END")
+                return If(tuple(branches), otherwise)
+
+    def case_expression(self):
+        subject = self.expression(0)
+        whens = []
+        otherwise = None
+        while self.at("WHEN"):
+            self.next()
+            value = self.expression(0)
+            self.expect("THEN")
+            whens.append((value, self.expression(0)))
+        if not whens:
+            raise FormulaSyntaxError("CASE without WHEN")
+        if self.at("ELSE"):
+            self.next()
+            otherwise = self.expression(0)
+        self.expect("END")
+        return Case(subject, tuple(whens), otherwise)
+
+    def lod(self):
+        kind = "FIXED"
+        dimensions = []
+        if self.peek()[1] in LOD_KINDS and self.peek()[0] == "ident":
+            kind = self.next()[1]
+            if not self.at(":"):
+                dimensions.append(self.expression(0))
+                while self.at(","):
+                    self.next()
+                    dimensions.append(self.expression(0))
+            self.expect(":")
+        expr = self.expression(0)
+        self.expect("}")
+        return Lod(kind, tuple(dimensions), expr)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_cached(formula):
+    try:
+        return _Parser(tokenize(formula)).parse(), None
+    except FormulaSyntaxError as exc:
+        return None, str(exc)
+
+
+def parse_formula(formula):
+    """
+    Parse a Tableau calculation into an AST.
+
+    Results are memoized by formula text, so classification, DAX rewriting
+    and table-context resolution share one parse per formula. ASTs are
+    immutable tuples. Raises FormulaSyntaxError for invalid formulas.
+    """
+    node, error = _parse_cached(formula or "")
+    if error is not None:
+        raise FormulaSyntaxError(error)
+    return node
+
+
+# ========== TRAVERSAL ==========
+def children(node):
+    if isinstance(node, (Literal, Field)):
+        return ()
+    if isinstance(node, Call):
+        return node.args
+    if isinstance(node, Unary):
+        return (node.operand,)
+    if isinstance(node, Binary):
+        return (node.left, node.right)
+    if isinstance(node, If):
+        nodes = [part for branch in node.branches for part in branch]
+        return nodes + [node.otherwise] if node.otherwise is not None else nodes
+    if isinstance(node, Case):
+        nodes = [node.subject] + [part for when in node.whens for part in when]
+        return nodes + [node.otherwise] if node.otherwise is not None else nodes
+    if isinstance(node, Lod):
+        return node.dimensions + (node.expr,)
+    return ()
+
+
+def walk(node):
+    """Every node of the tree, parents before children"""
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(children(current)))
+
+
+def referenced_fields(node):
+    """Field nodes in order of first reference"""
+    return list(dict.fromkeys(n for n in walk(node) if isinstance(n, Field)))
+
+
+def called_functions(node):
+    return {n.name for n in walk(node) if isinstance(n, Call)}
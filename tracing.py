@@ -0,0 +1,191 @@
+"""
+Per-stage tracing for the pipeline.
+
+A Tracer records one span per stage (and per step inside a stage): wall
+time, CPU time, the process peak RSS when it ended, rows scanned,
+objects produced and the build/formula cache hits and misses it caused.
+Spans nest per thread, so the stages run by a worker thread stay under
+the span that started it. Finished spans are written as JSONL (one
+record per span) and in Chrome trace-event format, which chrome://tracing
+and Perfetto open as a timeline.
+
+With profile_dir, every top-level span also runs under cProfile and its
+stats are dumped to <profile_dir>/<span>.pstats. cProfile only sees the
+thread that opened the span, so work handed to a thread pool shows up as
+time spent waiting on it.
+
+CPU time is the process's, so it includes any other thread running at
+the same time.
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+TRACE_FILE = "trace.jsonl"
+CHROME_TRACE_FILE = "trace.chrome.json"
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def cache_totals(cache):
+    """(hits, misses) so far of a BuildCache or FormulaCache"""
+    if cache is None:
+        return 0, 0
+    stats = cache.stats
+    if "hits" in stats:
+        return stats["hits"], stats["misses"]
+    return (sum(s["hits"] for s in stats.values()), sum(s["misses"] for s in stats.values()))
+
+
+class Span:
+    """An open span; count() and report() fill in what the stage produced"""
+
+    def __init__(self, name, parent, caches):
+        self.name = name
+        self.parent = parent
+        self.caches = caches
+        self.counters = {"rows": 0, "objects": 0}
+        self.attributes = {}
+        self.messages = []
+
+    def count(self, rows=0, objects=0):
+        self.counters["rows"] += rows
+        self.counters["objects"] += objects
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def report(self, message):
+        """Progress line printed when the span ends (verbose tracers only)"""
+        self.messages.append(message)
+
+
+class Tracer:
+    def __init__(self, verbose=False, profile_dir=None):
+        self.verbose = verbose
+        self.profile_dir = profile_dir
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._profiles = {}
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name, cache=None, formula_cache=None):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = Span(name, parent.name if parent else None, (cache, formula_cache))
+        stack.append(span)
+
+        profiler = None
+        if self.profile_dir and parent is None:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                #Another profiler is active (a concurrent stage): skip this one
+                profiler = None
+
+        cache_before = [cache_totals(c) for c in span.caches]
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            wall = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+            if profiler is not None:
+                profiler.disable()
+                self._dump_profile(name, profiler)
+            stack.pop()
+
+            cache_after = [cache_totals(c) for c in span.caches]
+            record = {
+                "name": name,
+                "parent": span.parent,
+                "thread": threading.get_ident(),
+                "start_seconds": started - self._origin,
+                "wall_seconds": wall,
+                "cpu_seconds": cpu,
+                "peak_rss_mb": peak_rss_mb(),
+                "rows": span.counters["rows"],
+                "objects": span.counters["objects"],
+                "cache_hits": sum(a[0] - b[0] for a, b in zip(cache_after, cache_before)),
+                "cache_misses": sum(a[1] - b[1] for a, b in zip(cache_after, cache_before)),
+                **span.attributes,
+            }
+            with self._lock:
+                self.spans.append(record)
+
+            if self.verbose:
+                for i, message in enumerate(span.messages):
+                    timing = f" ({wall:.2f}s)" if i == len(span.messages) - 1 else ""
+                    print(f"[{name}] {message}{timing}")
+
+    def _dump_profile(self, name, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        with self._lock:
+            n = self._profiles[name] = self._profiles.get(name, 0) + 1
+        suffix = "" if n == 1 else f".{n}"
+        profiler.dump_stats(os.path.join(self.profile_dir, f"{name}{suffix}.pstats"))
+
+    def summary(self):
+        """Wall seconds of each top-level span"""
+        totals = {}
+        for record in self.spans:
+            if record["parent"] is None:
+                totals[record["name"]] = totals.get(record["name"], 0) + record["wall_seconds"]
+        return totals
+
+    def write_jsonl(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for record in sorted(self.spans, key=lambda r: r["start_seconds"]):
+                f.write(json.dumps(record, default=str) + "\n")
+
+    def write_chrome_trace(self, path):
+        """Complete ("X") events in microseconds, one track per thread"""
+        pid = os.getpid()
+        events = [
+            {
+                "name": record["name"],
+                "cat": record["parent"] or "stage",
+                "ph": "X",
+                "ts": record["start_seconds"] * 1e6,
+                "dur": record["wall_seconds"] * 1e6,
+                "pid": pid,
+                "tid": record["thread"],
+                "args": {k: v for k, v in record.items()
+                         if k not in ("name", "parent", "thread", "start_seconds", "wall_seconds")},
+            }
+            for record in self.spans
+        ]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def write(self, trace_dir):
+        """Both trace formats into trace_dir"""
+        self.write_jsonl(os.path.join(trace_dir, TRACE_FILE))
+        self.write_chrome_trace(os.path.join(trace_dir, CHROME_TRACE_FILE))
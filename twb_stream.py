@@ -0,0 +1,66 @@
+from collections import defaultdict
+from lxml import etree
+
+
+class TwbHandler:
+    """
+    Receives the elements of a streamed TWB.
+
+    tags lists the element tags the handler is called for; None means
+    every element. path holds the tags of the open ancestors, innermost
+    last. Attributes are complete on start(); text and children are only
+    available on end(), and children are cleared once processed, so a
+    handler records what it needs from an element as the element arrives.
+    """
+    tags = None
+
+    def start(self, elem, path):
+        pass
+
+    def end(self, elem, path):
+        pass
+
+
+def stream_twb(source, handlers):
+    """
+    Walk a TWB (path or file object) once, dispatching elements to handlers.
+
+    Each element is cleared after its end handlers ran, and processed
+    siblings are dropped, so memory stays bounded by the nesting depth
+    rather than the size of the workbook.
+    """
+    by_tag = defaultdict(list)
+    every = []
+    for handler in handlers:
+        if handler.tags is None:
+            every.append(handler)
+        else:
+            for tag in handler.tags:
+                by_tag[tag].append(handler)
+
+    path = []
+    context = etree.iterparse(source, events=("start", "end"), remove_comments=True,
+                              remove_pis=True, huge_tree=True)
+    for event, elem in context:
+        tag = elem.tag
+        if event == "start":
+            for handler in every:
+                handler.start(elem, path)
+            for handler in by_tag.get(tag, ()):
+                handler.start(elem, path)
+            path.append(tag)
+            continue
+
+        path.pop()
+        for handler in every:
+            handler.end(elem, path)
+        for handler in by_tag.get(tag, ()):
+            handler.end(elem, path)
+
+        elem.clear(keep_tail=False)
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+
+    return handlers
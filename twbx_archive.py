@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+
+from build_cache import twb_fingerprint, hyper_fingerprint
+
+EXTRACT_STAMP = ".extracted.json"
+
+
+class WorkbookArchive:
+    """
+    Read access to a .twbx without extracting it up front.
+
+    The TWB is streamed straight from its zip member. Hyper files are only
+    written to disk when hyper_dir() is first called: into extract_dir when
+    one is given (skipped if it already holds the same extracts), otherwise
+    into a temporary directory that is removed on close().
+
+    Content hashes are computed on first use and kept: twb_hash is cheap,
+    hyper_hash reads every extract, so only Hyper steps that need a cache
+    key or extraction stamp ask for it.
+    """
+
+    def __init__(self, twbx_path, extract_dir=None):
+        self.twbx_path = twbx_path
+        self._zip = zipfile.ZipFile(twbx_path, 'r')
+        self._extract_dir = extract_dir
+        self._temp_dir = None
+        self._hyper_dir = None
+        self._hashes = {}
+        self._hash_lock = threading.Lock()
+
+        members = self._zip.namelist()
+        self.twb_member = next((m for m in members if m.lower().endswith(".twb")), None)
+        self.hyper_members = sorted(m for m in members if m.lower().endswith(".hyper"))
+
+    def _hash(self, part, compute):
+        with self._hash_lock:
+            if part not in self._hashes:
+                self._hashes[part] = compute(self.twbx_path)
+            return self._hashes[part]
+
+    @property
+    def twb_hash(self):
+        return self._hash("twb", twb_fingerprint)
+
+    @property
+    def hyper_hash(self):
+        return self._hash("hyper", hyper_fingerprint)
+
+    @property
+    def fingerprint(self):
+        return {"twb": self.twb_hash, "hyper": self.hyper_hash}
+
+    def open_twb(self):
+        if self.twb_member is None:
+            raise FileNotFoundError("No .twb file found inside TWBX")
+        return self._zip.open(self.twb_member)
+
+    def scratch_dir(self):
+        """Directory for derived files that live as long as the archive is open"""
+        if self._extract_dir is not None:
+            os.makedirs(self._extract_dir, exist_ok=True)
+            return self._extract_dir
+        if self._temp_dir is None:
+            self._temp_dir = tempfile.mkdtemp(prefix="twbx_")
+        return self._temp_dir
+
+    def hyper_dir(self):
+        """Extract the hyper files on first use and return their directory"""
+        if self._hyper_dir is not None:
+            return self._hyper_dir
+        if not self.hyper_members:
+            raise FileNotFoundError("No .hyper extract found inside TWBX")
+
+        target = self.scratch_dir()
+        if self._extract_dir is None:
+            #a fresh temporary directory: nothing to compare a stamp with
+            for member in self.hyper_members:
+                self._zip.extract(member, target)
+            self._hyper_dir = target
+            return target
+
+        stamp_path = os.path.join(target, EXTRACT_STAMP)
+        stamp = None
+        if os.path.exists(stamp_path):
+            with open(stamp_path, encoding="utf-8") as f:
+                stamp = json.load(f)
+
+        if stamp != self.hyper_hash:
+            for member in self.hyper_members:
+                self._zip.extract(member, target)
+            with open(stamp_path, "w", encoding="utf-8") as f:
+                json.dump(self.hyper_hash, f)
+
+        self._hyper_dir = target
+        return target
+
+    def hyper_paths(self):
+        target = self.hyper_dir()
+        return [os.path.join(target, member) for member in self.hyper_members]
+
+    def close(self):
+        self._zip.close()
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+            self._hyper_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,1055 @@
+"""
+Reference evaluator for converted measures.
+
+Every converted measure is executed twice over the exported extract,
+once with Tableau semantics and once with the semantics of the DAX it
+was rewritten to, at the grain of every worksheet that shows it (its
+discrete dimensions, from parsed_tableau_field_usage.json) plus the grand
+total. Where the two disagree the measure is reported with examples.
+
+This checks semantics, not the generated DAX text: the DAX run evaluates
+the Tableau AST with the behaviour of the DAX constructs the rewrite
+maps each node to, so a measure is reported as semantics_match or
+semantics_mismatch. A bug in how the rewrite prints that DAX is not
+caught here.
+
+The two semantics differ where the engines do: Tableau propagates NULL
+through arithmetic and comparisons, returns NULL on division by zero,
+truncates in INT and ignores NULL in COUNTD; DAX treats BLANK as 0 (or
+"") in +, -, comparisons and two-argument MIN/MAX, divides by zero to
+infinity, floors in INT, counts BLANK as a value in DISTINCTCOUNT,
+formats BLANK as "" and reads a BLANK date as 1899-12-30. Where Tableau
+returns NULL for an argument out of range (LN or LOG of x <= 0, SQRT of
+x < 0, a negative number to a fractional power, MOD or DIV by zero) DAX
+raises an error, which is tracked as its own state and fails the whole
+group, never read as BLANK. Functions the rewrite does not translate to
+DAX are reported instead of evaluated. Worksheet filters are not
+applied: the check is per grain, not per view.
+
+Evaluation is vectorised over pandas Series and chunked: each extract
+table is read once, CHUNK_ROWS rows at a time, and every aggregate of
+every measure at every grain is folded into partial aggregates (sum,
+count, min, max, distinct pairs) that are combined at the end, so memory
+is bounded by the number of groups rather than rows.
+"""
+import json
+import operator
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from tableau_formula import (
+    parse_formula, referenced_fields, walk, children, FormulaSyntaxError,
+    Literal, Field, Call, Unary, Binary, If, Case, Lod,
+)
+from rewrite_convertible_calculations import DATE_PARTS, DAX_FUNCTIONS, FUNCTION_ARITY
+from resolve_table_context import normalize_field_name, field_references
+from infer_relationships_from_hyper import arrow_to_frame
+from parsing_tableau import RAW_DATA_DIR
+
+DATA_DIR = Path("data")
+OUTPUT_FILE = DATA_DIR / "measure_verification.json"
+
+# Rows read per chunk of an extract table
+CHUNK_ROWS = 1_000_000
+# Partial aggregates of a grain are combined every this many chunks
+COMPACT_EVERY = 16
+# Numbers closer than this agree
+REL_TOLERANCE = 1e-9
+ABS_TOLERANCE = 1e-9
+# Mismatching groups listed per grain
+MAX_EXAMPLES = 5
+
+DAX_BLANK_DATE = pd.Timestamp("1899-12-30")
+
+AGGREGATES = {"SUM", "AVG", "MIN", "MAX", "COUNT", "COUNTD", "ATTR"}
+# Functions the rewrite translates besides those of DAX_FUNCTIONS
+DAX_REWRITTEN = {"ZN", "STR", "ROUND", "CEILING", "FLOOR", "MID", "DATEDIFF", "DATEPART"}
+# Grain derivations of worksheet column instances (yr:Order Date:ok)
+DATE_DERIVATIONS = {
+    "yr": lambda d: d.dt.year, "qr": lambda d: d.dt.quarter, "mn": lambda d: d.dt.month, "dy": lambda d: d.dt.day,
+    "tyr": lambda d: d.dt.to_period("Y").dt.start_time, "tqr": lambda d: d.dt.to_period("Q").dt.start_time,
+    "tmn": lambda d: d.dt.to_period("M").dt.start_time, "tdy": lambda d: d.dt.normalize(),
+}
+_INSTANCE = re.compile(r"\.\[(\w+):((?:[^\]]|\]\])+):([no]k)\]")
+
+
+class UnsupportedExpression(ValueError):
+    pass
+
+
+def is_aggregate(node):
+    return isinstance(node, Call) and node.name in AGGREGATES and len(node.args) == 1
+
+
+def varies_per_row(node):
+    """True if node reads a field outside any aggregate"""
+    if is_aggregate(node):
+        return False
+    return isinstance(node, Field) or any(varies_per_row(child) for child in children(node))
+
+
+# ========== VALUES ==========
+def _is_text(series):
+    return pd.api.types.is_string_dtype(series.dtype) or series.dtype == object
+
+
+def _is_date(series):
+    return pd.api.types.is_datetime64_any_dtype(series.dtype)
+
+
+def _literal_value(node):
+    if node.type == "number":
+        return float(node.value)
+    if node.type == "boolean":
+        return 1.0 if node.value else 0.0
+    if node.type == "date":
+        return pd.Timestamp(node.value)
+    if node.type == "null":
+        return np.nan
+    return node.value
+
+
+def _round_half_away(values, digits):
+    scale = np.power(10.0, digits)
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+def _fractional_power(base, exponent):
+    return (base < 0) & (exponent != np.trunc(exponent))
+
+
+def _any_error(index, *errors):
+    """Positions where any of errors (boolean Series or None) is set, or None"""
+    errors = [e for e in errors if e is not None]
+    if not errors:
+        return None
+    result = pd.Series(False, index=index)
+    for e in errors:
+        result = result | e.reindex(index, fill_value=False)
+    return result
+
+
+def _chosen_error(condition, then, otherwise):
+    """Errors of the branch a condition picks: the other branch is never evaluated"""
+    if then is None and otherwise is None:
+        return None
+    none = pd.Series(False, index=condition.index)
+    then = _any_error(condition.index, none, then)
+    otherwise = _any_error(condition.index, none, otherwise)
+    return then.where(condition, otherwise)
+
+
+def _general_number(value):
+    """Number as Tableau STR and DAX "General Number" print it"""
+    return str(int(value)) if float(value).is_integer() else f"{value:.15g}"
+
+
+def _datediff(unit, start, end):
+    if unit == "year":
+        return (end.dt.year - start.dt.year).astype(float)
+    if unit == "quarter":
+        return ((end.dt.year - start.dt.year) * 4 + end.dt.quarter - start.dt.quarter).astype(float)
+    if unit == "month":
+        return ((end.dt.year - start.dt.year) * 12 + end.dt.month - start.dt.month).astype(float)
+    units = {"day": "D", "hour": "h", "minute": "min", "second": "s"}
+    if unit in units:
+        return (end.dt.floor(units[unit]) - start.dt.floor(units[unit])) / pd.Timedelta(1, units[unit])
+    raise UnsupportedExpression(f"DATEDIFF unit {unit!r}")
+
+
+def _datepart(unit, dates):
+    parts = {"year": "year", "quarter": "quarter", "month": "month", "day": "day",
+             "hour": "hour", "minute": "minute", "second": "second", "dayofyear": "dayofyear"}
+    if unit in parts:
+        return getattr(dates.dt, parts[unit]).astype(float)
+    if unit == "weekday":
+        return ((dates.dt.dayofweek + 1) % 7 + 1).astype(float)
+    raise UnsupportedExpression(f"DATEPART unit {unit!r}")
+
+
+def _unit(node):
+    if not isinstance(node, Literal) or node.type != "string":
+        raise UnsupportedExpression("date unit is not a literal")
+    return node.value.lower()
+
+
+_COMPARE = {"=": operator.eq, "==": operator.eq, "!=": operator.ne, "<>": operator.ne,
+            "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+# ========== SEMANTICS ==========
+class TableauSemantics:
+    """NULL propagates; division by zero is NULL"""
+
+    name = "tableau"
+    # function -> (min args, max args)
+    FUNCTIONS = {
+        "ABS": (1, 1), "SQRT": (1, 1), "EXP": (1, 1), "LN": (1, 1), "LOG": (1, 2), "POWER": (2, 2),
+        "SIGN": (1, 1), "ROUND": (1, 2), "CEILING": (1, 1), "FLOOR": (1, 1), "INT": (1, 1), "DIV": (2, 2),
+        "MIN": (2, 2), "MAX": (2, 2), "ZN": (1, 1), "IFNULL": (2, 2), "ISNULL": (1, 1), "IIF": (3, 4),
+        "YEAR": (1, 1), "QUARTER": (1, 1), "MONTH": (1, 1), "DAY": (1, 1),
+        "DATEPART": (2, 3), "DATEDIFF": (3, 4),
+        "STR": (1, 1), "UPPER": (1, 1), "LOWER": (1, 1), "TRIM": (1, 1), "LTRIM": (1, 1), "RTRIM": (1, 1),
+        "LEN": (1, 1), "LEFT": (2, 2), "RIGHT": (2, 2), "MID": (2, 3),
+    }
+
+    def check(self, node):
+        """Raise UnsupportedExpression for anything this engine cannot run"""
+        for n in walk(node):
+            if isinstance(n, Lod):
+                raise UnsupportedExpression("LOD expression")
+            if isinstance(n, Call) and not is_aggregate(n):
+                arity = self.FUNCTIONS.get(n.name)
+                if arity is None:
+                    raise UnsupportedExpression(f"function {n.name}")
+                if not arity[0] <= len(n.args) <= arity[1]:
+                    raise UnsupportedExpression(f"{n.name} with {len(n.args)} argument(s)")
+                if n.name in ("LEFT", "RIGHT", "MID") and any(varies_per_row(arg) for arg in n.args[1:]):
+                    raise UnsupportedExpression(f"{n.name} with a position or length that varies per row")
+
+    # values
+    def blank(self, series):
+        return series
+
+    def date(self, series):
+        return series
+
+    def text(self, series):
+        return series
+
+    # operators
+    def arithmetic(self, op, a, b):
+        if _is_text(a) or _is_text(b):
+            if op != "+":
+                raise UnsupportedExpression(f"{op} on text")
+            a, b = self.text(a), self.text(b)
+            return (a.astype(str) + b.astype(str)).where(a.notna() & b.notna())
+        if _is_date(a) and _is_date(b) and op == "-":
+            return (a - b) / pd.Timedelta(days=1)
+        if _is_date(a) and op in ("+", "-"):
+            days = pd.to_timedelta(self.blank(b), unit="D")
+            return a + days if op == "+" else a - days
+        if op in ("+", "-"):
+            a, b = self.additive(a, b)
+            return a + b if op == "+" else a - b
+        if op == "*":
+            return a * b
+        if op == "/":
+            return self.divide(a, b)
+        if op == "%":
+            return a.mod(b.where(b != 0))
+        if op == "^":
+            return a.pow(b)
+        raise UnsupportedExpression(f"operator {op}")
+
+    def additive(self, a, b):
+        return a, b
+
+    def divide(self, a, b):
+        return a / b.where(b != 0)
+
+    def compare(self, op, a, b):
+        result = _COMPARE[op](a, b).astype(float)
+        return result.where(a.notna() & b.notna())
+
+    def logical(self, op, a, b):
+        a_true, b_true = a == 1, b == 1
+        a_false, b_false = a == 0, b == 0
+        if op == "AND":
+            result = pd.Series(np.nan, index=a.index).mask(a_true & b_true, 1.0).mask(a_false | b_false, 0.0)
+        else:
+            result = pd.Series(np.nan, index=a.index).mask(a_false & b_false, 0.0).mask(a_true | b_true, 1.0)
+        return result
+
+    def negate(self, a):
+        return 1.0 - a
+
+    # functions
+    def call(self, node, args):
+        name = node.name
+        if name in ("ABS", "SQRT", "EXP", "LN", "SIGN"):
+            function = {"ABS": np.abs, "SQRT": np.sqrt, "EXP": np.exp, "LN": np.log, "SIGN": np.sign}[name]
+            with np.errstate(all="ignore"):
+                result = function(args[0].astype(float))
+            return result.where(args[0] >= 0) if name in ("SQRT", "LN") else result
+        if name == "LOG":
+            base = args[1] if len(args) > 1 else 10.0
+            with np.errstate(all="ignore"):
+                return (np.log(args[0].where(args[0] > 0)) / np.log(base)).astype(float)
+        if name == "POWER":
+            return args[0].pow(args[1])
+        if name == "ROUND":
+            digits = args[1] if len(args) > 1 else 0.0
+            return _round_half_away(args[0], digits)
+        if name in ("CEILING", "FLOOR"):
+            return (np.ceil if name == "CEILING" else np.floor)(args[0])
+        if name == "INT":
+            return self.int(args[0])
+        if name == "DIV":
+            return np.trunc(self.divide(args[0], args[1]))
+        if name in ("MIN", "MAX"):
+            return self.extreme(name, args[0], args[1])
+        if name == "ZN":
+            return args[0].fillna(0.0)
+        if name == "IFNULL":
+            return args[0].where(args[0].notna(), args[1])
+        if name == "ISNULL":
+            return args[0].isna().astype(float)
+        if name == "IIF":
+            condition = self.truthy(args[0])
+            otherwise = args[3] if len(args) > 3 else args[2]
+            return args[1].where(condition, args[2].where(args[0].notna(), otherwise))
+        if name in ("YEAR", "QUARTER", "MONTH", "DAY"):
+            return getattr(self.date(args[0]).dt, name.lower()).astype(float)
+        if name == "DATEPART":
+            return _datepart(_unit(node.args[0]), self.date(args[1]))
+        if name == "DATEDIFF":
+            return _datediff(_unit(node.args[0]), self.date(args[1]), self.date(args[2]))
+        if name == "STR":
+            return self.str(args[0])
+        if name in ("UPPER", "LOWER", "TRIM", "LTRIM", "RTRIM", "LEN"):
+            text = self.text(args[0]).astype(str).str
+            method = {"UPPER": text.upper, "LOWER": text.lower, "TRIM": text.strip,
+                      "LTRIM": text.lstrip, "RTRIM": text.rstrip, "LEN": text.len}[name]
+            return method().where(args[0].notna())
+        if name in ("LEFT", "RIGHT", "MID"):
+            return self.substring(name, self.text(args[0]), args[1:])
+        raise UnsupportedExpression(f"function {name}")
+
+    def int(self, values):
+        return np.trunc(values)
+
+    def extreme(self, name, a, b):
+        return (np.fmin if name == "MIN" else np.fmax)(a, b).where(a.notna() & b.notna())
+
+    def str(self, values):
+        if _is_text(values):
+            return values
+        if _is_date(values):
+            return values.dt.strftime("%Y-%m-%d")
+        return values.map(_general_number, na_action="ignore")
+
+    def substring(self, name, text, args):
+        #slicing is only vectorised for a position or length shared by every row
+        if any(arg.nunique(dropna=False) > 1 for arg in args):
+            raise UnsupportedExpression(f"{name} with a position or length that varies per row")
+        if any(len(arg) and pd.isna(arg.iloc[0]) for arg in args):
+            return pd.Series(np.nan, index=text.index, dtype=object)
+        counts = [int(arg.iloc[0]) if len(arg) else 0 for arg in args]
+        strings = text.astype(str).str
+        if name == "LEFT":
+            result = strings[:counts[0]]
+        elif name == "RIGHT":
+            result = strings[-counts[0]:] if counts[0] else strings[:0]
+        else:
+            start = max(counts[0] - 1, 0)
+            result = strings[start:start + counts[1]] if len(counts) > 1 else strings[start:]
+        return result.where(text.notna())
+
+    def truthy(self, condition):
+        return condition == 1
+
+    # errors: boolean Series of the positions that raise one, None when none can
+    def errors(self, node, args):
+        return None
+
+    def arithmetic_errors(self, op, a, b):
+        return None
+
+    # aggregates
+    def countd_nulls(self):
+        return False
+
+    def attr(self, minimum, maximum, count, rows):
+        return minimum.where(minimum == maximum, "*").where(count > 0)
+
+
+class DaxSemantics(TableauSemantics):
+    """BLANK reads as 0 or "" in +, -, comparisons and MIN/MAX; x/0 is infinity"""
+
+    name = "dax"
+    # What the rewrite translates, with the arity it accepts
+    FUNCTIONS = {
+        **{name: FUNCTION_ARITY.get(name, arity) for name, arity in TableauSemantics.FUNCTIONS.items()
+           if name in DAX_FUNCTIONS or name in DAX_REWRITTEN},
+        "DATEPART": (2, 2), "DATEDIFF": (3, 3),
+    }
+
+    def check(self, node):
+        super().check(node)
+        for n in walk(node):
+            if isinstance(n, Call) and n.name == "DATEPART" and _unit(n.args[0]) not in DATE_PARTS:
+                raise UnsupportedExpression(f"DATEPART unit {_unit(n.args[0])!r} has no DAX function")
+
+    # numeric functions that read a BLANK argument as 0
+    BLANK_AS_ZERO = {"ABS", "SQRT", "EXP", "LN", "LOG", "POWER", "SIGN", "ROUND", "CEILING", "FLOOR", "INT"}
+
+    def call(self, node, args):
+        if node.name in self.BLANK_AS_ZERO:
+            args = [self.blank(arg) for arg in args]
+        return super().call(node, args)
+
+    def errors(self, node, args):
+        name = node.name
+        if name in self.BLANK_AS_ZERO:
+            args = [self.blank(arg) for arg in args]
+        if name in ("LN", "LOG"):
+            errors = args[0] <= 0
+            return errors | (args[1] <= 0) if len(args) > 1 else errors
+        if name == "SQRT":
+            return args[0] < 0
+        if name == "POWER":
+            return _fractional_power(args[0], args[1])
+        if name == "DIV":
+            return self.blank(args[1]) == 0
+        return None
+
+    def arithmetic_errors(self, op, a, b):
+        if _is_text(a) or _is_text(b) or _is_date(a) or _is_date(b):
+            return None
+        if op == "%":
+            return self.blank(b) == 0
+        if op == "^":
+            return _fractional_power(a, b)
+        return None
+
+    def blank(self, series):
+        if _is_text(series):
+            return series.fillna("")
+        if _is_date(series):
+            return series.fillna(DAX_BLANK_DATE)
+        return series.fillna(0.0)
+
+    def date(self, series):
+        return series.fillna(DAX_BLANK_DATE) if _is_date(series) else series
+
+    def text(self, series):
+        return series.fillna("")
+
+    def additive(self, a, b):
+        both_blank = a.isna() & b.isna()
+        return self.blank(a).where(~both_blank), self.blank(b)
+
+    def divide(self, a, b):
+        with np.errstate(all="ignore"):
+            return (a / self.blank(b)).where(a.notna())
+
+    def compare(self, op, a, b):
+        #a BLANK literal takes the type of the other side
+        if a.isna().all():
+            a = a.astype(b.dtype)
+        if b.isna().all():
+            b = b.astype(a.dtype)
+        a, b = self.blank(a), self.blank(b)
+        return _COMPARE[op](a, b).astype(float)
+
+    def logical(self, op, a, b):
+        a, b = self.blank(a) == 1, self.blank(b) == 1
+        return (a & b if op == "AND" else a | b).astype(float)
+
+    def negate(self, a):
+        return 1.0 - self.blank(a)
+
+    def int(self, values):
+        return np.floor(values)
+
+    def extreme(self, name, a, b):
+        return (np.fmin if name == "MIN" else np.fmax)(self.blank(a), self.blank(b)).where(a.notna() | b.notna(), 0.0)
+
+    def str(self, values):
+        #FORMAT(x, "General Number"): BLANK is "", dates print as serial numbers
+        if _is_date(values):
+            values = (values - DAX_BLANK_DATE) / pd.Timedelta(days=1)
+        return super().str(values).fillna("")
+
+    def countd_nulls(self):
+        return True
+
+    def attr(self, minimum, maximum, count, rows):
+        #SELECTEDVALUE: the value when exactly one (BLANK counts as a value), else BLANK
+        return minimum.where((minimum == maximum) & (count == rows))
+
+
+SEMANTICS = (TableauSemantics(), DaxSemantics())
+
+
+# ========== EVALUATION ==========
+def evaluate(node, env, semantics):
+    """
+    Vectorised value of an AST node over env (rows of a chunk or groups of
+    a grain), as (values, errors): errors is a boolean Series of the
+    positions where the expression raises an error, or None when none does.
+    Errored positions hold no value.
+    """
+    if isinstance(node, Literal):
+        return env.constant(_literal_value(node)), None
+    if isinstance(node, Field):
+        return env.field(node), None
+    if isinstance(node, Call):
+        if is_aggregate(node):
+            return env.aggregate(node, semantics)
+        evaluated = [evaluate(arg, env, semantics) for arg in node.args]
+        args = [values for values, _ in evaluated]
+        if node.name == "IIF":
+            condition = semantics.truthy(args[0])
+            otherwise = evaluated[3][1] if len(args) > 3 else evaluated[2][1]
+            branch = _chosen_error(condition, evaluated[1][1],
+                                   _chosen_error(args[0].notna(), evaluated[2][1], otherwise))
+            errors = _any_error(args[0].index, evaluated[0][1], branch)
+        else:
+            errors = _any_error(args[0].index if args else env.index,
+                                *(e for _, e in evaluated), semantics.errors(node, args))
+        return _without_errors(semantics.call(node, args), errors)
+    if isinstance(node, Unary):
+        operand, errors = evaluate(node.operand, env, semantics)
+        if node.op == "NOT":
+            return semantics.negate(operand), errors
+        return (-operand if node.op == "-" else operand), errors
+    if isinstance(node, Binary):
+        left, left_errors = evaluate(node.left, env, semantics)
+        right, right_errors = evaluate(node.right, env, semantics)
+        if node.op in ("AND", "OR"):
+            return semantics.logical(node.op, left, right), _any_error(left.index, left_errors, right_errors)
+        if node.op in _COMPARE:
+            return semantics.compare(node.op, left, right), _any_error(left.index, left_errors, right_errors)
+        errors = _any_error(left.index, left_errors, right_errors, semantics.arithmetic_errors(node.op, left, right))
+        return _without_errors(semantics.arithmetic(node.op, left, right), errors)
+    if isinstance(node, If):
+        result, errors = _otherwise(node.otherwise, env, semantics)
+        for condition, value in reversed(node.branches):
+            condition, condition_errors = evaluate(condition, env, semantics)
+            value, value_errors = evaluate(value, env, semantics)
+            condition = semantics.truthy(condition)
+            errors = _any_error(condition.index, condition_errors, _chosen_error(condition, value_errors, errors))
+            result = value.where(condition, result)
+        return result, errors
+    if isinstance(node, Case):
+        subject, errors = evaluate(node.subject, env, semantics)
+        result, otherwise_errors = _otherwise(node.otherwise, env, semantics)
+        for value, outcome in reversed(node.whens):
+            value, value_errors = evaluate(value, env, semantics)
+            outcome, outcome_errors = evaluate(outcome, env, semantics)
+            matches = semantics.truthy(semantics.compare("==", subject, value))
+            otherwise_errors = _any_error(subject.index, value_errors,
+                                          _chosen_error(matches, outcome_errors, otherwise_errors))
+            result = outcome.where(matches, result)
+        return result, _any_error(subject.index, errors, otherwise_errors)
+    raise UnsupportedExpression(f"{type(node).__name__} node")
+
+
+def _otherwise(node, env, semantics):
+    return evaluate(node, env, semantics) if node is not None else (env.constant(np.nan), None)
+
+
+def _without_errors(values, errors):
+    if errors is None or not isinstance(values, pd.Series):
+        return values, errors
+    return values.where(~errors), errors
+
+
+class RowEnv:
+    """Row-level context: fields are columns of one chunk"""
+
+    def __init__(self, frame, columns):
+        self.frame = frame
+        self.columns = columns
+        self.index = frame.index
+
+    def constant(self, value):
+        return pd.Series(value, index=self.index)
+
+    def field(self, node):
+        series = self.frame[self.columns[normalize_field_name(node.name)]]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series.astype(series.cat.categories.dtype)
+        if pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_integer_dtype(series.dtype):
+            return series.astype("float64")
+        return series
+
+    def aggregate(self, node, semantics):
+        raise UnsupportedExpression(f"{node.name} nested in an aggregate")
+
+
+class GroupEnv:
+    """Aggregate context: aggregates are the combined results of one grain"""
+
+    def __init__(self, index, values, errors, slot_of):
+        self.index = index
+        self.values = values
+        self.errors = errors
+        self.slot_of = slot_of
+
+    def constant(self, value):
+        return pd.Series(value, index=self.index)
+
+    def field(self, node):
+        raise UnsupportedExpression(f"[{node.name}] outside an aggregate")
+
+    def aggregate(self, node, semantics):
+        key = self.slot_of(node, semantics)
+        return self.values[key], self.errors.get(key)
+
+
+# ========== PLANNING ==========
+class Dimension(NamedTuple):
+    field: str  # normalized field name
+    derivation: str  # "none", "yr", "tmn", ...
+
+
+def worksheet_dimensions(references):
+    """Discrete column instances ([ds].[yr:Order Date:ok]) of a worksheet's references"""
+    dimensions = set()
+    for reference in references:
+        for derivation, field, _ in _INSTANCE.findall(reference):
+            dimensions.add(Dimension(normalize_field_name(field.replace("]]", "]")), derivation))
+    return dimensions
+
+
+class MeasurePlan:
+    """One converted measure: its inlined AST, extract table, columns and grains"""
+
+    def __init__(self, name, dax, ast, table, columns):
+        self.name = name
+        self.dax = dax
+        self.ast = ast
+        self.table = table
+        self.columns = columns  # normalized field -> physical column
+        self.grains = {(): ["(total)"]}  # dimensions -> worksheets
+        self.skipped_grains = []
+        self.unsupported = {}  # semantics name -> reason
+
+
+class Planner:
+    """Resolves measure formulas against the calculations and the logical-physical mapping"""
+
+    def __init__(self, calculations, mappings):
+        self.formulas = {}
+        for calc in calculations:
+            self.formulas.setdefault(normalize_field_name(calc["calculation_name"]), calc.get("formula") or "")
+        self.tables = defaultdict(dict)  # normalized field -> {table: column}
+        for mapping in mappings:
+            field = normalize_field_name(mapping["logical_field"])
+            self.tables[field].setdefault(mapping["table"], mapping["physical_column"])
+        self._inlined = {}
+
+    def inline(self, node, stack=()):
+        """AST with every referenced calculation replaced by its formula"""
+        if isinstance(node, Field):
+            key = normalize_field_name(node.name)
+            if node.datasource == "Parameters":
+                raise UnsupportedExpression("parameter reference")
+            if key in self.formulas and key not in self.tables:
+                if key in stack:
+                    raise UnsupportedExpression("circular reference")
+                if key not in self._inlined:
+                    try:
+                        self._inlined[key] = self.inline(parse_formula(self.formulas[key]), stack + (key,))
+                    except FormulaSyntaxError as exc:
+                        raise UnsupportedExpression(f"[{node.name}]: {exc}")
+                return self._inlined[key]
+            return node
+        if isinstance(node, Literal):
+            return node
+        if isinstance(node, Call):
+            return Call(node.name, tuple(self.inline(arg, stack) for arg in node.args))
+        if isinstance(node, Unary):
+            return Unary(node.op, self.inline(node.operand, stack))
+        if isinstance(node, Binary):
+            return Binary(node.op, self.inline(node.left, stack), self.inline(node.right, stack))
+        if isinstance(node, If):
+            return If(tuple((self.inline(c, stack), self.inline(r, stack)) for c, r in node.branches),
+                      self.inline(node.otherwise, stack) if node.otherwise is not None else None)
+        if isinstance(node, Case):
+            return Case(self.inline(node.subject, stack),
+                        tuple((self.inline(v, stack), self.inline(r, stack)) for v, r in node.whens),
+                        self.inline(node.otherwise, stack) if node.otherwise is not None else None)
+        raise UnsupportedExpression(f"{type(node).__name__} node")
+
+    def table_for(self, fields, table=None):
+        """(table, {field: column}) holding every field, or raise"""
+        candidates = None
+        for field in fields:
+            tables = set(self.tables.get(field, {}))
+            if not tables:
+                raise UnsupportedExpression(f"[{field}] has no physical column")
+            candidates = tables if candidates is None else candidates & tables
+        if table is not None:
+            candidates = {table} & candidates if candidates is not None else {table}
+        if not candidates:
+            raise UnsupportedExpression("fields span several tables")
+        table = table if table in candidates else sorted(candidates)[0]
+        return table, {field: self.tables[field][table] for field in fields}
+
+    def dimension(self, dimension):
+        """Row-level AST of a grain dimension"""
+        if dimension.derivation != "none" and dimension.derivation not in DATE_DERIVATIONS:
+            raise UnsupportedExpression(f"derivation {dimension.derivation!r}")
+        node = self.inline(Field(dimension.field))
+        if any(is_aggregate(n) for n in walk(node)):
+            raise UnsupportedExpression(f"[{dimension.field}] is an aggregate")
+        return node
+
+    def plan(self, name, dax, worksheets):
+        """MeasurePlan of a converted measure; worksheets maps worksheet -> dimensions"""
+        ast = self.inline(parse_formula(self.formulas.get(normalize_field_name(name), "")))
+        for semantics in SEMANTICS:
+            semantics.check(ast)
+        fields = [normalize_field_name(f.name) for f in referenced_fields(ast)]
+        if not fields:
+            raise UnsupportedExpression("no field reference")
+        table, columns = self.table_for(fields)
+        plan = MeasurePlan(name, dax, ast, table, columns)
+
+        for worksheet, dimensions in worksheets.items():
+            grain = []
+            try:
+                for dimension in sorted(dimensions):
+                    node = self.dimension(dimension)
+                    dim_fields = [normalize_field_name(f.name) for f in referenced_fields(node)]
+                    _, dim_columns = self.table_for(dim_fields, table)
+                    columns.update(dim_columns)
+                    grain.append(dimension)
+            except UnsupportedExpression as exc:
+                plan.skipped_grains.append({"worksheet": worksheet, "reason": str(exc)})
+                continue
+            plan.grains.setdefault(tuple(grain), []).append(worksheet)
+
+        return plan
+
+
+# ========== EXECUTION ==========
+def iter_chunks(path, columns, chunk_rows=CHUNK_ROWS):
+    """DataFrames of chunk_rows rows holding the given columns of one exported table"""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        parquet = pq.ParquetFile(path, memory_map=True)
+        names = [c for c in columns if c in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=names):
+            yield arrow_to_frame(pa.Table.from_batches([batch]))
+    elif path.suffix == ".arrow":
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            names = [c for c in columns if c in reader.schema.names]
+            for i in range(reader.num_record_batches):
+                yield arrow_to_frame(pa.Table.from_batches([reader.get_batch(i)]).select(names))
+    else:
+        yield from pd.read_csv(path, usecols=list(columns), chunksize=chunk_rows)
+
+
+def _slot_key(node, semantics):
+    """Aggregates whose value does not depend on the semantics share one slot"""
+    if isinstance(node.args[0], Field) and node.name not in ("COUNTD", "ATTR"):
+        return node, None
+    return node, semantics.name
+
+
+class TableRun:
+    """Every aggregate of every measure of one table, at every grain, in one pass"""
+
+    def __init__(self, table, plans, planner):
+        self.table = table
+        self.plans = plans
+        self.columns = {}
+        self.dimensions = {}
+        self.slots = {}  # slot key -> (aggregate node, semantics)
+        self.grain_slots = defaultdict(set)
+
+        for plan in plans:
+            self.columns.update(plan.columns)
+            for grain in plan.grains:
+                for dimension in grain:
+                    self.dimensions[dimension] = planner.dimension(dimension)
+                for semantics in SEMANTICS:
+                    if semantics.name in plan.unsupported:
+                        continue
+                    for node in walk(plan.ast):
+                        if is_aggregate(node):
+                            key = _slot_key(node, semantics)
+                            self.slots[key] = (node, semantics)
+                            self.grain_slots[grain].add(key)
+
+        self.slot_ids = {key: f"v{i}" for i, key in enumerate(self.slots)}
+        self.partials = defaultdict(list)
+        self.distinct = defaultdict(list)
+        self.rows = 0
+
+    def _dimension_values(self, env):
+        values = {}
+        for dimension, node in self.dimensions.items():
+            if isinstance(node, Field) and dimension.derivation == "none":
+                values[dimension] = env.frame[self.columns[normalize_field_name(node.name)]]
+                continue
+            series, _ = evaluate(node, env, SEMANTICS[0])
+            if dimension.derivation != "none":
+                series = DATE_DERIVATIONS[dimension.derivation](series)
+            values[dimension] = series
+        return values
+
+    def feed(self, frame):
+        env = RowEnv(frame, self.columns)
+        dimensions = self._dimension_values(env)
+        arguments = {}
+        values = {}
+        for key, (node, semantics) in self.slots.items():
+            arg_key = (node.args[0], None if key[1] is None else semantics.name)
+            if arg_key not in arguments:
+                arguments[arg_key] = evaluate(node.args[0], env, semantics)
+            values[key] = arguments[arg_key]
+
+        for grain, slot_keys in self.grain_slots.items():
+            keys = {f"k{i}": dimensions[d] for i, d in enumerate(grain)} or {"k0": env.constant(0)}
+            aggregations = {}
+            data = dict(keys)
+            for key in slot_keys:
+                node, semantics = self.slots[key]
+                slot = self.slot_ids[key]
+                slot_values, slot_errors = values[key]
+                if slot_errors is not None:
+                    #one erroring row fails the aggregate of its group
+                    data[f"{slot}e"] = slot_errors.astype(int)
+                    aggregations[f"{slot}_errors"] = (f"{slot}e", "sum")
+                if node.name == "COUNTD":
+                    pairs = pd.DataFrame({**keys, "value": values[key][0]}).drop_duplicates()
+                    self.distinct[(grain, key)].append(pairs)
+                    continue
+                data[slot] = slot_values
+                if node.name in ("SUM", "AVG"):
+                    aggregations[f"{slot}_sum"] = (slot, "sum")
+                if node.name in ("SUM", "AVG", "COUNT", "ATTR"):
+                    aggregations[f"{slot}_count"] = (slot, "count")
+                if node.name in ("MIN", "ATTR"):
+                    aggregations[f"{slot}_min"] = (slot, "min")
+                if node.name in ("MAX", "ATTR"):
+                    aggregations[f"{slot}_max"] = (slot, "max")
+                if node.name == "ATTR":
+                    aggregations[f"{slot}_rows"] = (slot, "size")
+            if not aggregations:
+                aggregations["_rows"] = ("k0", "size")
+            grouped = pd.DataFrame(data).groupby(list(keys), observed=True, dropna=False, sort=False)
+            self.partials[grain].append(grouped.agg(**aggregations))
+            if len(self.partials[grain]) >= COMPACT_EVERY:
+                self.partials[grain] = [self._combine(grain)]
+            for key in slot_keys:
+                if len(self.distinct[(grain, key)]) >= COMPACT_EVERY:
+                    self.distinct[(grain, key)] = [pd.concat(self.distinct[(grain, key)]).drop_duplicates()]
+        self.rows += len(frame)
+
+    def _combine(self, grain):
+        partial = pd.concat(self.partials[grain])
+        functions = {
+            column: "min" if column.endswith("_min") else "max" if column.endswith("_max") else "sum"
+            for column in partial.columns
+        }
+        grouped = partial.groupby(level=list(range(partial.index.nlevels)), observed=True, dropna=False, sort=False)
+        combined = grouped.agg(functions)
+        #a sum over nothing but nulls stays null
+        for column in combined.columns:
+            if column.endswith("_sum"):
+                combined[column] = combined[column].where(combined[column[:-4] + "_count"] > 0)
+        return combined
+
+    def results(self, grain):
+        """(group index, {slot key: Series}, {slot key: erroring groups}) of one grain"""
+        combined = self._combine(grain)
+        index = combined.index
+        values = {}
+        errors = {}
+        for key in self.grain_slots[grain]:
+            node, semantics = self.slots[key]
+            slot = self.slot_ids[key]
+            if f"{slot}_errors" in combined.columns:
+                errors[key] = combined[f"{slot}_errors"].fillna(0) > 0
+            if node.name == "SUM":
+                values[key] = combined[f"{slot}_sum"]
+            elif node.name == "AVG":
+                values[key] = combined[f"{slot}_sum"] / combined[f"{slot}_count"].where(combined[f"{slot}_count"] > 0)
+            elif node.name == "COUNT":
+                values[key] = combined[f"{slot}_count"].astype(float)
+            elif node.name in ("MIN", "MAX"):
+                values[key] = combined[f"{slot}_{node.name.lower()}"]
+            elif node.name == "ATTR":
+                values[key] = semantics.attr(combined[f"{slot}_min"], combined[f"{slot}_max"],
+                                             combined[f"{slot}_count"], combined[f"{slot}_rows"])
+            else:
+                pairs = pd.concat(self.distinct[(grain, key)]).drop_duplicates()
+                keys = [c for c in pairs.columns if c != "value"]
+                counts = pairs.groupby(keys, observed=True, dropna=False, sort=False)["value"].nunique(
+                    dropna=not semantics.countd_nulls()
+                )
+                values[key] = counts.reindex(index).astype(float)
+        return index, values, errors
+
+
+def _json_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value if isinstance(value, (int, float, str, bool)) else str(value)
+
+
+def compare_results(tableau, dax):
+    """Boolean Series: groups where the two results disagree"""
+    both_null = tableau.isna() & dax.isna()
+    if pd.api.types.is_numeric_dtype(tableau.dtype) and pd.api.types.is_numeric_dtype(dax.dtype):
+        equal = pd.Series(
+            np.isclose(tableau.to_numpy(float), dax.to_numpy(float), rtol=REL_TOLERANCE, atol=ABS_TOLERANCE),
+            index=tableau.index
+        )
+    else:
+        equal = tableau.astype(object) == dax.astype(object)
+    return ~(both_null | equal)
+
+
+def verify_grain(plan, grain, index, values, errors):
+    """Grain entry of a measure report: groups, mismatches, errors and examples"""
+    results = {}
+    result_errors = {}
+    for semantics in SEMANTICS:
+        if semantics.name in plan.unsupported:
+            continue
+        env = GroupEnv(index, values, errors, _slot_key)
+        try:
+            result, failed = evaluate(plan.ast, env, semantics)
+        except UnsupportedExpression as exc:
+            plan.unsupported[semantics.name] = str(exc)
+            continue
+        results[semantics.name] = result if isinstance(result, pd.Series) else env.constant(result)
+        result_errors[semantics.name] = _any_error(index, failed)
+
+    entry = {"worksheets": plan.grains[grain], "dimensions": [f"{d.derivation}:{d.field}" for d in grain],
+             "groups": len(index)}
+    if len(results) < 2:
+        return entry
+
+    #Tableau never raises, so a DAX error always differs from it
+    dax_errors = result_errors["dax"] if result_errors["dax"] is not None else pd.Series(False, index=index)
+    mismatched = compare_results(results["tableau"], results["dax"]) | dax_errors
+    entry["mismatches"] = int(mismatched.sum())
+    entry["dax_errors"] = int(dax_errors.sum())
+    examples = []
+    for position in np.flatnonzero(mismatched.to_numpy())[:MAX_EXAMPLES]:
+        key = index[position] if grain else ()
+        key = key if isinstance(key, tuple) else (key,)
+        examples.append({
+            "group": {f"{d.derivation}:{d.field}": _json_value(v) for d, v in zip(grain, key)},
+            "tableau": _json_value(results["tableau"].iloc[position]),
+            "dax": "error" if dax_errors.iloc[position] else _json_value(results["dax"].iloc[position]),
+        })
+    if examples:
+        entry["examples"] = examples
+    return entry
+
+
+def find_table_file(raw_data_dir, table):
+    for suffix in (".parquet", ".arrow", ".csv"):
+        path = Path(raw_data_dir) / f"{table}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def verify_measures(conversion, calculations, field_usage, mappings, raw_data_dir,
+                    chunk_rows=CHUNK_ROWS, verbose=True):
+    """
+    Evaluate every converted measure with Tableau and DAX semantics and
+    compare them per worksheet grain.
+
+    conversion is the rewrite_calculations() output, calculations the
+    classification list (every calculation's formula, for inlining),
+    field_usage the parsed worksheet references and mappings the
+    logical-physical mapping. raw_data_dir holds one exported file per
+    extract table. Returns the report written to measure_verification.json.
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    planner = Planner(calculations, mappings)
+    worksheet_dims = {ws["worksheet"]: worksheet_dimensions(ws.get("used_fields_or_calculations", []))
+                      for ws in field_usage}
+
+    report = {}
+    by_table = defaultdict(list)
+    for name, dax in conversion["converted_measures"].items():
+        key = normalize_field_name(name)
+        worksheets = {
+            ws["worksheet"]: {d for d in worksheet_dims[ws["worksheet"]] if d.field != key}
+            for ws in field_usage
+            if any(key in field_references(ref) for ref in ws.get("used_fields_or_calculations", []))
+        }
+        try:
+            plan = planner.plan(name, dax, worksheets)
+        except (UnsupportedExpression, FormulaSyntaxError) as exc:
+            report[name] = {"status": "not_evaluated", "reason": str(exc)}
+            continue
+        if find_table_file(raw_data_dir, plan.table) is None:
+            report[name] = {"status": "not_evaluated", "reason": f"no exported data for {plan.table}"}
+            continue
+        by_table[plan.table].append(plan)
+
+    rows = 0
+    for table, plans in by_table.items():
+        run = TableRun(table, plans, planner)
+        for chunk in iter_chunks(find_table_file(raw_data_dir, table), sorted(set(run.columns.values())), chunk_rows):
+            run.feed(chunk)
+        rows += run.rows
+        log(f"{table}: {len(plans)} measure(s), {len(run.grain_slots)} grain(s), {run.rows} rows")
+
+        grain_results = {grain: run.results(grain) for grain in run.grain_slots}
+        for plan in plans:
+            grains = [verify_grain(plan, grain, *grain_results[grain]) for grain in plan.grains]
+            if plan.unsupported:
+                status = "not_evaluated"
+            elif any(g.get("mismatches") for g in grains):
+                status = "semantics_mismatch"
+            else:
+                status = "semantics_match"
+            report[plan.name] = {
+                "status": status,
+                "table": table,
+                "dax": plan.dax,
+                "grains": grains,
+            }
+            if plan.unsupported:
+                report[plan.name]["reason"] = "; ".join(f"{k}: {v}" for k, v in plan.unsupported.items())
+            if plan.skipped_grains:
+                report[plan.name]["skipped_grains"] = plan.skipped_grains
+
+    statuses = {"semantics_match": 0, "semantics_mismatch": 0, "not_evaluated": 0}
+    for result in report.values():
+        statuses[result["status"]] += 1
+    summary = {"measures": len(report), "rows_scanned": rows, **statuses}
+    log(f"Measure semantics verified: {statuses['semantics_match']} match, "
+        f"{statuses['semantics_mismatch']} mismatch, {statuses['not_evaluated']} not evaluated")
+
+    return {"summary": summary, "measures": report}
+
+
+def main():
+    def load(name):
+        with open(DATA_DIR / name, encoding="utf-8") as f:
+            return json.load(f)
+
+    output = verify_measures(
+        load("converted_dax_measures.json"),
+        load("calculation_classification.json"),
+        load("parsed_tableau_field_usage.json"),
+        load("logical_physical_mapping.json"),
+        DATA_DIR / RAW_DATA_DIR,
+    )
+
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=4)
+
+    print(f"\nMeasure verification written to {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()